@@ -0,0 +1,96 @@
+"""
+Delivery of admin alerts. Alerts are collected for a short while and sent
+as a single digest message, identical alerts are merged, and digests are
+rate limited so that a burst of errors during an outage produces a few
+messages instead of one login and message per error.
+"""
+from __future__ import unicode_literals, print_function
+import time
+import threading
+from collections import OrderedDict
+
+# Reddit rejects messages longer than this.
+MAX_MESSAGE_LENGTH = 10000
+
+
+class AlertDispatcher(object):
+
+    """Collects alerts and sends them in digests.
+
+    Keyword arguments:
+    send -- function of a reddit session (or None if no session has been
+        attached), a subject and a body that sends a digest
+    delay -- seconds to wait for more alerts after the first one
+    min_interval -- the minimum number of seconds between two digests
+    on_error -- optional function called with the exception if a digest
+        can't be sent
+    """
+
+    def __init__(self, send, delay=10, min_interval=300, on_error=None,
+                 clock=time.time):
+        self.send = send
+        self.delay = delay
+        self.min_interval = min_interval
+        self.on_error = on_error
+        self.clock = clock
+        self.session = None
+        self.last_sent = None
+        self._pending = OrderedDict()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def attach(self, session):
+        """Use an existing authenticated reddit session to send digests."""
+        self.session = session
+
+    def alert(self, message):
+        """Queue an alert to be sent with the next digest."""
+        with self._lock:
+            if message in self._pending:
+                self._pending[message][1] += 1
+            else:
+                self._pending[message] = [self.clock(), 1]
+            if self._timer is None:
+                now = self.clock()
+                send_at = now + self.delay
+                if self.last_sent is not None:
+                    send_at = max(send_at, self.last_sent + self.min_interval)
+                self._timer = threading.Timer(send_at - now, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Send all pending alerts right away."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, OrderedDict()
+            if not pending:
+                return
+            self.last_sent = self.clock()
+        subject, body = self.digest(pending)
+        try:
+            self.send(self.session, subject, body)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(e)
+
+    def digest(self, pending):
+        """Return the subject and body of a digest of pending alerts."""
+        if len(pending) == 1 and list(pending.values())[0][1] == 1:
+            subject = "CompileBot Alert"
+        else:
+            subject = "CompileBot Alerts ({})".format(
+                sum(count for first, count in pending.values()))
+        sections = []
+        for message, (first, count) in pending.items():
+            t = time.strftime('%y-%m-%d %H:%M:%S', time.localtime(first))
+            if count > 1:
+                sections.append("{}: (x{}) {}".format(t, count, message))
+            else:
+                sections.append("{}: {}".format(t, message))
+        body = '\n\n---\n\n'.join(sections)
+        if len(body) > MAX_MESSAGE_LENGTH:
+            body = body[:MAX_MESSAGE_LENGTH - 5] + '\n...'
+        return subject, body
@@ -0,0 +1,111 @@
+"""
+A cache of the users banned from the moderation subreddit. Fetching the
+full banned list is slow for a long list, so the cache only fetches it
+now and then and applies bans and unbans from the moderation log in
+between. The cache can be saved to a snapshot file so that a restarted
+bot doesn't need to fetch the list before processing its first mention.
+"""
+from __future__ import unicode_literals, print_function
+import os
+import json
+import time
+
+# Modlog entries this many seconds older than a full fetch are applied
+# again, in case the clocks of reddit and the bot differ. Applying a ban
+# or an unban twice has no effect.
+CLOCK_MARGIN = 60
+
+
+class BannedUsers(object):
+
+    """Keeps a set of lowercase names of banned users up to date.
+
+    Keyword arguments:
+    fetch_all -- function of a reddit session that returns the full set
+        of banned names, or None on failure
+    fetch_changes -- optional function of a reddit session and a UTC
+        timestamp that returns a chronological list of (timestamp, action,
+        name) tuples for "banuser" and "unbanuser" actions after the
+        timestamp, or None if they can't all be retrieved
+    refresh_interval -- seconds between updates
+    full_refresh_interval -- seconds between fetches of the full list
+    snapshot_file -- optional JSON file the cache is saved to
+    """
+
+    def __init__(self, fetch_all, fetch_changes=None, refresh_interval=300,
+                 full_refresh_interval=86400, snapshot_file=None,
+                 clock=time.time):
+        self.fetch_all = fetch_all
+        self.fetch_changes = fetch_changes
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.snapshot_file = snapshot_file
+        self.clock = clock
+        self.users = None
+        self.updated = 0
+        self.full_update = 0
+        self.last_change = 0
+
+    def load(self):
+        """Restore the cache from the snapshot file if there is one and
+        return the banned users, or None if no snapshot was loaded.
+        """
+        if not self.snapshot_file or not os.path.exists(self.snapshot_file):
+            return None
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+        except ValueError:
+            # A corrupt snapshot is ignored and replaced on the next save.
+            return None
+        self.users = set(snapshot['users'])
+        self.updated = snapshot['updated']
+        self.full_update = snapshot['full_update']
+        self.last_change = snapshot['last_change']
+        return self.users
+
+    def save(self):
+        """Write the cache to the snapshot file."""
+        if not self.snapshot_file or self.users is None:
+            return
+        snapshot = {
+            'users': sorted(self.users),
+            'updated': self.updated,
+            'full_update': self.full_update,
+            'last_change': self.last_change,
+        }
+        tmp_file = self.snapshot_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(snapshot, f)
+        os.rename(tmp_file, self.snapshot_file)
+
+    def refresh(self, reddit, force=False):
+        """Update the cache if it is due and return the set of banned users.
+        A new set is created on every change, so a set returned earlier
+        is never modified.
+        """
+        now = self.clock()
+        if not force and now - self.updated < self.refresh_interval:
+            return self.users
+        self.updated = now
+        if (self.fetch_changes and self.users is not None and
+                now - self.full_update < self.full_refresh_interval):
+            changes = self.fetch_changes(reddit, self.last_change)
+            if changes is not None:
+                users = set(self.users)
+                for timestamp, action, name in changes:
+                    if action == 'banuser':
+                        users.add(name.lower())
+                    elif action == 'unbanuser':
+                        users.discard(name.lower())
+                    self.last_change = max(self.last_change, timestamp)
+                self.users = users
+                self.save()
+                return self.users
+        users = self.fetch_all(reddit)
+        if users is not None:
+            self.users = set(users)
+            self.full_update = now
+            self.last_change = now - CLOCK_MARGIN
+            self.save()
+        return self.users
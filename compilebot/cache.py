@@ -0,0 +1,99 @@
+"""
+A cache of ideone submission results keyed on the language, source code
+and input of a submission. Identical requests are common in popular
+threads, and serving them from the cache avoids a new ideone submission.
+
+Results are kept in a size and age bounded in-memory LRU cache, backed by
+an optional SQLite file so that the cache survives restarts.
+"""
+from __future__ import unicode_literals, print_function
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResultCache(object):
+
+    """Stores submission details dicts by key.
+
+    Keyword arguments:
+    size -- the maximum number of results kept in memory
+    ttl -- seconds a result stays valid for
+    path -- optional SQLite database file used as a persistent tier
+    file_size -- the maximum number of results kept in the database
+    """
+
+    def __init__(self, size=500, ttl=86400, path=None, file_size=20000,
+                 clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self.file_size = file_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results ("
+                             "key TEXT PRIMARY KEY, details TEXT, "
+                             "stored REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_stored "
+                             "ON results (stored)")
+            self._db.commit()
+
+    @staticmethod
+    def key(lang, source, stdin=''):
+        """Return the cache key of a submission. The language should
+        already be normalized.
+        """
+        data = json.dumps([lang, source, stdin])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return a copy of the cached details for a key, or None."""
+        now = self.clock()
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT details, stored FROM results WHERE key = ?",
+                    (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+            if entry is None or now - entry[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._memory[key] = entry
+            self._evict()
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, key, details):
+        """Store a copy of a submission's details."""
+        entry = (dict(details), self.clock())
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = entry
+            self._evict()
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results "
+                                 "VALUES (?, ?, ?)",
+                                 (key, json.dumps(details), entry[1]))
+                # Remove expired results and the oldest results beyond
+                # the size limit of the database.
+                self._db.execute("DELETE FROM results WHERE stored < ?",
+                                 (entry[1] - self.ttl,))
+                self._db.execute("DELETE FROM results WHERE key NOT IN ("
+                                 "SELECT key FROM results ORDER BY stored "
+                                 "DESC LIMIT ?)", (self.file_size,))
+                self._db.commit()
+
+    def _evict(self):
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
@@ -0,0 +1,96 @@
+"""
+A thread safe pool of long-lived API clients. Creating an ideone client
+logs in and sets up a new connection, so clients are created once and
+shared by every compile instead of being rebuilt for each submission.
+"""
+from __future__ import unicode_literals, print_function
+import threading
+from contextlib import contextmanager
+
+
+class ClientPool(object):
+
+    """Hands out clients created by a factory function. At most size
+    clients exist at once and each one is used by a single thread at a
+    time. A client is thrown away and lazily rebuilt when an exception
+    escapes while it is checked out, since that usually means its session
+    expired or its connection broke. Exceptions listed in preserve are
+    ordinary API errors and leave the client in the pool. preserve can
+    also be a function returning the exception types, so that they can
+    come from a module that isn't imported yet.
+
+    Usage:
+        pool = ClientPool(lambda: ideone.Ideone(user, password), size=4)
+        with pool.client() as i:
+            i.create_submission(...)
+    """
+
+    def __init__(self, factory, size=1, preserve=()):
+        self.factory = factory
+        self.size = max(1, size)
+        self.preserve = preserve if callable(preserve) else tuple(preserve)
+        self.created = 0
+        self.discarded = 0
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    @contextmanager
+    def client(self):
+        """Check out a client for the duration of a with block."""
+        client = self._checkout()
+        try:
+            yield client
+        except self.preserved():
+            self._checkin(client)
+            raise
+        except:
+            self._discard(client)
+            raise
+        else:
+            self._checkin(client)
+
+    def preserved(self):
+        """Return the exception types that leave a client in the pool."""
+        if callable(self.preserve):
+            return tuple(self.preserve())
+        return self.preserve
+
+    def clear(self):
+        """Drop every idle client so that new ones are created on demand."""
+        with self._cond:
+            self.discarded += len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._in_use >= self.size:
+                self._cond.wait()
+            self._in_use += 1
+            if self._idle:
+                return self._idle.pop()
+        # Build the client outside of the lock so a slow login doesn't
+        # hold up threads returning clients to the pool.
+        try:
+            client = self.factory()
+        except:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return client
+
+    def _checkin(self, client):
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(client)
+            self._cond.notify()
+
+    def _discard(self, client):
+        with self._cond:
+            self._in_use -= 1
+            self.discarded += 1
+            self._cond.notify()
@@ -0,0 +1,158 @@
+"""
+A single pass, line oriented parser for comments that mention the bot.
+
+The parser finds the same mention, arguments, source code block and
+optional input block that the original parse_comment regular expression
+did, but it never backtracks, so the time taken grows linearly with the
+length of the comment.
+"""
+from __future__ import unicode_literals, print_function
+import re
+
+# Characters matched by \s in the original regular expression.
+WHITESPACE = ' \t\n\r\f\v'
+INPUT_LABELS = ('input', 'stdin')
+
+
+class CommentParser(object):
+
+    """Parses comments for a specific username. Build one parser when the
+    bot starts and reuse it for every comment.
+
+    A comment is parsed as:
+        1. "+/u/" + the username (case insensitive).
+        2. A string representing the programming language and arguments
+            + a "\\n".
+        3. A markdown code block (one or more lines indented by 4 spaces or
+            a tab) that represents the source code.
+        4. (Optional) "Input:" OR "Stdin:" + "\\n".
+        5. (Optional) A markdown code block that represents the
+            program's input.
+    """
+
+    def __init__(self, username):
+        self.username = username
+        # Without a username nothing is a mention, rather than every "+/u/".
+        self.mention = (re.compile(re.escape('+/u/' + username),
+                                   re.IGNORECASE) if username else None)
+
+    def mentions(self, body):
+        """Return True if body mentions the username with a leading '+'."""
+        return (self.mention is not None and
+                self.mention.search(body) is not None)
+
+    def parse(self, body):
+        """Return a tuple of the raw args, source and input strings found in
+        body, or None if the comment doesn't contain a valid request.
+        The source and input keep the indentation of every line except
+        the first.
+        """
+        # Several mentions may share a line, so the position of the next
+        # newline and lines known not to be followed by a code block are
+        # remembered to keep repeated mentions from rescanning the text.
+        if self.mention is None:
+            return None
+        newline = [len(body) + 1, -1]
+        failed = set()
+        for m in self.mention.finditer(body):
+            result = self._parse_mention(body, m.end(), newline, failed)
+            if result is not None:
+                return result
+        return None
+
+    def _parse_mention(self, body, start, newline, failed):
+        # The arguments begin after any whitespace following the mention
+        # and run to the end of the line.
+        ws_end = _skip_whitespace(body, start)
+        searched_from, args_end = newline
+        if not (searched_from <= ws_end and
+                (args_end == -1 or args_end >= ws_end)):
+            args_end = body.find('\n', ws_end)
+            newline[:] = [ws_end, args_end]
+        if args_end != -1 and args_end not in failed:
+            src_start = _block_start(body, args_end + 1)
+            if src_start is not None:
+                return self._parse_block(body, ws_end, args_end, src_start)
+            failed.add(args_end)
+        # Otherwise the whitespace after the mention may itself contain
+        # the code block. The arguments are then empty and end at the last
+        # newline before the block.
+        src_start = _block_start(body, start)
+        if src_start is None:
+            return None
+        args_end = body.rfind('\n', start, src_start)
+        return self._parse_block(body, args_end, args_end, src_start)
+
+    def _parse_block(self, body, args_start, args_end, src_start):
+        src_end = _block_end(body, src_start)
+        stdin = self._parse_input(body, src_end)
+        return body[args_start:args_end], body[src_start:src_end], stdin
+
+    def _parse_input(self, body, start):
+        if not body.startswith('\n', start):
+            return ''
+        label_start = _skip_whitespace(body, start + 1)
+        for label in INPUT_LABELS:
+            label_end = label_start + len(label)
+            if body[label_start:label_end].lower() == label:
+                break
+        else:
+            return ''
+        if body.startswith(':', label_end):
+            label_end += 1
+        in_start = _block_start(body, label_end)
+        if in_start is None:
+            return ''
+        return body[in_start:_block_end(body, in_start, trailing_newline=True)]
+
+
+def _skip_whitespace(body, i):
+    length = len(body)
+    while i < length and body[i] in WHITESPACE:
+        i += 1
+    return i
+
+
+def _is_indented_start(body, i):
+    """Return True if position i directly follows a newline and an indent
+    of four spaces or a tab.
+    """
+    return ((i >= 5 and body[i - 5:i] == '\n    ') or
+            (i >= 2 and body[i - 2:i] == '\n\t'))
+
+
+def _block_start(body, i):
+    """Return the start of the first line of the code block that follows
+    the whitespace at position i, or None if there isn't one. The block
+    starts after the indent of the last indented line in the whitespace.
+    """
+    end = _skip_whitespace(body, i)
+    for j in range(end, i - 1, -1):
+        if _is_indented_start(body, j):
+            return j
+    return None
+
+
+def _block_end(body, start, trailing_newline=False):
+    """Return the end of a code block that begins at start. The block
+    continues through every following line that is either indented or
+    empty, up to the end of the last indented line.
+    """
+    length = len(body)
+    end = body.find('\n', start)
+    if end == -1:
+        return length
+    block_end = end
+    while end != -1:
+        line_start = end + 1
+        next_end = body.find('\n', line_start)
+        line_end = length if next_end == -1 else next_end
+        if body.startswith('    ', line_start) or body.startswith('\t',
+                                                                   line_start):
+            block_end = line_end
+            if trailing_newline and next_end != -1:
+                block_end += 1
+        elif line_start != line_end:
+            break
+        end = next_end
+    return block_end
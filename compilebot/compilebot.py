@@ -1,55 +1,224 @@
 from __future__ import unicode_literals, print_function
-import ideone
 import time
-import praw
 import re
+import math
+import heapq
+import itertools
+import sys
 import urllib
+import atexit
 import traceback
+import threading
 import config
+import alerts
+import banned
+import cache
+import clients
+import comment_parser
+import languages
+import lazy
+import logwriter
+import metrics
+import polling
+import profiling
+import quota
+import reply_index
+import retry
+import scheduler
+import spam
+import tracing
+import truncation
+import workqueue
+from collections import deque
 from socket import error as SocketError
 from sys import exit
 from functools import wraps
 
+# The reddit and ideone clients are slow to import and only imported once
+# they are used, see lazy.LazyModule.
+praw = lazy.LazyModule('praw')
+prawcore = lazy.LazyModule('prawcore')
+ideone = lazy.LazyModule('ideone')
+ideone_standin = lazy.LazyModule('ideone_standin')
 
-def handle_api_exceptions(max_attempts=1):
+
+# Metrics exposed by deploy.py, see metrics.Registry. Metrics computed from
+# the state of other parts of the bot are registered further below.
+METRICS = metrics.Registry()
+INBOX_LAG = METRICS.histogram(
+    'compilebot_inbox_lag_seconds',
+    "Seconds from the creation of an inbox item until it is processed",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+STAGE_SECONDS = METRICS.histogram(
+    'compilebot_stage_seconds',
+    "Seconds spent in each stage of processing a request",
+    labels=('stage',))
+RESULTS = METRICS.counter(
+    'compilebot_ideone_results_total',
+    "Finished ideone submissions by result code", labels=('result',))
+SPAM_DETECTIONS = METRICS.counter(
+    'compilebot_spam_detections_total',
+    "Replies reported as potential spam by spam behavior",
+    labels=('behavior',))
+ERRORS = METRICS.counter(
+    'compilebot_errors_total', "Errors by exception type", labels=('type',))
+
+# Every inbox item is traced, see tracing.Tracer. Traces are only written
+# out if a trace file is configured.
+TRACER = tracing.Tracer(
+    logwriter.LogWriter(config.TRACE_FILE) if config.TRACE_FILE else None)
+
+# Opt-in profiling started by deploy.py, see profiling.Profiler.
+PROFILER = profiling.Profiler(
+    directory=config.PROFILE_DIR,
+    interval=config.PROFILE_INTERVAL,
+    on_write=lambda path, samples: log(
+        "Wrote profile of {} samples to {}".format(samples, path)),
+)
+
+def retried_errors():
+    """Return the errors of API requests that are retried and counted as
+    failures of the service. praw is imported the first time an error is
+    handled, rather than when the bot starts.
+    """
+    return (
+        praw.exceptions.PRAWException,
+        prawcore.exceptions.ServerError,
+        prawcore.exceptions.RequestException,
+        SocketError,
+    )
+
+RETRY_POLICIES = {
+    'reddit': retry.RetryPolicy(
+        base_delay=config.RETRY_BASE_DELAY,
+        max_delay=config.RETRY_MAX_DELAY,
+        jitter=config.RETRY_JITTER,
+    ),
+    # Ideone calls are made while a user waits for their reply, so they
+    # aren't held up for as long.
+    'ideone': retry.RetryPolicy(
+        base_delay=config.RETRY_BASE_DELAY,
+        max_delay=min(config.RETRY_MAX_DELAY, 30),
+        jitter=config.RETRY_JITTER,
+    ),
+}
+
+
+def breaker_changed(breaker, state):
+    log("The {} circuit is now {}".format(breaker.name, state),
+        alert=state == retry.OPEN)
+
+
+BREAKERS = dict(
+    (name, retry.CircuitBreaker(
+        name,
+        failure_threshold=config.BREAKER_THRESHOLD,
+        reset_timeout=config.BREAKER_RESET_TIMEOUT,
+        on_change=breaker_changed,
+    )) for name in RETRY_POLICIES)
+
+RETRY_STATS = retry.RetryStats()
+
+
+def handle_api_exceptions(max_attempts=1, backend='reddit', policy=None):
     """Return a function decorator that wraps a given function in a
     try-except block that will handle various exceptions that may
     occur during an API request to reddit. A maximum number of retry 
-    attempts may be specified.
+    attempts may be specified. The error of the last attempt is raised if
+    every attempt fails, see retried_errors.
+
+    Keyword arguments:
+    backend -- the service the function calls, 'reddit' or 'ideone', whose
+        retry policy and circuit breaker are used. Functions that make
+        several kinds of calls use None and aren't affected by breakers.
+    policy -- a retry.RetryPolicy used instead of the backend's policy
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            retries = 0
-            while retries < max_attempts:
-                sleep_time = None
-                error_msg = ""
+            retry_policy = (policy or RETRY_POLICIES.get(backend) or
+                            RETRY_POLICIES['reddit'])
+            breaker = BREAKERS.get(backend)
+            site = func.__name__
+            for retries in range(max_attempts):
+                if breaker is not None:
+                    try:
+                        breaker.before_call()
+                    except retry.CircuitOpenError:
+                        RETRY_STATS.add(site, 'rejected')
+                        raise
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 # Handle and log miscellaneous API exceptions
-                except praw.exceptions.PRAWException as e:
-                    error_msg = "PRAW Exception \"{error}\" occurred: ".format(
-                        error=e)
-                except praw.exceptions.ClientException as e:
-                    error_msg = "Client Exception \"{error}\" occurred: ".format(
-                        error=e)
-                except praw.exceptions.APIException as e:
-                    error_msg = "API Exception \"{error}\" occurred: ".format(
-                        error=e)
-                except SocketError as e:
-                    error_msg = "SocketError \"{error}\" occurred: ".format(
-                        error=e)
-                    log(error_msg)
-                sleep_time = sleep_time or retries * 150
-                log("{0} in {f}. Sleeping for {t} seconds. "
-                    "Attempt {rt} of {at}.".format(error_msg, f=func.__name__,
+                except retried_errors() as e:
+                    error = e
+                    ERRORS.inc(type=type(e).__name__)
+                except retry.CircuitOpenError:
+                    raise
+                except Exception:
+                    # The service answered, so it is working.
+                    if breaker is not None:
+                        breaker.success()
+                    raise
+                else:
+                    if breaker is not None:
+                        breaker.success()
+                    # Only successful API calls are counted, not every
+                    # call of functions like log.
+                    if backend is not None:
+                        RETRY_STATS.add(site, 'success')
+                    return result
+                finally:
+                    # A test call of a half open breaker that ended with
+                    # neither a success nor a failure, for example with a
+                    # KeyboardInterrupt, must not block every later call.
+                    if breaker is not None:
+                        breaker.release()
+                if breaker is not None:
+                    breaker.failure()
+                error_msg = "{type} \"{error}\" occurred".format(
+                    type=type(error).__name__, error=error)
+                if retries + 1 >= max_attempts:
+                    RETRY_STATS.add(site, 'gave_up')
+                    log("{0} in {f}. Giving up after {at} attempts.".format(
+                        error_msg, f=site, at=max_attempts))
+                    raise error
+                RETRY_STATS.add(site, 'retry')
+                sleep_time = retry_policy.delay(retries, error)
+                log("{0} in {f}. Sleeping for {t:.1f} seconds. "
+                    "Attempt {rt} of {at}.".format(error_msg, f=site,
                                                    t=sleep_time, rt=retries + 1, at=max_attempts))
                 time.sleep(sleep_time)
-                retries += 1
         return wrapper
     return decorator
 
 
+def traced(name=None):
+    """Return a function decorator that records every call of the function
+    as a span of the current trace, named after the function by default.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled(func):
+    """Function decorator that profiles calls of the function while the
+    profiler is profiling the next calls.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.counting:
+            return func(*args, **kwargs)
+        with PROFILER.call():
+            return func(*args, **kwargs)
+    return wrapper
+
+
 class Reply(object):
 
     """An object that represents a potential response to a comment.
@@ -60,9 +229,7 @@ class Reply(object):
 
     def __init__(self, text):
         # Truncate text if it exceeds max character limit.
-        if len(text) >= 10000:
-            text = text[:9995] + '\n...'
-        self.text = text
+        self.text = truncation.fit_text(text)
         self.recipient = None
 
     def send(self, *args, **kwargs):
@@ -73,50 +240,68 @@ class Reply(object):
 class CompiledReply(Reply):
 
     """Replies that contain details about evaluated code. These can be
-    sent as replies to comments.
+    sent as replies to comments. An optional edit text is used instead of
+    the text when the reply edits one of the bot's existing comments.
     """
 
-    def __init__(self, text, compile_details):
+    def __init__(self, text, compile_details, edit_text=None):
         Reply.__init__(self, text)
         self.compile_details = compile_details
+        self.edit_text = (truncation.fit_text(edit_text)
+                          if edit_text is not None else self.text)
         self.parent_comment = None
 
+    @traced('CompiledReply.send')
     @handle_api_exceptions(max_attempts=3)
     def send(self, comment, reddit_session):
         """Send a reply to a specific reddit comment or message."""
         self.parent_comment = comment
         self.recipient = comment.author
-        comment.reply(self.text)
+        sent = []
+        with STAGE_SECONDS.time(stage='reply'):
+            if not send_once('reply', comment.id,
+                             lambda text: sent.append(comment.reply(text)),
+                             self.text):
+                return
+        if sent[0] is not None:
+            self.index(comment, sent[0].id)
         log("Replied to {id}".format(id=comment.id))
 
+    @traced('CompiledReply.make_edit')
     @handle_api_exceptions(max_attempts=3)
     def make_edit(self, comment, parent):
         """Edit one of the bot's existing comments."""
         self.parent_comment = parent
         self.recipient = parent.author
-        comment.edit(self.text)
+        with STAGE_SECONDS.time(stage='reply'):
+            if not send_once('edit', comment.id, comment.edit,
+                             self.edit_text):
+                return
+        self.index(parent, comment.id)
         log("Edited comment {}".format(comment.id))
 
-    def detect_spam(self):
+    def output_hash(self):
+        """Return a hash of the parts of the compile details a reply
+        shows, which doesn't change when identical code is recompiled.
+        """
+        return reply_index.text_hash(*[
+            self.compile_details.get(key, '') for key in
+            ('source', 'output', 'stderr', 'cmpinfo', 'result')])
+
+    def index(self, comment, reply_id):
+        """Record the bot's reply to a comment in the reply index."""
+        REPLY_INDEX.put(comment.id, reply_id,
+                        reply_index.text_hash(comment.body),
+                        self.output_hash())
+
+    def detect_spam(self, subreddit=None):
         """Scan a reply and return a list of potentially spammy attributes
-        found in the comment's output.
+        found in the comment's output, using the spam rules of a subreddit
+        if one is given.
         """
-        output = self.compile_details['output']
-        source = self.compile_details['source']
-        errors = self.compile_details['stderr']
-
-        spam_behaviors = {
-            "Excessive line breaks": output.count('\n') > config.LINE_LIMIT,
-            "Excessive character count": len(output) > config.CHAR_LIMIT,
-            "Spam phrase detected": any([word.encode('utf-8').lower() in
-                                         (source + output).encode('utf-8').lower()
-                                         for word in config.SPAM_PHRASES]),
-            "Illegal system call detected": "Permission denied" in errors
-        }
-        if any(spam_behaviors.values()):
-            spam_triggers = [k for k, v in spam_behaviors.iteritems() if v]
-            return spam_triggers
-        return []
+        return SPAM_RULES.detect(self.compile_details['source'],
+                                 self.compile_details['output'],
+                                 self.compile_details['stderr'], subreddit)
 
 
 class MessageReply(Reply):
@@ -129,6 +314,7 @@ class MessageReply(Reply):
         Reply.__init__(self, text)
         self.subject = subject
 
+    @traced('MessageReply.send')
     @handle_api_exceptions(max_attempts=3)
     def send(self, comment, reddit):
         """Reply the author of a reddit comment by sending them a reply
@@ -141,41 +327,277 @@ class MessageReply(Reply):
             self.subject = "Comment {id}".format(id=comment.id)
         # Prepend message subject with username
         self.subject = "{} - {}".format(config.R_USERNAME, self.subject)
-        reddit.redditor(self.recipient.name).message(self.subject, self.text)
+        redditor = reddit.redditor(self.recipient.name)
+        with STAGE_SECONDS.time(stage='reply'):
+            if not send_once('message', comment.id, redditor.message,
+                             self.subject, self.text):
+                return
         log("Message reply for comment {id} sent to {to}".format(
             id=comment.id, to=self.recipient))
 
 
+LOG_WRITER = None
+_log_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """Return the background writer for the current log file, replacing
+    it if the log file setting has changed.
+    """
+    global LOG_WRITER
+    with _log_writer_lock:
+        if LOG_WRITER is None or LOG_WRITER.path != config.LOG_FILE:
+            if LOG_WRITER is not None:
+                LOG_WRITER.close()
+            LOG_WRITER = logwriter.LogWriter(
+                config.LOG_FILE,
+                queue_size=config.LOG_QUEUE_SIZE,
+                batch_size=config.LOG_BATCH_SIZE,
+                flush_interval=config.LOG_FLUSH_INTERVAL,
+                max_bytes=config.LOG_MAX_BYTES,
+                rotate_interval=config.LOG_ROTATE_INTERVAL,
+                backup_count=config.LOG_BACKUP_COUNT,
+            )
+        return LOG_WRITER
+
+
 @handle_api_exceptions(max_attempts=3)
+def send_alert(reddit, subject, body):
+    """Send an alert digest to the admin. A new reddit session is only
+    created if the bot hasn't attached its own session yet.
+    """
+    if reddit is None:
+        reddit = login()
+    reddit.redditor(config.ADMIN).message(subject, body)
+
+
+ALERTS = alerts.AlertDispatcher(
+    send_alert,
+    delay=config.ALERT_DELAY,
+    min_interval=config.ALERT_MIN_INTERVAL,
+    on_error=lambda e: log("Unable to send admin alert: {}".format(e)),
+)
+
+
+@atexit.register
+def shutdown():
+    """Send any pending admin alerts and write out any buffered log
+    messages and traces. Called automatically when the interpreter exits.
+    """
+    # Alerts are also written to the log. Without the bot's own session,
+    # sending them would log in to reddit while the interpreter exits.
+    if ALERTS.session is not None:
+        ALERTS.flush()
+    if LOG_WRITER is not None:
+        LOG_WRITER.close()
+    if TRACER.writer is not None:
+        TRACER.writer.close()
+
+
+@handle_api_exceptions(max_attempts=3, backend=None)
 def log(message, alert=False):
     """Log messages along with a timestamp in a log file. If the alert
-    option is set to true, send a message to the admin's reddit inbox.
+    option is set to true, also send the message to the admin's reddit
+    inbox with the next alert digest. Messages are written to the log
+    file by a background thread.
     """
+    if alert and config.ADMIN:
+        ALERTS.alert(message)
+    # Messages logged while processing an inbox item start with the
+    # item's trace id.
+    trace_id = TRACER.trace_id()
+    if trace_id:
+        message = "[{}] {}".format(trace_id, message)
     t = time.strftime('%y-%m-%d %H:%M:%S', time.localtime())
     message = "{}: {}\n".format(t, message)
     message = message.encode('utf8', 'replace')
     if config.LOG_FILE:
-        with open(config.LOG_FILE, 'a') as f:
-            f.write(message)
+        get_log_writer().write(message)
     else:
         print(message, end='')
-    if alert and config.ADMIN:
-        r = praw.Reddit(config.USER_AGENT)
-        r.login(config.R_USERNAME, config.R_PASSWORD)
-        admin_alert = message
-        subject = "CompileBot Alert"
-        r.redditor(config.ADMIN).message(subject, admin_alert)
 
 
-@handle_api_exceptions(max_attempts=3)
-def compile(source, lang, stdin=''):
+def new_ideone_client():
+    """Create an ideone client, or a client of the ideone stand-in if one
+    is configured.
+    """
+    if config.IDEONE_STANDIN == 'local':
+        return ideone_standin.StandinIdeone()
+    elif config.IDEONE_STANDIN:
+        return ideone_standin.RemoteIdeone(config.IDEONE_STANDIN)
+    return ideone.Ideone(config.I_USERNAME, config.I_PASSWORD)
+
+
+# Ideone clients are shared by all workers. A client is only rebuilt after
+# an auth or transport failure, not after an unknown language or a stuck
+# submission.
+IDEONE_CLIENTS = clients.ClientPool(
+    new_ideone_client,
+    size=config.WORKER_THREADS,
+    preserve=lambda: (ideone.LanguageNotFoundError, polling.PollTimeoutError,
+                      quota.QuotaExceededError),
+)
+
+RESULT_CACHE = cache.ResultCache(
+    size=config.CACHE_SIZE,
+    ttl=config.CACHE_TTL,
+    path=config.CACHE_FILE,
+    file_size=config.CACHE_FILE_SIZE,
+)
+
+# Only results that depend on the submission itself are cached. Timeouts
+# and internal errors may not happen again.
+CACHEABLE_RESULTS = (11, 12, 15, 17, 19)
+
+# Shared by all workers so run times learned for each language are kept
+# for the lifetime of the bot.
+POLLER = polling.PollScheduler(
+    initial_interval=config.POLL_INITIAL_INTERVAL,
+    min_interval=config.POLL_MIN_INTERVAL,
+    max_interval=config.POLL_MAX_INTERVAL,
+    backoff=config.POLL_BACKOFF,
+    timeout=config.POLL_TIMEOUT,
+)
+
+# The number of inbox items waiting for a worker that are put in fair order.
+FAIR_WINDOW = 50
+
+SCHEDULER = scheduler.Scheduler(
+    user_limit=config.USER_LIMIT,
+    user_period=config.USER_PERIOD,
+    language_limits=config.LANGUAGE_LIMITS,
+    default_language_limit=config.DEFAULT_LANGUAGE_LIMIT,
+    share_interval=config.SHARE_INTERVAL,
+    weights=config.USER_WEIGHTS,
+)
+
+# Every ideone call goes through the quota tracker, which limits the rate
+# of calls and counts submissions against the ideone budgets.
+QUOTA = quota.QuotaTracker(
+    daily_budget=config.QUOTA_DAILY_BUDGET,
+    monthly_budget=config.QUOTA_MONTHLY_BUDGET,
+    rate=config.QUOTA_RATE,
+    burst=config.QUOTA_BURST,
+    warn_fraction=config.QUOTA_WARN_FRACTION,
+    degrade_fraction=config.QUOTA_DEGRADE_FRACTION,
+    path=config.QUOTA_FILE,
+    on_warning=lambda message: log(message, alert=True),
+)
+
+WORK_QUEUE = None
+QUEUE_OPTIONS = dict(
+    max_attempts=config.QUEUE_MAX_ATTEMPTS,
+    retention=config.QUEUE_RETENTION,
+    lease=config.QUEUE_LEASE,
+    retry_delay=config.QUEUE_RETRY_DELAY,
+    worker_id=config.WORKER_ID,
+)
+if config.QUEUE_URL:
+    WORK_QUEUE = workqueue.RedisQueue(config.QUEUE_URL, **QUEUE_OPTIONS)
+elif config.QUEUE_FILE:
+    WORK_QUEUE = workqueue.SQLiteQueue(config.QUEUE_FILE, **QUEUE_OPTIONS)
+
+# The pools of inbox workers that are processing the inbox.
+INBOX_WORKERS = set()
+
+
+def queue_counts():
+    """Return a dict of the number of inbox items in each state, from the
+    work queue if one is configured and from the inbox workers otherwise.
+    """
+    if WORK_QUEUE is not None:
+        return WORK_QUEUE.counts()
+    counts = {}
+    for workers in list(INBOX_WORKERS):
+        for state, count in workers.counts().items():
+            counts[state] = counts.get(state, 0) + count
+    return counts
+
+# Metrics computed from the state of the bot each time they are read.
+QUEUE_JOBS = METRICS.gauge(
+    'compilebot_queue_jobs', "Inbox items waiting or being processed by "
+    "state", labels=('state',))
+QUEUE_JOBS.set_function(lambda: dict(((state,), count) for state, count
+                                     in queue_counts().items()))
+METRICS.counter(
+    'compilebot_api_calls_total', "API calls by call site and outcome",
+    labels=('site', 'outcome')).set_function(
+        lambda: RETRY_STATS.snapshot())
+METRICS.gauge(
+    'compilebot_circuit_open', "Whether calls to a service are stopped",
+    labels=('backend',)).set_function(
+        lambda: dict(((name,), int(breaker.state != retry.CLOSED))
+                     for name, breaker in BREAKERS.items()))
+METRICS.counter(
+    'compilebot_circuit_rejected_total',
+    "Calls rejected by an open circuit", labels=('backend',)).set_function(
+        lambda: dict(((name,), breaker.rejected)
+                     for name, breaker in BREAKERS.items()))
+METRICS.counter(
+    'compilebot_cache_requests_total', "Result cache lookups by outcome",
+    labels=('outcome',)).set_function(
+        lambda: {('hit',): RESULT_CACHE.hits, ('miss',): RESULT_CACHE.misses})
+METRICS.gauge(
+    'compilebot_ideone_submissions', "Ideone submissions in the current "
+    "budget period", labels=('period',)).set_function(
+        lambda: dict(((period,), usage['submissions'])
+                     for period, usage in QUOTA.usage().items()))
+
+# Spam detection rules, with the phrases of each filter compiled once.
+DEFAULT_SPAM_FILTER = spam.SpamFilter(config.LINE_LIMIT, config.CHAR_LIMIT,
+                                      config.SPAM_PHRASES,
+                                      config.SPAM_PATTERNS)
+SPAM_RULES = spam.SpamRules(
+    DEFAULT_SPAM_FILTER,
+    subreddits=dict((name, DEFAULT_SPAM_FILTER.override(**(rules or {})))
+                    for name, rules in config.SPAM_SUBREDDITS.items()),
+    ignore=config.IGNORE_SPAM,
+)
+
+# The bot's replies by source comment id, used to edit the right reply on
+# a recompile request.
+REPLY_INDEX = reply_index.ReplyIndex(config.REPLY_INDEX_FILE)
+
+# The work queue job being processed by the current thread, if any.
+CURRENT_JOB = threading.local()
+
+
+def send_once(action, target, send, *args):
+    """Call send with args to send a reply, unless the reply was already
+    sent for the job being processed by the current thread, by an earlier
+    attempt or by another worker. A reply is identified by an action, such
+    as 'reply' or 'edit', and its target. Returns False if the reply was
+    skipped.
+    """
+    job = getattr(CURRENT_JOB, 'job', None)
+    if job is not None and not WORK_QUEUE.claim_reply(job, action, target):
+        log("Skipping {} to {} already sent for {}".format(action, target,
+                                                            job.id))
+        return False
+    try:
+        send(*args)
+    except:
+        if job is not None:
+            WORK_QUEUE.release_reply(job, action, target)
+        raise
+    return True
+
+
+@traced()
+@handle_api_exceptions(max_attempts=3, backend='ideone')
+def compile(source, lang, stdin='', use_cache=True):
     """Compile and evaluate source code using the ideone API and return
-    a dict containing the output details.
+    a dict containing the output details. Raises polling.PollTimeoutError
+    if the submission doesn't finish in time and quota.QuotaExceededError
+    if there is no cached result and the ideone budget is used up, or
+    quota.QuotaDegradedError if it is nearly used up.
 
     Keyword arguments:
     source -- a string containing source code to be compiled and evaluated
     lang -- the programming language pertaining to the source code
     stdin -- optional "standard input" for the program
+    use_cache -- return the result of an identical earlier submission
+        if there is one
 
     >>> d = compile('print("Hello World")', 'python')
     >>> d['output']
@@ -183,20 +605,98 @@ def compile(source, lang, stdin=''):
 
     """
     lang = config.LANG_ALIASES.get(lang.lower(), lang)
-    # Login to ideone and create a submission
-    i = ideone.Ideone(config.I_USERNAME, config.I_PASSWORD)
-    sub = i.create_submission(source, language_name=lang, std_input=stdin)
-    sub_link = sub['link']
-    details = i.submission_details(sub_link)
-    # The status of the submission indicates whether or not the source has
-    # finished executing. A status of 0 indicates the submission is finished.
-    while details['status'] != 0:
-        details = i.submission_details(sub_link)
-        time.sleep(3)
+    TRACER.annotate(lang=lang)
+    key = RESULT_CACHE.key(lang.lower(), source, stdin)
+    # Once the ideone budget is nearly used up, only cached results are
+    # returned, even if a fresh result was requested.
+    degraded = QUOTA.degraded()
+    if use_cache or degraded:
+        details = RESULT_CACHE.get(key)
+        if details is not None:
+            log("Using cached result of submission {}".format(details['link']))
+            TRACER.annotate(cached=True, link=details['link'])
+            return details
+    if degraded:
+        QUOTA.check_degraded()
+    with IDEONE_CLIENTS.client() as i:
+        # Reserved once the client is ready, so that a failed login
+        # doesn't use up a submission.
+        QUOTA.reserve()
+        try:
+            QUOTA.acquire()
+            with STAGE_SECONDS.time(stage='compile'), TRACER.span('submit'):
+                sub = i.create_submission(source, language_name=lang,
+                                          std_input=stdin)
+        except:
+            QUOTA.release()
+            raise
+        sub_link = sub['link']
+
+        def finished_details():
+            QUOTA.acquire()
+            details = i.submission_details(sub_link)
+            # The status of the submission indicates whether or not the
+            # source has finished executing. A status of 0 indicates the
+            # submission is finished.
+            if details['status'] == 0:
+                return details
+
+        with STAGE_SECONDS.time(stage='poll'), TRACER.span('poll'):
+            details, stats = POLLER.poll(lang.lower(), finished_details)
+            TRACER.annotate(polls=stats.polls)
+    log("Submission {link} finished after {n} polls in {t:.1f} seconds".format(
+        link=sub_link, n=stats.polls, t=stats.elapsed))
     details['link'] = sub_link
+    TRACER.annotate(link=sub_link, result=details['result'])
+    RESULTS.inc(result=details['result'])
+    if details['result'] in CACHEABLE_RESULTS:
+        RESULT_CACHE.put(key, details)
     return details
 
 
+@handle_api_exceptions(backend='ideone')
+def get_languages():
+    """Retrieve a dict of the ids and names of the languages ideone
+    supports.
+    """
+    with IDEONE_CLIENTS.client() as i:
+        QUOTA.acquire()
+        return i.languages()
+
+
+LANGUAGES = languages.LanguageCatalog(
+    get_languages,
+    aliases=config.LANG_ALIASES,
+    refresh_interval=config.LANGUAGES_REFRESH_INTERVAL,
+    cache_file=config.LANGUAGES_CACHE_FILE,
+)
+
+
+def unknown_language(lang):
+    """Return a list of similar languages if ideone doesn't support a
+    language, or None if it does. Every language is assumed to be
+    supported while the languages can't be retrieved.
+    """
+    if not LANGUAGES.updated:
+        LANGUAGES.load()
+    try:
+        LANGUAGES.refresh()
+    except retried_errors() as e:
+        log("Unable to retrieve the ideone languages: {}".format(e))
+    if not LANGUAGES.languages or LANGUAGES.resolve(lang):
+        return None
+    return LANGUAGES.suggest(lang)
+
+
+def language_key(lang):
+    """Return the name the scheduler's language limits know a language
+    by, the lowercase name of the ideone language without its version,
+    so that aliases and full names of a language share its limit.
+    """
+    lang = config.LANG_ALIASES.get(lang.lower(), lang)
+    return languages.simple_name(LANGUAGES.resolve(lang) or lang).lower()
+
+
 def code_block(text):
     """Create a markdown formatted code block containing the given text"""
     text = '\n' + text
@@ -213,19 +713,98 @@ def get_banned(reddit):
     return banned
 
 
+@handle_api_exceptions()
+def get_ban_changes(reddit, since):
+    """Retrieve bans and unbans made after a UTC timestamp from the
+    moderator subreddit's moderation log as a chronological list of
+    (timestamp, action, name) tuples. Returns None if the log holds
+    more changes than a single request retrieves.
+    """
+    limit = 100
+    changes = []
+    for action in ('banuser', 'unbanuser'):
+        entries = list(reddit.subreddit(config.SUBREDDIT).mod.log(
+            action=action, limit=limit))
+        recent = [e for e in entries if e.created_utc > since]
+        if len(recent) == limit:
+            return None
+        changes.extend((e.created_utc, e.action, e.target_author)
+                       for e in recent)
+    changes.sort()
+    return changes
+
+
+BANNED = banned.BannedUsers(
+    get_banned,
+    fetch_changes=get_ban_changes,
+    refresh_interval=config.BANNED_REFRESH_INTERVAL,
+    full_refresh_interval=config.BANNED_FULL_REFRESH_INTERVAL,
+    snapshot_file=config.BANNED_SNAPSHOT_FILE,
+)
+# Seconds work() waits at least between refreshes of the banned users.
+MIN_BANNED_REFRESH_SLEEP = 10
+
+
+def update_banned(reddit):
+    """Refresh config.BANNED_USERS from the banned users cache if the
+    cache is due for a refresh. Worker processes read the banned users
+    from the work queue instead.
+    """
+    if not config.SUBREDDIT:
+        return
+    if config.ROLE == 'worker':
+        # The intake process shares the banned users through the queue.
+        users = WORK_QUEUE.get_value('banned_users')
+        if users is not None:
+            config.BANNED_USERS = set(users)
+        return
+    if BANNED.users is None:
+        BANNED.load()
+    try:
+        users = BANNED.refresh(reddit)
+    except retried_errors() as e:
+        # The current list is kept until the next refresh.
+        log("Unable to refresh the banned users: {}".format(e))
+        return
+    if users is not None and users is not config.BANNED_USERS:
+        config.BANNED_USERS = users
+        if WORK_QUEUE is not None:
+            WORK_QUEUE.set_value('banned_users', sorted(users))
+
+
+def restore():
+    """Load the state saved by an earlier run of the bot, so that it can
+    start processing the inbox without fetching the banned users and the
+    languages first. Jobs left in the work queue are picked up by the
+    workers as it is.
+    """
+    if BANNED.users is None and BANNED.load() is not None:
+        config.BANNED_USERS = BANNED.users
+        log("Restored {} banned users".format(len(BANNED.users)))
+    if not LANGUAGES.languages and LANGUAGES.load():
+        log("Restored {} languages".format(len(LANGUAGES.languages)))
+    if WORK_QUEUE is not None:
+        log("Work queue holds {}".format(', '.join(
+            "{} {} jobs".format(count, state) for state, count in
+            sorted(WORK_QUEUE.counts().items())) or "no jobs"))
+
+
 @handle_api_exceptions()
 def send_modmail(subject, body, reddit):
     """Send a message to the bot moderators"""
     if config.SUBREDDIT:
         sub = reddit.subreddit(config.SUBREDDIT)
-        reddit.subreddit(sub.display_name).message(subject, body)
+        send_once('modmail', subject,
+                  reddit.subreddit(sub.display_name).message, subject, body)
     else:
         log("Mod message not sent. No subreddit found in settings.")
 
 
-def format_reply(details, opts):
+@traced()
+def format_reply(details, opts, footer=''):
     """Returns a reply that contains the output from a ideone submission's
-    details along with optional additional information.
+    details along with optional additional information and a footer. The
+    reply is at most truncation.REPLY_LIMIT characters long.
     """
     head, body, extra, = '', '', ''
     # Combine information that will go before the output.
@@ -234,22 +813,11 @@ def format_reply(details, opts):
     if '--input' in opts:
         # Combine program output and runtime error output.
         head += 'Input:\n{}\n\n'.format(code_block(details['input']))
-    output = details['output'] + details['stderr']
-    # Truncate the output if it contains an excessive
-    # amount of line breaks or if it is too long.
-    if output.count('\n') > config.LINE_LIMIT:
-        lines = output.split('\n')
-        # If message contains an excessive amount of duplicate lines,
-        # truncate to a small amount of lines to discourage spamming
-        if len(set(lines)) < 5:
-            lines_allowed = 2
-        else:
-            lines_allowed = 51
-        output = '\n'.join(lines[:lines_allowed])
-        output += "\n..."
-    # Truncate the output if it is too long.
-    if len(output) > 8000:
-        output = output[:8000] + '\n    ...\n'
+    # Truncate the output if it contains an excessive amount of line
+    # breaks, or an excessive amount of duplicate lines to discourage
+    # spamming, or if it is too long.
+    output = truncation.truncate_output(details['output'] + details['stderr'],
+                                        config.LINE_LIMIT, 8000)
     body += 'Output:\n{}\n\n'.format(code_block(output))
     if details['cmpinfo']:
         body += 'Compiler Info:\n{}\n\n'.format(code_block(details['cmpinfo']))
@@ -262,56 +830,59 @@ def format_reply(details, opts):
         extra += "Execution Time: {} seconds\n\n".format(details['time'])
     if '--version' in opts:
         extra += "Version: {}\n\n".format(details['langVersion'])
-    # To ensure the reply is less than 10000 characters long, shorten
-    # sections of the reply until they are of adequate length. Certain
-    # sections with less priority will be shortened before others.
-    total_len = 0
-    for section in (config.FOOTER, body, head, extra):
-        if len(section) + total_len > 9800:
-            section = section[:9800 - total_len] + '\n...\n'
-            total_len += len(section)
-    reply_text = head + body + extra
+    # To ensure the reply fits in a comment, shorten sections of the
+    # reply until they are of adequate length. Certain sections with
+    # less priority will be shortened before others.
+    footer, body, head, extra = truncation.fit_sections(
+        [footer, body, head, extra])
+    reply_text = head + body + extra + footer
     return reply_text
 
 
+# Built once from the bot's username and reused for every comment.
+PARSER = comment_parser.CommentParser(config.R_USERNAME or '')
+
+
+def get_parser():
+    """Return the comment parser for the bot's username. Both finding
+    the mentions of the bot and parsing them go through the parser, so
+    they always agree on the username. The parser is only built again if
+    the username setting has changed.
+    """
+    global PARSER
+    if PARSER.username != (config.R_USERNAME or ''):
+        PARSER = comment_parser.CommentParser(config.R_USERNAME or '')
+    return PARSER
+
+
 def parse_comment(body):
     """Parse a string that contains a username mention and code block
-    and return the supplied arguments, source code and input.
-
-    c_pattern is a regular expression that searches for the following:
-        1. "+/u/" + the reddit username that is using the program
-            (case insensitive).
-        2. A string representing the programming language and arguments
-            + a "\n".
-        3. A markdown code block (one or more lines indented by 4 spaces or
-            a tab) that represents the source code + a "\n".
-        4. (Optional) "Input:" OR "Stdin:" + "\n".
-        5. (Optional) A markdown code block that represents the
-            program's input.
-    """
-    c_pattern = (
-        r'\+/u/(?i)%s\s*(?P<args>.*)\n\s*'
-        r'((?<=\n( {4}))|(?<=\n\t))'
-        r'(?P<src>.*(\n((( {4}|\t).*\n)|\n)*(( {4}|\t).*))?)'
-        r'(\n\s*((?i)Input|Stdin):?\s*\n\s*'
-        r'((?<=\n( {4}))|(?<=\n\t))'
-        r'(?P<in>.*(\n((( {4}|\t).*\n)|\n)*(( {4}|\t).*\n?))?))?'
-    ) % config.R_USERNAME
-    m = re.search(c_pattern, body)
-    args, src, stdin = m.group('args'), m.group('src'), m.group('in') or ''
+    and return the supplied arguments, source code and input. An
+    AttributeError is raised if the comment isn't formatted correctly.
+
+    See comment_parser.CommentParser for the accepted format.
+    """
+    parsed = get_parser().parse(body)
+    if parsed is None:
+        raise AttributeError("No code block found in comment")
+    args, src, stdin = parsed
     # Remove the leading four spaces from every line.
     src = src.replace('\n    ', '\n')
     stdin = stdin.replace('\n    ', '\n')
     return args, src, stdin
 
 
-def create_reply(comment):
+@traced()
+def create_reply(comment, footnote=''):
     """Search comments for username mentions followed by code blocks
     and return a formatted reply containing the output of the executed
-    block or a message with additional information.
+    block or a message with additional information. An optional footnote
+    goes after the footer of a compiled reply when it edits an existing
+    reply.
     """
     try:
-        args, src, stdin = parse_comment(comment.body)
+        with STAGE_SECONDS.time(stage='parse'), TRACER.span('parse'):
+            args, src, stdin = parse_comment(comment.body)
     except AttributeError:
         preamble = config.ERROR_PREAMBLE.format(link=comment_link(comment))
         postamble = config.ERROR_POSTAMBLE.format(link=comment_link(comment))
@@ -327,7 +898,13 @@ def create_reply(comment):
         lang, opts = args, []
     lang = lang.strip()
     try:
-        details = compile(src, lang, stdin=stdin)
+        similar = unknown_language(lang)
+        if similar is not None:
+            raise ideone.LanguageNotFoundError(
+                "Language {} not found".format(lang), similar)
+        with SCHEDULER.language_slot(language_key(lang)):
+            details = compile(src, lang, stdin=stdin,
+                              use_cache='--fresh' not in opts)
         log("Compiled ideone submission {link} for comment {id}".format(
             link=details['link'], id=comment.id))
     except ideone.LanguageNotFoundError as e:
@@ -339,6 +916,22 @@ def create_reply(comment):
         # TODO Add link to accepted languages to msg
         log("Language error on comment {id}".format(id=comment.id))
         return MessageReply(error_text)
+    except ((polling.PollTimeoutError, retry.CircuitOpenError) +
+            retried_errors()) as e:
+        # Ideone is down or too slow, or didn't answer after every retry.
+        preamble = config.ERROR_PREAMBLE.format(link=comment_link(comment))
+        postamble = config.ERROR_POSTAMBLE.format(link=comment_link(comment))
+        error_text = preamble + config.INTERNAL_ERROR_TEXT + postamble
+        log("Gave up on submission for comment {id}: {error}".format(
+            id=comment.id, error=e))
+        return MessageReply(error_text)
+    except quota.QuotaExceededError as e:
+        preamble = config.ERROR_PREAMBLE.format(link=comment_link(comment))
+        postamble = config.ERROR_POSTAMBLE.format(link=comment_link(comment))
+        error_text = preamble + config.QUOTA_TEXT + postamble
+        log("Skipped submission for comment {id}: {error}".format(
+            id=comment.id, error=e))
+        return MessageReply(error_text)
     # The ideone submission result value indicates the final state of
     # the program. If the program compiled and ran successfully the
     # result is 15. Other codes indicate various errors.
@@ -346,10 +939,13 @@ def create_reply(comment):
     # The user is alerted of any errors via message reply unless they
     # include an option to include errors in the reply.
     if result_code == 15 or ('--include-errors' in opts and result_code in [11, 12]):
-        text = format_reply(details, opts)
         ideone_link = "http://ideone.com/{}".format(details['link'])
         url_pl = urllib.quote(comment_link(comment))
-        text += config.FOOTER.format(ide_link=ideone_link, perm_link=url_pl)
+        footer = config.FOOTER.format(ide_link=ideone_link, perm_link=url_pl)
+        text = format_reply(details, opts, footer=footer)
+        edit_text = None
+        if footnote:
+            edit_text = format_reply(details, opts, footer=footer + footnote)
     else:
         log("Result error {code} detected in comment {id}".format(
             code=result_code, id=comment.id))
@@ -375,16 +971,21 @@ def create_reply(comment):
                 code_block(details['stderr']))
         error_text = preamble + error_text + postamble
         return MessageReply(error_text)
-    return CompiledReply(text, details)
+    return CompiledReply(text, details, edit_text)
 
 
-@handle_api_exceptions()
+@profiled
+@traced()
+@handle_api_exceptions(backend=None)
 def process_unread(new, r):
     """Parse a new comment or message for various options and ignore reply
     to as appropriate.
     """
     reply = None
     sender = new.author
+    created = getattr(new, 'created_utc', None)
+    if isinstance(created, (int, float)):
+        INBOX_LAG.observe(max(0, time.time() - created))
     log("New {type} {id} from {sender}".format(
         type="mention" if new.was_comment else "message",
         id=new.id, sender=sender))
@@ -394,7 +995,7 @@ def process_unread(new, r):
     # Search for a user mention preceded by a '+' which is the signal
     # for CompileBot to create a reply for that comment.
     if (new.was_comment and
-            re.search(r'(?i)\+/u/{}'.format(config.R_USERNAME), new.body)):
+            get_parser().mentions(new.body)):
         reply = create_reply(new)
         if reply:
             reply.send(new, r)
@@ -428,14 +1029,19 @@ def process_unread(new, r):
             new.reply(config.RECOMPILE_ERROR_TEXT)
             return
         # Fetch the comment that will be recompiled.
-        original = r.comment(id.split('/')[-1])
+        with TRACER.span('fetch'):
+            original = r.comment(id.split('/')[-1])
         log("Processing request to recompile {id} from {user}"
             "".format(id=original.id, user=new.author))
         # Ensure the author of the original comment matches the author
         # requesting the recompile to prevent one user sending a recompile
         # request on the behalf of another.
         if original.author.name == new.author.name:
-            reply = create_reply(original)
+            # The footnote is part of the text of an edit from the start,
+            # so that it counts towards the length limit.
+            footnote = ("\n\n**EDIT:** Recompile request "
+                        "by {}".format(new.author))
+            reply = create_reply(original, footnote)
         else:
             new.reply(config.RECOMPILE_AUTHOR_ERROR_TEXT)
             log("Attempt to recompile on behalf of another author "
@@ -444,33 +1050,43 @@ def process_unread(new, r):
         # Ensure the recompiled reply resulted in a valid comment
         # reply and not an error message reply.
         if isinstance(reply, CompiledReply):
-            # Search for an existing comment reply from the bot.
-            # If one is found, edit the existing comment instead
-            # of creating a new one.
-            #
-            # Note: the .replies property only returns a limited
-            # number of comments. If the reply is buried, it will
-            # not be retrieved and a new one will be created
-            for rp in original.replies:
-                if rp.author.name.lower() == config.R_USERNAME.lower():
-                    footnote = ("\n\n**EDIT:** Recompile request "
-                                "by {}".format(new.author))
-                    reply.text += footnote
-                    reply.make_edit(rp, original)
-                    break
+            # The bot's reply is looked up in the reply index, and the
+            # reply is left alone if it already shows the same output.
+            indexed = REPLY_INDEX.get(original.id)
+            if indexed and indexed.output_hash == reply.output_hash():
+                log("Output of {id} is unchanged, not editing reply "
+                    "{reply}".format(id=original.id, reply=indexed.reply))
+                return
+            if indexed:
+                reply.make_edit(r.comment(indexed.reply), original)
             else:
-                # Reply to the original comment.
-                reply.send(original, r)
+                # Replies sent before the index existed are searched for
+                # in the replies of the original comment.
+                #
+                # Note: the .replies property only returns a limited
+                # number of comments. If the reply is buried, it will
+                # not be retrieved and a new one will be created
+                for rp in original.replies:
+                    if rp.author.name.lower() == config.R_USERNAME.lower():
+                        reply.make_edit(rp, original)
+                        break
+                else:
+                    # Reply to the original comment. The footnote is only
+                    # added to an edited reply.
+                    reply.send(original, r)
         else:
             # Send a message reply.
             reply.send(new, r)
     if reply and isinstance(reply, CompiledReply):
         # Report any potential spam to the moderators.
-        spam = reply.detect_spam()
-        if spam and reply.parent_comment.subreddit.display_name not in config.IGNORE_SPAM:
+        triggers = reply.detect_spam(
+            reply.parent_comment.subreddit.display_name)
+        if triggers:
             text = ("Potential spam detected on comment {link} "
                     "by {c.author}: ".format(c=reply.parent_comment, link=comment_link(reply.parent_comment)))
-            text += ', '.join(spam)
+            text += ', '.join(triggers)
+            for behavior in triggers:
+                SPAM_DETECTIONS.inc(behavior=behavior)
             send_modmail("Potential spam detected", text, r)
             log(text)
 
@@ -479,31 +1095,387 @@ def comment_link(comment):
     return "{c.submission.permalink}{c.id}".format(c=comment)
 
 
-@handle_api_exceptions()
-def main():
-    r = praw.Reddit(
+def handle_unread(new, r):
+    """Process a single inbox item. Any error is logged and reported to
+    the admin so that one bad item can't prevent the rest of the inbox
+    from being processed. The item is always marked as read afterwards.
+    """
+    try:
+        with TRACER.trace('inbox_item', item=new.id):
+            process_unread(new, r)
+    except:
+        ERRORS.inc(type=sys.exc_info()[0].__name__)
+        tb = traceback.format_exc()
+        # Notify admin of any errors
+        log("Error processing comment {c.id}\n"
+            "{traceback}".format(c=new, traceback=code_block(tb)), alert=True)
+    finally:
+        new.mark_read()
+
+
+class InboxWorkers(object):
+
+    """A pool of worker threads that process inbox items concurrently.
+
+    Most of the time spent on a mention is spent waiting on ideone and
+    reddit, so several mentions can be processed at once. Waiting items
+    are processed in the fair order given by the scheduler's tags rather
+    than in inbox order. Submitting an item blocks while the number of
+    waiting items is at the limit, which prevents the inbox from being
+    read any faster than it can be processed.
+    """
+
+    def __init__(self, reddit, concurrency, max_waiting=None):
+        # Every worker uses the one reddit session, which is also the
+        # session of the inbox items themselves, even though praw isn't
+        # thread safe. Its calls here are independent requests on a
+        # shared requests session, but praw's rate limit bookkeeping may
+        # be off while several calls are made at once.
+        self.reddit = reddit
+        self.max_waiting = max_waiting or concurrency
+        self._waiting = []
+        self._running = 0
+        self._count = itertools.count()
+        self._closing = False
+        self._cond = threading.Condition()
+        self._threads = []
+        for n in range(concurrency):
+            thread = threading.Thread(target=self._run,
+                                      name='InboxWorker-{}'.format(n))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        INBOX_WORKERS.add(self)
+
+    def submit(self, new):
+        """Queue an inbox item to be processed by the next free worker,
+        unless its author is turned away by admit.
+        """
+        if not admit(new, self.reddit):
+            return
+        tag = SCHEDULER.tag(author_name(new))
+        with self._cond:
+            while len(self._waiting) >= self.max_waiting:
+                self._cond.wait()
+            heapq.heappush(self._waiting, (tag, next(self._count), new))
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._waiting and not self._closing:
+                    self._cond.wait()
+                if not self._waiting:
+                    return
+                tag, n, new = heapq.heappop(self._waiting)
+                self._running += 1
+                self._cond.notify_all()
+            try:
+                handle_unread(new, self.reddit)
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def counts(self):
+        """Return a dict of the number of items waiting for a worker and
+        being processed, in the states of the work queue.
+        """
+        with self._cond:
+            return {workqueue.QUEUED: len(self._waiting),
+                    workqueue.RUNNING: self._running}
+
+    def close(self):
+        """Wait for all submitted items to finish and stop the workers."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        INBOX_WORKERS.discard(self)
+
+
+def author_name(new):
+    """Return the name of the author of an inbox item, or an empty string
+    for items without an author, such as messages from a subreddit.
+    """
+    return new.author.name if new.author else ''
+
+
+def wants_compile(new):
+    """Return True if an inbox item asks for code to be compiled, as a
+    mention or a recompile request.
+    """
+    if new.was_comment:
+        return get_parser().mentions(new.body)
+    return re.match(r'(i?)\s*--recompile', new.body) is not None
+
+
+def admit(new, r):
+    """Charge the author of an inbox item that asks for code to be
+    compiled one of their requests, when the item is read from the inbox
+    rather than when it is processed, so that retries aren't charged
+    again. Returns False if the author made too many requests recently,
+    in which case they are told so right away and the item is marked as
+    read without being processed.
+    """
+    name = author_name(new)
+    if (not wants_compile(new) or name.lower() in config.BANNED_USERS or
+            SCHEDULER.admit(name)):
+        return True
+    minutes = int(math.ceil(SCHEDULER.retry_after(name) / 60.0))
+    error_text = config.RATE_LIMIT_TEXT.format(minutes=max(1, minutes))
+    if new.was_comment:
+        preamble = config.ERROR_PREAMBLE.format(link=comment_link(new))
+        postamble = config.ERROR_POSTAMBLE.format(link=comment_link(new))
+        error_text = preamble + error_text + postamble
+    log("Rate limited {user} on {id}".format(user=name, id=new.id))
+    try:
+        MessageReply(error_text).send(new, r)
+    except Exception as e:
+        log("Unable to send rate limit message for {id}: {error}".format(
+            id=new.id, error=e))
+    new.mark_read()
+    return False
+
+
+def load_item(r, job):
+    """Fetch the inbox item of a work queue job from reddit."""
+    if job.was_comment:
+        item = r.comment(job.id)
+        item.was_comment = True
+        return item
+    return r.inbox.message(job.id)
+
+
+def handle_job(job, new, r):
+    """Process the inbox item of a work queue job, fetching the item from
+    reddit if it isn't given. A job that raises an error is queued to be
+    tried again. Returns True once the job is finished or has failed for
+    the last time.
+    """
+    CURRENT_JOB.job = job
+    try:
+        with TRACER.trace('job', item=job.id, attempt=job.attempts):
+            if new is None:
+                with TRACER.span('fetch'):
+                    new = load_item(r, job)
+            process_unread(new, r)
+    except:
+        ERRORS.inc(type=sys.exc_info()[0].__name__)
+        tb = traceback.format_exc()
+        will_retry = WORK_QUEUE.retry(job)
+        log("Error processing comment {id} (attempt {n}{retry})\n"
+            "{traceback}".format(id=job.id, n=job.attempts,
+                                 retry=", will retry" if will_retry else "",
+                                 traceback=code_block(tb)), alert=True)
+        return not will_retry
+    else:
+        if not WORK_QUEUE.done(job):
+            log("Job {id} was claimed by another worker after its lease "
+                "expired".format(id=job.id))
+        return True
+    finally:
+        CURRENT_JOB.job = None
+
+
+def enqueue(new, r):
+    """Store an inbox item in the work queue with its fair order tag as
+    its priority and mark it as read. Returns False if the item is already
+    queued or was processed recently, or its author is turned away by
+    admit.
+    """
+    if not admit(new, r):
+        return False
+    queued = WORK_QUEUE.put(new.id, new.was_comment,
+                            SCHEDULER.tag(author_name(new)))
+    new.mark_read()
+    return queued
+
+
+class QueueWorkers(object):
+
+    """Worker threads that process jobs from the work queue.
+
+    Inbox items are stored in the queue and marked as read right away, so
+    reading the inbox isn't held up by slow compiles. Items queued by this
+    process are handed to the workers directly, while items queued by an
+    intake process or left over from an earlier run are fetched from
+    reddit. The leases of the jobs being processed are renewed from a
+    separate thread.
+    """
+
+    def __init__(self, reddit, queue, concurrency):
+        self.reddit = reddit
+        self.queue = queue
+        self.items = {}
+        self._closing = False
+        self._wake = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+        for n in range(max(1, concurrency)):
+            thread = threading.Thread(target=self._run,
+                                      name='QueueWorker-{}'.format(n))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat,
+                                                  name='QueueHeartbeat')
+        self._heartbeat_thread.daemon = True
+        self._heartbeat_thread.start()
+
+    def submit(self, new):
+        """Store an inbox item in the queue and mark it as read."""
+        self.items[new.id] = new
+        if not enqueue(new, self.reddit):
+            self.items.pop(new.id, None)
+        with self._wake:
+            self._wake.notify()
+
+    def _run(self):
+        while True:
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                log("Unable to claim a work queue job: {}".format(e))
+                with self._wake:
+                    if self._closing:
+                        return
+                    self._wake.wait(self.queue.lease / 3.0)
+                continue
+            if job is None:
+                with self._wake:
+                    if self._closing:
+                        return
+                    self._wake.wait(1)
+                continue
+            if handle_job(job, self.items.get(job.id), self.reddit):
+                self.items.pop(job.id, None)
+
+    def _heartbeat(self):
+        while True:
+            try:
+                self.queue.heartbeat()
+            except Exception as e:
+                log("Unable to renew work queue leases: {}".format(e))
+            self._stopped.wait(self.queue.lease / 3.0)
+            if self._stopped.is_set():
+                return
+
+    def close(self):
+        """Wait for every queued job to finish and stop the workers."""
+        with self._wake:
+            self._closing = True
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._stopped.set()
+        self._heartbeat_thread.join()
+
+
+def process_inbox(inbox, r):
+    """Process each item from an iterable of inbox items in fair order
+    using a pool of workers, or through the work queue if one is
+    configured. An intake process only queues the items for worker
+    processes.
+    """
+    if WORK_QUEUE is not None and config.ROLE == 'intake':
+        for new in inbox:
+            enqueue(new, r)
+        return
+    if WORK_QUEUE is not None:
+        workers = QueueWorkers(r, WORK_QUEUE, config.WORKER_THREADS)
+        try:
+            for new in inbox:
+                workers.submit(new)
+        finally:
+            workers.close()
+        return
+    # Items are reordered among the waiting items only, so let more items
+    # wait than there are workers.
+    workers = InboxWorkers(r, max(1, config.WORKER_THREADS),
+                           max_waiting=FAIR_WINDOW)
+    try:
+        for new in inbox:
+            workers.submit(new)
+    finally:
+        workers.close()
+
+
+def inbox_stream(r, on_poll=None):
+    """Yield unread inbox items as they arrive. The inbox is checked
+    again right away while new items keep arriving, and the wait between
+    checks doubles up to a limit while the inbox is idle. If given,
+    on_poll is called before each check of the inbox.
+    """
+    wait = config.STREAM_MIN_WAIT
+    # Items are marked as read by the workers, so an item that is still
+    # being processed may be returned by the next check of the inbox.
+    seen_ids = deque(maxlen=1000)
+    while True:
+        if on_poll:
+            on_poll()
+        found = False
+        for new in r.inbox.unread(limit=None):
+            if new.id in seen_ids:
+                continue
+            seen_ids.append(new.id)
+            found = True
+            yield new
+        if found:
+            wait = config.STREAM_MIN_WAIT
+        else:
+            time.sleep(wait)
+            wait = min(wait * 2, config.STREAM_MAX_WAIT)
+
+
+def login():
+    """Return a new authenticated reddit session."""
+    return praw.Reddit(
         user_agent=config.USER_AGENT,
         client_id=config.R_CLIENT_ID,
         client_secret=config.R_CLIENT_SECRET,
         username=config.R_USERNAME,
         password=config.R_PASSWORD,
     )
-    if config.SUBREDDIT:
-        config.BANNED_USERS
-        config.BANNED_USERS = get_banned(r)
+
+
+@handle_api_exceptions(backend=None)
+def main():
+    r = login()
+    ALERTS.attach(r)
+    update_banned(r)
     # Iterate though each new comment/message in the inbox and
     # process it appropriately.
-    inbox = r.inbox.unread()
-    for new in inbox:
-        try:
-            process_unread(new, r)
-        except:
-            tb = traceback.format_exc()
-            # Notify admin of any errors
-            log("Error processing comment {c.id}\n"
-                "{traceback}".format(c=new, traceback=code_block(tb)), alert=True)
-        finally:
-            new.mark_read()
+    process_inbox(r.inbox.unread(), r)
+
+
+@handle_api_exceptions(backend=None)
+def stream():
+    """Continuously process new inbox items as soon as they arrive. This
+    only returns if an API error occurs.
+    """
+    r = login()
+    ALERTS.attach(r)
+    process_inbox(inbox_stream(r, on_poll=lambda: update_banned(r)), r)
+
+
+@handle_api_exceptions(backend=None)
+def work():
+    """Process jobs queued by an intake process in the work queue. This
+    only returns if an API error occurs.
+    """
+    r = login()
+    ALERTS.attach(r)
+    workers = QueueWorkers(r, WORK_QUEUE, config.WORKER_THREADS)
+    try:
+        while True:
+            update_banned(r)
+            # A refresh interval of 0 would read the banned users in a
+            # busy loop.
+            time.sleep(max(config.BANNED_REFRESH_INTERVAL,
+                           MIN_BANNED_REFRESH_SLEEP))
+    finally:
+        workers.close()
 
 
 if __name__ == "__main__":
@@ -3,21 +3,102 @@ This package initializes global config variables that are used in compilebot.
 Most options can either be loaded in from a YAML file or environment variables.
 """
 import os
-import yaml
+import json
+import hashlib
 
 # Configuration
 CONFIG_FILE = 'config.yml'
+# The parsed settings are cached in this file, so that a restarted bot
+# doesn't import yaml and parse config.yml again unless it has changed. The
+# cache is kept in the state directory, which has to be given in the
+# environment as it can't be read from config.yml before it is parsed.
+CONFIG_CACHE_FILE = os.environ.get('COMPILEBOT_CONFIG_CACHE')
+if not CONFIG_CACHE_FILE and os.environ.get('COMPILEBOT_STATE_DIR'):
+    CONFIG_CACHE_FILE = os.path.join(os.environ['COMPILEBOT_STATE_DIR'],
+                                     'config.cache')
+# Settings without which the bot can't start.
+REQUIRED_SETTINGS = ('log_file', 'reddit_user', 'reddit_pass',
+                     'reddit_client_id', 'reddit_client_secret',
+                     'ideone_user', 'ideone_pass', 'user_agent',
+                     'admin_user', 'subreddit', 'lang_aliases', 'spam',
+                     'text')
+
+
+def load_config(path, cache_path=None):
+    """Parse and validate a YAML settings file and return the settings.
+    The settings are loaded from the cache file instead if the contents
+    of the settings file haven't changed since they were cached. Raises
+    ValueError if required settings are missing.
+    """
+    with open(path, 'rb') as f:
+        contents = f.read()
+    key = hashlib.sha1(contents).hexdigest()
+    if cache_path:
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = json.load(f)
+            if cached['key'] == key:
+                return cached['settings']
+        except Exception:
+            # A missing, stale or corrupt cache is replaced below.
+            pass
+    import yaml
+    settings = yaml.load(contents)
+    missing = [name for name in REQUIRED_SETTINGS
+               if name not in (settings or {})]
+    if missing:
+        raise ValueError("Missing settings in {}: {}".format(
+            path, ', '.join(missing)))
+    if cache_path:
+        try:
+            # The cache is JSON, so that whoever can write to the state
+            # directory can't make the bot run code. Settings that JSON
+            # can't represent, such as dates or numeric keys, aren't cached.
+            cached = json.dumps({'key': key, 'settings': settings})
+            if json.loads(cached)['settings'] != settings:
+                raise ValueError
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(cached.encode('utf-8'))
+            os.rename(tmp_path, cache_path)
+        except (OSError, IOError, TypeError, ValueError):
+            # The bot still starts if the cache can't be written.
+            pass
+    return settings
+
 
 # Fetch settings from YAML file
 try:
-    with open(CONFIG_FILE, 'r') as f:
-        CONFIG = yaml.load(f)
+    CONFIG = load_config(CONFIG_FILE, CONFIG_CACHE_FILE)
 except (OSError, IOError) as e:
     print("Please configure config.yml")
     exit(1)
+except ValueError as e:
+    print(e)
+    exit(1)
 
 # File for logging. Default is STDOUT.
 LOG_FILE = CONFIG['log_file']
+# Directory the bot keeps its state in between restarts. The banned users
+# snapshot, the language cache and the reply index are kept there unless
+# their own files are configured.
+STATE_DIR = os.environ.get('COMPILEBOT_STATE_DIR') or CONFIG.get('state_dir')
+
+
+def state_file(name):
+    """Return the path of a file in the state directory, or None if there
+    is no state directory.
+    """
+    return os.path.join(STATE_DIR, name) if STATE_DIR else None
+
+# Log file writing and rotation, see logwriter.LogWriter.
+LOGGING = CONFIG.get('logging') or {}
+LOG_QUEUE_SIZE = int(LOGGING.get('queue_size', 10000))
+LOG_BATCH_SIZE = int(LOGGING.get('batch_size', 100))
+LOG_FLUSH_INTERVAL = float(LOGGING.get('flush_interval', 1))
+LOG_MAX_BYTES = int(LOGGING.get('max_bytes', 0))
+LOG_ROTATE_INTERVAL = float(LOGGING.get('rotate_interval', 0))
+LOG_BACKUP_COUNT = int(LOGGING.get('backup_count', 5))
 
 # Login credentials
 R_USERNAME = os.environ.get('COMPILEBOT_REDDIT_USER') or CONFIG['reddit_user']
@@ -26,21 +107,152 @@ R_CLIENT_ID = os.environ.get('COMPILEBOT_REDDIT_CLIENT_ID') or CONFIG['reddit_cl
 R_CLIENT_SECRET = os.environ.get('COMPILEBOT_REDDIT_CLIENT_SECRET') or CONFIG['reddit_client_secret']
 I_USERNAME = os.environ.get('COMPILEBOT_IDEONE_USER') or CONFIG['ideone_user']
 I_PASSWORD = os.environ.get('COMPILEBOT_IDEONE_PASS') or CONFIG['ideone_pass']
+# Optional local stand-in for ideone, see ideone_standin.py. Either "local"
+# or the URL of a stand-in service.
+IDEONE_STANDIN = os.environ.get('COMPILEBOT_IDEONE_STANDIN') or CONFIG.get('ideone_standin')
 USER_AGENT = os.environ.get('COMPILEBOT_USER_AGENT') or CONFIG['user_agent']
 ADMIN = os.environ.get('COMPILEBOT_ADMIN') or CONFIG['admin_user']
 SUBREDDIT = os.environ.get('COMPILEBOT_SUBREDDIT') or CONFIG['subreddit']
 
 LANG_ALIASES = {k.lower(): v for k, v in CONFIG['lang_aliases'].items()}
+# The languages ideone supports are fetched every refresh_interval seconds
+# and kept in the optional cache file, see languages.LanguageCatalog.
+LANGUAGES = CONFIG.get('languages') or {}
+LANGUAGES_REFRESH_INTERVAL = float(LANGUAGES.get('refresh_interval', 86400))
+LANGUAGES_CACHE_FILE = (os.environ.get('COMPILEBOT_LANGUAGES_CACHE_FILE') or
+                        LANGUAGES.get('cache_file') or
+                        state_file('languages.json'))
+
+# Number of worker threads that process inbox items concurrently. A value
+# of 1 processes the inbox one item at a time in a single worker thread.
+WORKER_THREADS = os.environ.get('COMPILEBOT_WORKER_THREADS') or CONFIG.get('worker_threads', 1)
+if isinstance(WORKER_THREADS, str): WORKER_THREADS = int(WORKER_THREADS)
+
+# Admin alerts are collected for a few seconds and sent as one message,
+# with at least min_interval seconds between messages.
+ALERTS = CONFIG.get('alerts') or {}
+ALERT_DELAY = float(ALERTS.get('delay', 10))
+ALERT_MIN_INTERVAL = float(ALERTS.get('min_interval', 300))
+
+# Inbox mode. "stream" processes new items as soon as they arrive, "poll"
+# checks the inbox at a fixed interval.
+INBOX = CONFIG.get('inbox') or {}
+INBOX_MODE = os.environ.get('COMPILEBOT_INBOX_MODE') or INBOX.get('mode', 'poll')
+STREAM_MIN_WAIT = float(INBOX.get('min_wait', 1))
+STREAM_MAX_WAIT = float(INBOX.get('max_wait', 16))
+
+# Ideone submission polling. See polling.PollScheduler for details.
+POLLING = CONFIG.get('polling') or {}
+POLL_INITIAL_INTERVAL = float(POLLING.get('initial_interval', 2))
+POLL_MIN_INTERVAL = float(POLLING.get('min_interval', 0.5))
+POLL_MAX_INTERVAL = float(POLLING.get('max_interval', 10))
+POLL_BACKOFF = float(POLLING.get('backoff', 1.5))
+POLL_TIMEOUT = float(POLLING.get('timeout', 120))
+
+# Cache of compile results for identical submissions.
+CACHE = CONFIG.get('cache') or {}
+CACHE_SIZE = int(CACHE.get('size', 500))
+CACHE_TTL = float(CACHE.get('ttl', 86400))
+CACHE_FILE = os.environ.get('COMPILEBOT_CACHE_FILE') or CACHE.get('file')
+CACHE_FILE_SIZE = int(CACHE.get('file_size', 20000))
+
+# Index of the bot's replies by source comment id, see
+# reply_index.ReplyIndex. It is only kept in memory if no file is given.
+REPLY_INDEX = CONFIG.get('reply_index') or {}
+REPLY_INDEX_FILE = (os.environ.get('COMPILEBOT_REPLY_INDEX_FILE') or
+                    REPLY_INDEX.get('file') or state_file('replies.db'))
+
+# Per user rate limits, per language concurrency limits and fair ordering
+# of requests. See scheduler.Scheduler for details.
+SCHEDULING = CONFIG.get('scheduling') or {}
+USER_LIMIT = int(SCHEDULING.get('user_limit', 0))
+USER_PERIOD = float(SCHEDULING.get('user_period', 600))
+LANGUAGE_LIMITS = SCHEDULING.get('language_limits') or {}
+DEFAULT_LANGUAGE_LIMIT = int(SCHEDULING.get('default_language_limit', 0))
+SHARE_INTERVAL = float(SCHEDULING.get('share_interval', 10))
+USER_WEIGHTS = SCHEDULING.get('weights') or {}
+
+# Local HTTP endpoint serving the bot's metrics at /metrics, started by
+# deploy.py. The endpoint is disabled if no port is given.
+METRICS = CONFIG.get('metrics') or {}
+METRICS_HOST = METRICS.get('host') or '127.0.0.1'
+METRICS_PORT = int(os.environ.get('COMPILEBOT_METRICS_PORT') or
+                   METRICS.get('port') or 0)
+
+# Traces of the stages of processing each inbox item are written to an
+# optional JSON lines file, see tracing.py.
+TRACING = CONFIG.get('tracing') or {}
+TRACE_FILE = os.environ.get('COMPILEBOT_TRACE_FILE') or TRACING.get('file')
+
+# Profiling started by deploy.py, see profiling.Profiler. The "window" mode
+# samples the bot for a number of seconds and the "calls" mode samples the
+# next calls of process_unread. Sending the bot SIGUSR1 starts or stops
+# profiling in the configured mode, or the window mode if it is off.
+PROFILING = CONFIG.get('profiling') or {}
+PROFILE_MODE = (os.environ.get('COMPILEBOT_PROFILE') or
+                PROFILING.get('mode') or 'off')
+PROFILE_SECONDS = float(PROFILING.get('seconds', 30))
+PROFILE_CALLS = int(PROFILING.get('calls', 10))
+PROFILE_INTERVAL = float(PROFILING.get('interval', 0.01))
+PROFILE_DIR = (PROFILING.get('directory') or
+               os.path.dirname(LOG_FILE or '') or '.')
+
+# Retries of failed API calls and circuit breakers of reddit and ideone.
+# See retry.RetryPolicy and retry.CircuitBreaker for details.
+RETRY = CONFIG.get('retry') or {}
+RETRY_BASE_DELAY = float(RETRY.get('base_delay', 2))
+RETRY_MAX_DELAY = float(RETRY.get('max_delay', 120))
+RETRY_JITTER = float(RETRY.get('jitter', 0.5))
+BREAKER_THRESHOLD = int(RETRY.get('failure_threshold', 5))
+BREAKER_RESET_TIMEOUT = float(RETRY.get('reset_timeout', 60))
+
+# Ideone rate limit and submission budgets, see quota.QuotaTracker. The
+# optional file shares the usage counters between processes and restarts.
+QUOTA = CONFIG.get('quota') or {}
+QUOTA_DAILY_BUDGET = int(QUOTA.get('daily_budget', 0))
+QUOTA_MONTHLY_BUDGET = int(QUOTA.get('monthly_budget', 0))
+QUOTA_RATE = float(QUOTA.get('rate', 0))
+QUOTA_BURST = int(QUOTA.get('burst', 5))
+QUOTA_WARN_FRACTION = float(QUOTA.get('warn_fraction', 0.8))
+QUOTA_DEGRADE_FRACTION = float(QUOTA.get('degrade_fraction', 0.95))
+QUOTA_FILE = os.environ.get('COMPILEBOT_QUOTA_FILE') or QUOTA.get('file')
+
+# Persistent queue of inbox items, see workqueue.WorkQueue. The queue is
+# kept in Redis if a URL is given, or else in a SQLite file. Inbox items are
+# processed straight from the inbox if neither is given.
+QUEUE = CONFIG.get('queue') or {}
+QUEUE_URL = os.environ.get('COMPILEBOT_QUEUE_URL') or QUEUE.get('url')
+QUEUE_FILE = os.environ.get('COMPILEBOT_QUEUE_FILE') or QUEUE.get('file')
+QUEUE_MAX_ATTEMPTS = int(QUEUE.get('max_attempts', 3))
+QUEUE_RETENTION = float(QUEUE.get('retention', 86400))
+QUEUE_LEASE = float(QUEUE.get('lease', 60))
+QUEUE_RETRY_DELAY = float(QUEUE.get('retry_delay', 30))
+# Several processes can share a queue. An "intake" process only reads
+# the inbox, "worker" processes only process queued items and a process
+# with the default role "all" does both.
+ROLE = os.environ.get('COMPILEBOT_ROLE') or QUEUE.get('role', 'all')
+WORKER_ID = os.environ.get('COMPILEBOT_WORKER_ID') or QUEUE.get('worker_id')
+if ROLE != 'all' and not (QUEUE_URL or QUEUE_FILE):
+    print("Please configure a queue URL or file for the {} role".format(ROLE))
+    exit(1)
 
 # A set of users that are banned. The banned users list is retrieved
 # in the main session but not here because it requires a reddit login.
 BANNED_USERS = set()
+# The banned users are cached, see banned.BannedUsers.
+BANNED = CONFIG.get('banned') or {}
+BANNED_REFRESH_INTERVAL = float(BANNED.get('refresh_interval', 300))
+BANNED_FULL_REFRESH_INTERVAL = float(BANNED.get('full_refresh_interval', 86400))
+BANNED_SNAPSHOT_FILE = (BANNED.get('snapshot_file') or
+                        state_file('banned.json'))
 
 # Spam Settings
 LINE_LIMIT = os.environ.get('COMPILEBOT_SPAM_LINE_LIMIT') or CONFIG['spam']['line_limit']
 CHAR_LIMIT = os.environ.get('COMPILEBOT_SPAM_CHAR_LIMIT') or CONFIG['spam']['char_limit']
 SPAM_PHRASES = os.environ.get('COMPILEBOT_SPAM_SPAM_PHRASES') or CONFIG['spam']['spam_phrases']
 IGNORE_SPAM = os.environ.get('COMPILEBOT_SPAM_IGNORE') or CONFIG['spam']['ignore']
+SPAM_PATTERNS = CONFIG['spam'].get('patterns') or []
+SPAM_SUBREDDITS = CONFIG['spam'].get('subreddits') or {}
 # Perform necessary conversions for environment variable strings
 if isinstance(LINE_LIMIT, str): LINE_LIMIT = int(LINE_LIMIT)
 if isinstance(CHAR_LIMIT, str): CHAR_LIMIT = int(CHAR_LIMIT)
@@ -63,4 +275,10 @@ ILLEGAL_ERROR_TEXT = TEXT['illegal_error_text']
 INTERNAL_ERROR_TEXT =  TEXT['internal_error_text']
 RECOMPILE_ERROR_TEXT = TEXT['recompile_error_text']
 RECOMPILE_AUTHOR_ERROR_TEXT = TEXT['recompile_author_error_text']
+RATE_LIMIT_TEXT = TEXT.get('rate_limit_text') or (
+    "You have made a lot of requests recently. Please try again in "
+    "{minutes} minutes.")
+QUOTA_TEXT = TEXT.get('quota_text') or (
+    "CompileBot has used up its ideone submissions for now. Please try "
+    "again later.")
 
@@ -1,64 +1,100 @@
 from __future__ import unicode_literals, print_function
 import time
+import signal
+import threading
 import traceback
-from requests import HTTPError, ConnectionError
 import compilebot as bot
+import config
+import lazy
+import metrics
+
+# Only needed once an error is handled, and imported by praw before then.
+requests = lazy.LazyModule('requests')
 
 SLEEP_TIME = 60
 ERROR_TIMEOUT = 60
 ERROR_LIMIT = 5
 
+def start_profiling():
+    if config.PROFILE_MODE == 'window':
+        bot.PROFILER.profile_window(config.PROFILE_SECONDS)
+    elif config.PROFILE_MODE == 'calls':
+        bot.PROFILER.profile_calls(config.PROFILE_CALLS)
+    if hasattr(signal, 'SIGUSR1'):
+        calls = config.PROFILE_CALLS if config.PROFILE_MODE == 'calls' else 0
+        # The profiler is toggled from another thread, since the signal
+        # can arrive while the main thread holds the profiler's lock.
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+            target=bot.PROFILER.toggle,
+            args=(config.PROFILE_SECONDS, calls)).start())
+
 def main():
-    errors, log_buffer = {}, []
+    errors = {}
     try:
         bot.log("Initializing bot")
+        bot.restore()
+        if config.METRICS_PORT:
+            metrics.serve(bot.METRICS, config.METRICS_HOST,
+                          config.METRICS_PORT)
+            bot.log("Serving metrics on {}:{}".format(config.METRICS_HOST,
+                                                      config.METRICS_PORT))
+        start_profiling()
         while True:
             try:
-                for error in log_buffer:
-                    bot.log(error, alert=True)
-                log_buffer = []
-                bot.main()
+                if config.ROLE == 'worker':
+                    # Workers only stop when an API error occurs.
+                    bot.work()
+                elif config.INBOX_MODE == 'stream':
+                    # Streaming only stops when an API error occurs.
+                    bot.stream()
+                else:
+                    bot.main()
                 errors = {}
                 time.sleep(SLEEP_TIME)
-            except HTTPError as e:
+            except requests.HTTPError as e:
                 # HTTP Errors may indicate reddit is overloaded.
                 # Sleep for some extra time. 
                 bot.log(str(e) + " ")
                 time.sleep(ERROR_TIMEOUT)
-            except ConnectionError as e:
+            except requests.ConnectionError as e:
                 bot.log(str(e) + " ")
                 time.sleep(ERROR_TIMEOUT)
+            except bot.retried_errors() as e:
+                # API errors that were already retried and logged, reddit
+                # or ideone may be down for a while.
+                time.sleep(ERROR_TIMEOUT)
             except Exception as e:
+                bot.ERRORS.inc(type=type(e).__name__)
                 error = str(e) or repr(e)
                 if errors.get(error):
                     errors[error] += 1
                     if errors[error] >= ERROR_LIMIT:
                         bot.log("Encounted error of type \"{}\" {} times in a row, "
                                 "bot shutting down".format(error, ERROR_LIMIT))
+                        bot.shutdown()
                         exit(1)
                     bot.log("Error running bot.main: {} ({}/{})".format(error,
                             errors[error], ERROR_LIMIT))
                 else:
                     errors[error] = 1
-                    # If another exception occurs, add the message to a buffer so
-                    # it can be sent to the admins in the try block above.
-                    # Otherwise the bot.log method may cause another error that
-                    # won't be caught.
+                    # Alerts are only queued here and sent in the background,
+                    # so logging can't raise another error. Repeated alerts
+                    # are merged into one message.
                     tb = traceback.format_exc()
                     error_msg = "Error running bot.main:\n{error}".format(
                         error=bot.code_block(tb))
-                    # Avoid adding duplicates.
-                    if len(log_buffer) == 0 or log_buffer[-1] != error_msg:
-                        log_buffer.append(error_msg)
+                    bot.log(error_msg, alert=True)
                 time.sleep(ERROR_TIMEOUT)
     except KeyboardInterrupt:
         exit_msg = ''
+        bot.shutdown()
         exit(0)
     except Exception as e:
         tb = traceback.format_exc()
         exit_msg = "Depoyment error:\n{traceback}\n".format(
             traceback=bot.code_block(tb))
         bot.log("{msg}Bot shutting down".format(msg=exit_msg), alert=True)
+        bot.shutdown()
         exit(1)
 
 if __name__ == "__main__":
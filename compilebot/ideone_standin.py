@@ -0,0 +1,304 @@
+"""
+A local stand-in for the ideone API used for load and offline testing.
+
+StandinIdeone implements the create_submission, submission_details and
+languages methods of the ideone client without running any code. Each
+submission moves through the same statuses as a real one over a
+configurable run time and finishes with a result code picked from
+configurable weights. Latency and failures can be injected into every
+call.
+
+The stand-in can also run as an HTTP service so that several bot
+processes can share it:
+
+    python ideone_standin.py --port 8089 --run-time 1 --failure-rate 0.01
+
+Set ideone_standin in config.yml to "local" to use an in-process stand-in,
+or to the URL of a running stand-in service such as
+"http://127.0.0.1:8089", to make the bot use it instead of ideone.
+"""
+from __future__ import unicode_literals, print_function, division
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+try:
+    from ideone import LanguageNotFoundError
+except ImportError:
+    # The service can run without the ideone client installed.
+    class LanguageNotFoundError(Exception):
+        def __init__(self, msg, similar_languages=()):
+            Exception.__init__(self, msg)
+            self.similar_languages = similar_languages
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+LANGUAGES = {
+    1: "C++ (gcc 4.9.2)",
+    4: "Python (python 2.7.9)",
+    10: "Java (sun-jdk-8u31)",
+    11: "C (gcc 4.9.2)",
+    44: "C++14 (gcc-5 5.1.1)",
+    56: "Node.js (0.10.35)",
+    116: "Python 3 (python 3.4.3)",
+}
+
+# Fraction of the run time a submission spends in each status before it
+# finishes with status 0. Negative statuses mean the submission is queued.
+STATUSES = [(0.2, -1), (0.5, 1), (1.0, 3)]
+
+DEFAULT_RESULTS = {15: 1}
+
+RESULT_DETAILS = {
+    11: {'cmpinfo': "prog.c:1:1: error: expected declaration"},
+    12: {'stderr': "Traceback (most recent call last):\nRuntimeError",
+         'signal': 6},
+    13: {'output': ''},
+    17: {'output': ''},
+    19: {'stderr': "Permission denied"},
+    20: {'output': ''},
+}
+
+
+class StandinIdeone(object):
+
+    """An in-process stand-in for the ideone client.
+
+    Keyword arguments:
+    latency -- seconds every call takes
+    run_time -- average seconds until a submission finishes
+    results -- dict of result codes to relative weights
+    failure_rate -- fraction of calls that fail with a socket error
+    languages -- dict of ideone language ids to names
+    seed -- seed for the random number generator
+    """
+
+    def __init__(self, latency=0.0, run_time=1.0, results=None,
+                 failure_rate=0.0, languages=None, seed=None,
+                 clock=time.time, sleep=time.sleep):
+        self.latency = latency
+        self.run_time = run_time
+        self.results = results or DEFAULT_RESULTS
+        self.failure_rate = failure_rate
+        self.language_names = languages or LANGUAGES
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random.Random(seed)
+        self.submissions = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create_submission(self, source, language_name=None, std_input=''):
+        self._call()
+        lang_id, lang_name = self._find_language(language_name)
+        # Run times vary by up to half of the average in either direction.
+        run_time = self.run_time * self.random.uniform(0.5, 1.5)
+        result = self._pick_result()
+        with self._lock:
+            link = "s{:05d}".format(len(self.submissions))
+            self.submissions[link] = {
+                'source': source,
+                'input': std_input,
+                'langId': lang_id,
+                'langName': lang_name.split('(')[0].strip(),
+                'langVersion': lang_name.split('(')[-1].rstrip(')'),
+                'created': self.clock(),
+                'run_time': run_time,
+                'result': result,
+            }
+        return {'error': 'OK', 'link': link}
+
+    def submission_details(self, link):
+        self._call()
+        with self._lock:
+            sub = dict(self.submissions[link])
+        elapsed = self.clock() - sub['created']
+        details = {
+            'error': 'OK',
+            'langId': sub['langId'],
+            'langName': sub['langName'],
+            'langVersion': sub['langVersion'],
+            'source': sub['source'],
+            'input': sub['input'],
+            'public': True,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S',
+                                  time.localtime(sub['created'])),
+            'status': 0,
+            'result': 0,
+            'time': 0,
+            'memory': 0,
+            'signal': 0,
+            'output': '',
+            'stderr': '',
+            'cmpinfo': '',
+        }
+        for fraction, status in STATUSES:
+            if elapsed < sub['run_time'] * fraction:
+                details['status'] = status
+                return details
+        details['result'] = sub['result']
+        details['time'] = round(sub['run_time'], 2)
+        details['memory'] = 3136
+        details['output'] = sub['input'] or "Hello World\n"
+        details.update(RESULT_DETAILS.get(sub['result'], {}))
+        return details
+
+    def languages(self):
+        self._call()
+        return dict(self.language_names)
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            self.sleep(self.latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise socket.error("Connection reset by ideone stand-in")
+
+    def _find_language(self, name):
+        name = (name or '').lower()
+        similar = []
+        for lang_id, full_name in self.language_names.items():
+            simple_name = full_name.split('(')[0].strip().lower()
+            if name in (simple_name, full_name.lower()):
+                return lang_id, full_name
+            if name and (name in simple_name or simple_name in name):
+                similar.append(full_name.split('(')[0].strip())
+        raise LanguageNotFoundError(
+            "Language {} not found".format(name), sorted(similar))
+
+    def _pick_result(self):
+        total = sum(self.results.values())
+        n = self.random.uniform(0, total)
+        for code, weight in sorted(self.results.items()):
+            n -= weight
+            if n <= 0:
+                return code
+        return code
+
+
+class RemoteIdeone(object):
+
+    """A client of a stand-in service started with serve()."""
+
+    def __init__(self, url):
+        # Imported here so the service itself doesn't need requests.
+        import requests
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def create_submission(self, source, language_name=None, std_input=''):
+        return self._call('create_submission', source=source,
+                          language_name=language_name, std_input=std_input)
+
+    def submission_details(self, link):
+        return self._call('submission_details', link=link)
+
+    def languages(self):
+        # JSON object keys are always strings.
+        return dict((int(k), v) for k, v in self._call('languages').items())
+
+    def _call(self, method, **kwargs):
+        response = self.session.post('{}/{}'.format(self.url, method),
+                                     data=json.dumps(kwargs))
+        data = response.json()
+        if 'language_error' in data:
+            error = data['language_error']
+            raise LanguageNotFoundError(error['message'], error['similar'])
+        if 'error' in data and response.status_code != 200:
+            raise socket.error(data['error'])
+        return data
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+
+    """Handles JSON POST requests to /<method> of the stand-in."""
+
+    methods = ('create_submission', 'submission_details', 'languages')
+
+    def do_POST(self):
+        method = self.path.strip('/')
+        if method not in self.methods:
+            return self._respond(404, {'error': "Unknown method"})
+        length = int(self.headers.get('Content-Length') or 0)
+        kwargs = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+        kwargs = dict((str(k), v) for k, v in kwargs.items())
+        try:
+            result = getattr(self.server.ideone, method)(**kwargs)
+        except LanguageNotFoundError as e:
+            return self._respond(200, {'language_error': {
+                'message': str(e), 'similar': e.similar_languages}})
+        except (socket.error, KeyError) as e:
+            return self._respond(500, {'error': repr(e)})
+        self._respond(200, result)
+
+    def _respond(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandinServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    protocol_version = 'HTTP/1.1'
+
+
+def serve(ideone, host='127.0.0.1', port=8089):
+    """Return a server for a stand-in. Call serve_forever() on the
+    returned server to start handling requests.
+    """
+    StandinHandler.protocol_version = StandinServer.protocol_version
+    server = StandinServer((host, port), StandinHandler)
+    server.ideone = ideone
+    return server
+
+
+def parse_results(text):
+    """Parse result weights such as "15=90,11=5,13=5"."""
+    results = {}
+    for pair in text.split(','):
+        code, weight = pair.split('=')
+        results[int(code)] = float(weight)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a local stand-in for the ideone API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds every call takes")
+    parser.add_argument('--run-time', type=float, default=1.0,
+                        help="average seconds until a submission finishes")
+    parser.add_argument('--results', type=parse_results, default=None,
+                        help="result code weights, e.g. 15=90,11=5,13=5")
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help="fraction of calls that fail")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    ideone = StandinIdeone(latency=args.latency, run_time=args.run_time,
+                           results=args.results,
+                           failure_rate=args.failure_rate, seed=args.seed)
+    server = serve(ideone, args.host, args.port)
+    print("Ideone stand-in listening on http://{}:{}".format(args.host,
+                                                             args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+A local catalog of the languages ideone supports.
+
+Ideone only reports an unknown language after a submission was sent, so
+the catalog keeps the list of languages and an index of their names and
+aliases, which lets the bot turn away an unknown language with
+suggestions before submitting anything. The list is fetched again once a
+day or so and can be saved to a cache file, which script/lang_table.py
+reads as well.
+
+Languages are matched the way ideone matches them: by their full name,
+such as "Python (python 2.7.9)", or by the name before the version, such
+as "Python", ignoring case.
+"""
+from __future__ import unicode_literals, print_function
+import os
+import json
+import time
+import difflib
+import threading
+
+
+def simple_name(name):
+    """Return the name of a language without its version."""
+    return name.split('(')[0].strip()
+
+
+def normalize(name):
+    """Return a name in lowercase with single spaces."""
+    return ' '.join(name.lower().split())
+
+
+class LanguageCatalog(object):
+
+    """Keeps the languages ideone supports and an index of their names.
+
+    Keyword arguments:
+    fetch -- function that returns a dict of ideone language ids and
+        names, or None on failure
+    aliases -- optional dict of aliases and the language names they
+        stand for
+    refresh_interval -- seconds between fetches of the languages
+    cache_file -- optional JSON file the languages are saved to
+    """
+
+    def __init__(self, fetch, aliases=None, refresh_interval=86400,
+                 cache_file=None, clock=time.time):
+        self.fetch = fetch
+        self.aliases = dict((normalize(k), v)
+                            for k, v in (aliases or {}).items())
+        self.refresh_interval = refresh_interval
+        self.cache_file = cache_file
+        self.clock = clock
+        self.languages = {}
+        self.updated = 0
+        self._index = {}
+        self._choices = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Restore the languages from the cache file if there is one and
+        return them, or None if no cache was loaded.
+        """
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+        except ValueError:
+            # A corrupt cache is ignored and replaced on the next save.
+            return None
+        self.update(dict((int(k), v) for k, v in cache['languages'].items()),
+                    cache['updated'])
+        return self.languages
+
+    def save(self):
+        """Write the languages to the cache file."""
+        if not self.cache_file or not self.languages:
+            return
+        cache = {'languages': self.languages, 'updated': self.updated}
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f, sort_keys=True)
+        os.rename(tmp_file, self.cache_file)
+
+    def refresh(self, force=False):
+        """Fetch the languages if they are due for a refresh and return
+        them. Only one thread fetches the languages at a time, the others
+        keep using the current ones.
+        """
+        now = self.clock()
+        if not force and now - self.updated < self.refresh_interval:
+            return self.languages
+        if not self._lock.acquire(False):
+            return self.languages
+        try:
+            # A failed fetch is only tried again after the interval.
+            self.updated = now
+            languages = self.fetch()
+            if languages:
+                self.update(languages, now)
+                self.save()
+        finally:
+            self._lock.release()
+        return self.languages
+
+    def update(self, languages, updated):
+        """Replace the languages and rebuild the index of their names."""
+        index = {}
+        for lang_id, name in sorted(languages.items()):
+            index.setdefault(normalize(name), name)
+            index.setdefault(normalize(simple_name(name)), name)
+        for alias, target in self.aliases.items():
+            if normalize(target) in index:
+                index.setdefault(alias, index[normalize(target)])
+        self._index = index
+        self._choices = dict((simple_name(name).lower(), simple_name(name))
+                             for name in languages.values())
+        self.languages = dict(languages)
+        self.updated = updated
+
+    def resolve(self, name):
+        """Return the full name of the language a name or alias stands for,
+        or None if it isn't in the catalog.
+        """
+        return self._index.get(normalize(name))
+
+    def suggest(self, name, count=5):
+        """Return the names of up to count languages similar to a name."""
+        matches = difflib.get_close_matches(normalize(name),
+                                            sorted(self._choices),
+                                            n=count, cutoff=0.5)
+        return [self._choices[match] for match in matches]
@@ -0,0 +1,55 @@
+"""
+Deferred imports of modules that are slow to import.
+
+praw, prawcore and ideone pull in requests and a SOAP client and take a
+good part of the bot's start up time, while nothing of theirs is needed
+until the first call to reddit or ideone. A LazyModule stands in for a
+module and imports it the first time one of its attributes is used:
+
+    praw = lazy.LazyModule('praw')
+    ...
+    reddit = praw.Reddit(...)  # praw is imported here
+"""
+from __future__ import unicode_literals, print_function
+import sys
+import importlib
+import threading
+
+# Imports aren't thread safe in every case, one module is loaded at a time.
+_LOCK = threading.RLock()
+
+
+class LazyModule(object):
+
+    """A module that is only imported when one of its attributes is used.
+
+    Keyword arguments:
+    name -- the name of the module
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self):
+        """True if the module has been imported, by any importer."""
+        return (self._module is not None or
+                sys.modules.get(self._name) is not None)
+
+    def load(self):
+        """Import the module if it isn't imported yet and return it."""
+        module = self._module
+        if module is None:
+            with _LOCK:
+                if self._module is None:
+                    self._module = importlib.import_module(str(self._name))
+                module = self._module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return "<lazy module '{}' ({})>".format(self._name, state)
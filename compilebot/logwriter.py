@@ -0,0 +1,149 @@
+"""
+A log file writer that keeps disk I/O off the threads that log messages.
+Lines are put on a bounded in-memory queue and written to the log file in
+batches by a background thread, which also rotates the log file by size
+or age.
+"""
+from __future__ import unicode_literals, print_function
+import os
+import sys
+import time
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class LogWriter(object):
+
+    """Appends lines to a log file from a background thread.
+
+    Keyword arguments:
+    path -- the log file
+    queue_size -- the maximum number of lines waiting to be written. Lines
+        logged while the queue is full are dropped and counted.
+    batch_size -- the maximum number of lines written at once
+    flush_interval -- the longest time in seconds a line waits before
+        it is written
+    max_bytes -- rotate the log once it grows past this size (0 to disable)
+    rotate_interval -- rotate the log after this many seconds (0 to disable)
+    backup_count -- the number of rotated log files that are kept
+    """
+
+    def __init__(self, path, queue_size=10000, batch_size=100,
+                 flush_interval=1.0, max_bytes=0, rotate_interval=0,
+                 backup_count=5, clock=time.time):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.clock = clock
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._closed = False
+        self._file = None
+        self._opened = None
+        self._thread = threading.Thread(target=self._run, name='LogWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, line):
+        """Queue a line (bytes, including the line break) to be written."""
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until every queued line has been written to disk."""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Write any queued lines and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        # The writer thread stops when it receives None.
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = [line for line in batch if line is not None]
+            try:
+                self._write(lines)
+            except (IOError, OSError) as e:
+                # Keep running so logging resumes once the disk recovers.
+                print("Unable to write to log file: {}".format(e),
+                      file=sys.stderr)
+            finally:
+                for item in batch:
+                    self._queue.task_done()
+            if stop:
+                self._close_file()
+                return
+
+    def _write(self, lines):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            lines.append("{}: {} log messages dropped\n".format(
+                time.strftime('%y-%m-%d %H:%M:%S', time.localtime()),
+                dropped).encode('utf8'))
+        if not lines:
+            return
+        data = b''.join(lines)
+        if self._file is None:
+            self._open_file()
+        if self._should_rotate(len(data)):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def _open_file(self):
+        self._file = open(self.path, 'ab')
+        self._file.seek(0, os.SEEK_END)
+        self._opened = self.clock()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _should_rotate(self, size):
+        written = self._file.tell()
+        if not written:
+            return False
+        if self.max_bytes and written + size > self.max_bytes:
+            return True
+        return bool(self.rotate_interval and
+                    self.clock() - self._opened >= self.rotate_interval)
+
+    def _rotate(self):
+        self._close_file()
+        # log.2 becomes log.3, log.1 becomes log.2 and log becomes log.1.
+        for n in range(self.backup_count - 1, 0, -1):
+            src = "{}.{}".format(self.path, n)
+            if os.path.exists(src):
+                os.rename(src, "{}.{}".format(self.path, n + 1))
+        if self.backup_count > 0:
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self._open_file()
@@ -0,0 +1,258 @@
+"""
+Counters, gauges and histograms describing what the bot is doing, and a
+small HTTP server that exposes them in the Prometheus text format.
+
+Metrics are created from a Registry and updated by the bot as it works.
+Values that are already kept elsewhere, such as the size of the work
+queue, can be computed by a function each time the metrics are read
+instead of being updated.
+"""
+from __future__ import unicode_literals, print_function, division
+import time
+import threading
+from contextlib import contextmanager
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+# Bucket upper bounds in seconds, from quick parses to slow ideone runs.
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120,
+                   300, float('inf'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+class Metric(object):
+
+    """A named metric with a value for each combination of label values.
+
+    Keyword arguments:
+    name -- the name of the metric
+    help -- a description of the metric
+    labels -- the names of the metric's labels
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set_function(self, function):
+        """Compute the values of the metric with a function each time the
+        metric is read. The function returns a value, or for a metric with
+        labels a dict of tuples of label values and values.
+        """
+        self._function = function
+
+    def value(self, **labels):
+        """Return the value for some label values."""
+        key = self._key(labels)
+        return self.values().get(key, 0)
+
+    def values(self):
+        """Return a dict of tuples of label values and values."""
+        if self._function is not None:
+            values = self._function()
+            if not isinstance(values, dict):
+                values = {(): values}
+            return dict((tuple('{}'.format(v) for v in key), value)
+                        for key, value in values.items())
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        """Return a list of (name, label dict, value) tuples."""
+        return [(self.name, dict(zip(self.labels, key)), value)
+                for key, value in sorted(self.values().items())]
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError("{} takes labels {}".format(
+                self.name, ', '.join(self.labels)))
+        return tuple('{}'.format(labels[name]) for name in self.labels)
+
+
+class Counter(Metric):
+
+    """A count that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+
+    """A value that can go up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+
+    """Counts of observed values, such as durations, in buckets.
+
+    Keyword arguments:
+    buckets -- the upper bounds of the buckets, ending with infinity
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS,
+                 clock=time.time):
+        Metric.__init__(self, name, help, labels)
+        self.buckets = tuple(buckets)
+        if self.buckets[-1] != float('inf'):
+            self.buckets += (float('inf'),)
+        self.clock = clock
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0))
+            counts = [count + (value <= bound) for count, bound in
+                      zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the number of seconds a with block takes."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(self.clock() - start, **labels)
+
+    def count(self, **labels):
+        """Return the number of observed values."""
+        with self._lock:
+            counts, total = self._values.get(self._key(labels), ([0], 0))
+        return counts[-1]
+
+    def samples(self):
+        samples = []
+        for key, (counts, total) in sorted(self.values().items()):
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                bucket = dict(labels, le=format_value(bound))
+                samples.append((self.name + '_bucket', bucket, count))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, counts[-1]))
+        return samples
+
+
+class Registry(object):
+
+    """The metrics of the bot, by name."""
+
+    def __init__(self):
+        self.metrics = []
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._names:
+                raise ValueError("Duplicate metric {}".format(metric.name))
+            self._names.add(metric.name)
+            self.metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                if labels:
+                    name += '{' + ','.join(
+                        '{}="{}"'.format(k, escape(v))
+                        for k, v in sorted(labels.items())) + '}'
+                lines.append('{} {}'.format(name, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    """Serves the metrics of the server's registry at /metrics."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = self.server.registry.exposition().encode('utf-8')
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(registry, host='127.0.0.1', port=9108):
+    """Start serving the metrics of a registry from a background thread
+    and return the server. Call shutdown() on the server to stop it.
+    """
+    server = MetricsServer((host, port), MetricsHandler)
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever,
+                              name='MetricsServer')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,120 @@
+"""
+Scheduling for ideone submission status polls. Instead of polling every
+submission at a fixed rate, the scheduler learns how long submissions
+typically take for each language, waits about that long before the first
+poll and then backs off exponentially until the submission finishes or
+the deadline passes.
+"""
+from __future__ import unicode_literals, print_function, division
+import time
+import threading
+
+
+class PollTimeoutError(Exception):
+
+    """Raised when a submission doesn't finish before its deadline."""
+
+    def __init__(self, polls, elapsed):
+        Exception.__init__(self, "Submission did not finish after {} polls "
+                                 "({:.1f} seconds)".format(polls, elapsed))
+        self.polls = polls
+        self.elapsed = elapsed
+
+
+class PollStats(object):
+
+    """Poll count and time spent waiting on a single submission."""
+
+    def __init__(self, polls, elapsed):
+        self.polls = polls
+        self.elapsed = elapsed
+
+
+class PollScheduler(object):
+
+    """Decides when to poll a submission and keeps track of how long
+    submissions take for each language. A single scheduler is shared by
+    every worker so that the learned run times are shared as well.
+
+    Keyword arguments:
+    initial_interval -- delay before the first poll of a language that
+        has no recorded run times yet
+    min_interval -- the shortest delay between two polls
+    max_interval -- the longest delay between two polls
+    backoff -- factor the delay grows by after each unfinished poll
+    timeout -- seconds after which a submission is abandoned
+    smoothing -- weight given to the latest run time when updating the
+        estimate for a language (0 to 1)
+    """
+
+    def __init__(self, initial_interval=2, min_interval=0.5, max_interval=10,
+                 backoff=1.5, timeout=120, smoothing=0.3,
+                 clock=time.time, sleep=time.sleep):
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.smoothing = smoothing
+        self.clock = clock
+        self.sleep = sleep
+        self.estimates = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def first_delay(self, lang):
+        """Return how long to wait before polling a new submission."""
+        with self._lock:
+            estimate = self.estimates.get(lang, self.initial_interval)
+        return max(self.min_interval, min(estimate, self.max_interval))
+
+    def poll(self, lang, check, deadline=None):
+        """Call check() on a schedule until it returns something other than
+        None and return that value along with the PollStats of the wait.
+        PollTimeoutError is raised once the scheduler's timeout or the
+        optional absolute deadline (a clock() timestamp) is reached.
+        """
+        start = self.clock()
+        end = start + self.timeout
+        if deadline is not None:
+            end = min(end, deadline)
+        delay = self.first_delay(lang)
+        polls = 0
+        while True:
+            remaining = end - self.clock()
+            if remaining <= 0:
+                elapsed = self.clock() - start
+                self._record(lang, polls, elapsed, timed_out=True)
+                raise PollTimeoutError(polls, elapsed)
+            self.sleep(min(delay, remaining))
+            polls += 1
+            result = check()
+            if result is not None:
+                elapsed = self.clock() - start
+                self._record(lang, polls, elapsed)
+                return result, PollStats(polls, elapsed)
+            delay = max(self.min_interval,
+                        min(delay * self.backoff, self.max_interval))
+
+    def _record(self, lang, polls, elapsed, timed_out=False):
+        with self._lock:
+            stats = self.stats.setdefault(lang, {
+                'submissions': 0, 'polls': 0, 'wait': 0.0, 'timeouts': 0})
+            stats['submissions'] += 1
+            stats['polls'] += polls
+            stats['wait'] += elapsed
+            if timed_out:
+                stats['timeouts'] += 1
+                return
+            # A submission that finished on the first poll may have
+            # finished well before it, so the estimate is allowed to
+            # shrink by counting only half of the wait.
+            if polls == 1:
+                elapsed /= 2
+            # Exponentially weighted moving average of the run time.
+            previous = self.estimates.get(lang)
+            if previous is None:
+                self.estimates[lang] = elapsed
+            else:
+                self.estimates[lang] = (self.smoothing * elapsed +
+                                        (1 - self.smoothing) * previous)
@@ -0,0 +1,212 @@
+"""
+Opt-in sampling profiler for finding out where the bot spends its CPU
+time in production.
+
+While profiling, a background thread takes samples of the stacks of the
+bot's threads at a fixed interval. Profiling runs either for a time
+window or for the next few calls of a function such as process_unread,
+in which case only the threads running those calls are sampled. The
+samples are written in the collapsed stack format, one line per stack
+with its sample count, which flamegraph.pl and speedscope can read:
+
+    flamegraph.pl profile-20150101-120000-123.collapsed > profile.svg
+
+Nothing is sampled while profiling is off, and checking whether a call
+should be profiled is a single attribute lookup.
+"""
+from __future__ import unicode_literals, print_function
+import io
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+def collapse(frame):
+    """Return the stack of a frame as frame names from the outermost frame
+    in, separated by semicolons.
+    """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(object):
+
+    """Counts the stacks of running threads, sampled from a background
+    thread.
+
+    Keyword arguments:
+    interval -- seconds between samples
+    threads -- optional function returning the idents of the threads to
+        sample, every thread by default
+    """
+
+    def __init__(self, interval=0.01, threads=None):
+        self.interval = interval
+        self.threads = threads
+        self.counts = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name='StackSampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and return the stack counts."""
+        self._stopped.set()
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        return self.counts
+
+    def sample(self):
+        """Take a single sample of the stacks of the threads."""
+        wanted = self.threads() if self.threads else None
+        own = threading.current_thread().ident
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (wanted is not None and ident not in wanted):
+                continue
+            # Stacks are grouped by thread name, without the worker number.
+            thread = names.get(ident, 'thread').split('-')[0]
+            self.counts[thread + ';' + collapse(frame)] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """Return the stack counts in the collapsed stack format."""
+        return ''.join("{} {}\n".format(stack, count)
+                       for stack, count in sorted(self.counts.items()))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.sample()
+            self._stopped.wait(self.interval)
+
+
+class Profiler(object):
+
+    """Profiles the bot for a time window or the next calls of a function
+    and writes the samples to a file.
+
+    Keyword arguments:
+    directory -- the directory profiles are written to
+    interval -- seconds between samples
+    on_write -- optional function called with the path and the number of
+        samples of each profile that is written
+    """
+
+    def __init__(self, directory='.', interval=0.01, on_write=None):
+        self.directory = directory
+        self.interval = interval
+        self.on_write = on_write
+        # True while the next calls are being profiled. Checked on every
+        # profiled call, so it is a plain attribute.
+        self.counting = False
+        self._sampler = None
+        self._timer = None
+        self._calls_left = 0
+        self._tracked = set()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self._sampler is not None
+
+    def profile_window(self, seconds):
+        """Sample every thread for a number of seconds. Returns False if
+        profiling is already running.
+        """
+        with self._lock:
+            if self.active:
+                return False
+            self._start(StackSampler(self.interval))
+            self._timer = threading.Timer(seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+            return True
+
+    def profile_calls(self, count):
+        """Sample the threads running the next count profiled calls.
+        Returns False if profiling is already running.
+        """
+        with self._lock:
+            if self.active:
+                return False
+            self._calls_left = count
+            self._tracked = set()
+            self._start(StackSampler(self.interval,
+                                     threads=lambda: self._tracked))
+            self.counting = True
+            return True
+
+    @contextmanager
+    def call(self):
+        """Profile the thread running a with block if the next calls are
+        being profiled.
+        """
+        ident = threading.current_thread().ident
+        with self._lock:
+            tracked = self.counting and self._calls_left > 0
+            if tracked:
+                self._calls_left -= 1
+                self._tracked = self._tracked | set([ident])
+        try:
+            yield
+        finally:
+            if tracked:
+                with self._lock:
+                    self._tracked = self._tracked - set([ident])
+                    finished = not self._calls_left and not self._tracked
+                if finished:
+                    self.stop()
+
+    def toggle(self, seconds, calls=0):
+        """Stop profiling if it is running, or else profile the next calls
+        if calls is given or a time window of seconds.
+        """
+        if self.active:
+            self.stop()
+        elif calls:
+            self.profile_calls(calls)
+        else:
+            self.profile_window(seconds)
+
+    def stop(self):
+        """Stop profiling and write the samples. Returns the path of the
+        profile, or None if profiling wasn't running.
+        """
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+            self.counting = False
+            self._calls_left = 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if sampler is None:
+            return None
+        sampler.stop()
+        path = os.path.join(self.directory, 'profile-{}-{}.collapsed'.format(
+            time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(sampler.collapsed())
+        if self.on_write:
+            self.on_write(path, sampler.samples)
+        return path
+
+    def _start(self, sampler):
+        self._sampler = sampler
+        sampler.start()
@@ -0,0 +1,221 @@
+"""
+Tracking of the bot's use of its ideone submission quota. Every
+submission is counted against optional daily and monthly budgets, and
+the counters are kept in a SQLite file so that they survive restarts and
+are shared by every process using the same file. Requests to ideone are
+also rate limited with a token bucket, so a burst of mentions can't
+flood the API. The bucket is kept in the same file, so the rate limit
+applies to all of those processes together.
+"""
+from __future__ import unicode_literals, print_function, division
+import time
+import sqlite3
+import threading
+
+
+class QuotaExceededError(Exception):
+
+    """Raised when a submission would exceed a budget."""
+
+    def __init__(self, period, used, budget):
+        Exception.__init__(self, "The {} budget of {} submissions is used "
+                           "up ({} used)".format(period, budget, used))
+        self.period = period
+        self.used = used
+        self.budget = budget
+
+
+class QuotaDegradedError(QuotaExceededError):
+
+    """Raised when a submission is refused because a budget is nearly
+    used up.
+    """
+
+    def __init__(self, period, used, budget):
+        Exception.__init__(self, "{} of the {} budget of {} submissions "
+                           "are used, only cached results are "
+                           "returned".format(used, period, budget))
+        self.period = period
+        self.used = used
+        self.budget = budget
+
+
+class QuotaTracker(object):
+
+    """Counts submissions and API calls against daily and monthly budgets.
+
+    Keyword arguments:
+    daily_budget -- submissions allowed per UTC day (0 for no limit)
+    monthly_budget -- submissions allowed per UTC month (0 for no limit)
+    rate -- API calls allowed per second (0 for no limit)
+    burst -- API calls that can be made at once before the rate applies
+    warn_fraction -- on_warning is called once per period when this
+        fraction of a budget is used
+    degrade_fraction -- degraded() returns True and check_degraded()
+        raises QuotaDegradedError once this fraction of a budget is used
+    path -- optional SQLite file the counters are kept in
+    on_warning -- optional function called with a warning message
+    """
+
+    def __init__(self, daily_budget=0, monthly_budget=0, rate=0, burst=5,
+                 warn_fraction=0.8, degrade_fraction=0.95, path=None,
+                 on_warning=None, clock=time.time, sleep=time.sleep):
+        self.budgets = {'daily': daily_budget, 'monthly': monthly_budget}
+        self.warn_fraction = warn_fraction
+        self.degrade_fraction = degrade_fraction
+        self.on_warning = on_warning
+        self.clock = clock
+        self.sleep = sleep
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ':memory:', timeout=30,
+                                   check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS usage ("
+                         "period TEXT PRIMARY KEY, submissions INTEGER, "
+                         "calls INTEGER, warned INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS bucket ("
+                         "id INTEGER PRIMARY KEY, tokens REAL, "
+                         "updated REAL)")
+        self._db.commit()
+
+    def acquire(self):
+        """Wait until another API call is allowed by the rate limit and
+        count it.
+        """
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            self.sleep(wait)
+
+    def _take(self):
+        # Takes a token from the bucket and counts the call, or returns the
+        # number of seconds until there is a token. The bucket is read and
+        # updated in one write transaction, so that two processes can't
+        # both take the last token.
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.rate:
+                    now = self.clock()
+                    row = self._db.execute("SELECT tokens, updated FROM "
+                                           "bucket WHERE id = 0").fetchone()
+                    tokens, updated = row or (self.burst, now)
+                    tokens = min(self.burst, tokens + max(0, now - updated) *
+                                 self.rate)
+                    if tokens < 1:
+                        self._db.execute("INSERT OR REPLACE INTO bucket "
+                                         "VALUES (0, ?, ?)", (tokens, now))
+                        self._db.commit()
+                        return (1 - tokens) / self.rate
+                    self._db.execute("INSERT OR REPLACE INTO bucket "
+                                     "VALUES (0, ?, ?)", (tokens - 1, now))
+                for name, period in self._periods():
+                    self._db.execute("INSERT OR IGNORE INTO usage "
+                                     "VALUES (?, 0, 0, 0)", (period,))
+                    self._db.execute("UPDATE usage SET calls = calls + 1 "
+                                     "WHERE period = ?", (period,))
+            except:
+                self._db.rollback()
+                raise
+            self._db.commit()
+        return 0
+
+    def reserve(self):
+        """Count a submission against the budgets. Raises
+        QuotaExceededError if a budget is used up.
+        """
+        warnings = []
+        with self._lock:
+            # The budgets are checked and counted in one write transaction,
+            # so that two processes can't both take the last submission.
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                periods = self._periods()
+                for name, period in periods:
+                    used = self._used(period)
+                    if self.budgets[name] and used >= self.budgets[name]:
+                        raise QuotaExceededError(name, used,
+                                                 self.budgets[name])
+                for name, period in periods:
+                    self._db.execute("INSERT OR IGNORE INTO usage "
+                                     "VALUES (?, 0, 0, 0)", (period,))
+                    self._db.execute("UPDATE usage SET submissions = "
+                                     "submissions + 1 WHERE period = ?",
+                                     (period,))
+                    budget = self.budgets[name]
+                    if (budget and self._used(period) >=
+                            budget * self.warn_fraction):
+                        # Only the first process to pass the threshold
+                        # warns.
+                        cursor = self._db.execute(
+                            "UPDATE usage SET warned = 1 WHERE period = ? "
+                            "AND warned = 0", (period,))
+                        if cursor.rowcount:
+                            warnings.append(
+                                "{:.0%} of the {} ideone budget of {} "
+                                "submissions is used".format(
+                                    self._used(period) / budget, name,
+                                    budget))
+            except:
+                self._db.rollback()
+                raise
+            self._db.commit()
+        if self.on_warning:
+            for warning in warnings:
+                self.on_warning(warning)
+
+    def release(self):
+        """Take back a reserved submission that wasn't made."""
+        with self._lock:
+            for name, period in self._periods():
+                self._db.execute("UPDATE usage SET submissions = "
+                                 "submissions - 1 WHERE period = ? AND "
+                                 "submissions > 0", (period,))
+            self._db.commit()
+
+    def degraded(self):
+        """Return True if a budget is nearly used up and only cached
+        results should be returned.
+        """
+        return self._degraded_budget() is not None
+
+    def check_degraded(self):
+        """Raise QuotaDegradedError if a budget is nearly used up."""
+        degraded = self._degraded_budget()
+        if degraded is not None:
+            raise QuotaDegradedError(*degraded)
+
+    def _degraded_budget(self):
+        with self._lock:
+            for name, period in self._periods():
+                budget = self.budgets[name]
+                used = self._used(period)
+                if budget and used >= budget * self.degrade_fraction:
+                    return name, used, budget
+        return None
+
+    def usage(self):
+        """Return a dict of the submissions and calls made in the current
+        day and month and the budgets.
+        """
+        usage = {}
+        with self._lock:
+            for name, period in self._periods():
+                row = self._db.execute(
+                    "SELECT submissions, calls FROM usage WHERE period = ?",
+                    (period,)).fetchone() or (0, 0)
+                usage[name] = {'submissions': row[0], 'calls': row[1],
+                               'budget': self.budgets[name]}
+        return usage
+
+    def _periods(self):
+        now = time.gmtime(self.clock())
+        return [('daily', time.strftime('day:%Y-%m-%d', now)),
+                ('monthly', time.strftime('month:%Y-%m', now))]
+
+    def _used(self, period):
+        row = self._db.execute("SELECT submissions FROM usage "
+                               "WHERE period = ?", (period,)).fetchone()
+        return row[0] if row else 0
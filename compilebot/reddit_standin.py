@@ -0,0 +1,312 @@
+"""
+A local stand-in for the parts of a PRAW reddit session the bot uses,
+for testing and measuring the bot without a reddit account.
+
+StandinReddit holds an inbox of comments and messages and records every
+reply, edit, message and mark-read call made through it as an Action.
+Items can be given an arrival time so that the inbox fills up over time,
+and mention_burst() generates the arrival times of mentions in a thread
+that suddenly gets popular: most mentions arrive right after the thread
+takes off and fewer arrive as it cools down.
+
+    r = reddit_standin.StandinReddit('CompileBot')
+    reddit_standin.mention_burst(r, bodies, count=500, duration=60)
+    compilebot.process_inbox(r.inbox.unread(), r)
+    replies = r.find_actions('reply')
+"""
+from __future__ import unicode_literals, print_function, division
+import math
+import time
+import random
+import socket
+import itertools
+import threading
+from collections import namedtuple
+
+# Every call that goes through the stand-in is recorded as an Action. The
+# target is the id of a comment or message, or the name of a redditor or
+# subreddit a message was sent to.
+Action = namedtuple('Action', ['time', 'action', 'target', 'text'])
+
+ModAction = namedtuple('ModAction', ['created_utc', 'action', 'target_author'])
+
+
+class StandinReddit(object):
+
+    """An in-process stand-in for a PRAW reddit session.
+
+    Keyword arguments:
+    username -- the name of the bot's account
+    latency -- seconds every call takes
+    failure_rate -- fraction of calls that fail with a socket error
+    seed -- seed for the random number generator
+    """
+
+    def __init__(self, username='CompileBot', latency=0.0, failure_rate=0.0,
+                 seed=None, clock=time.time, sleep=time.sleep):
+        self.username = username
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random.Random(seed)
+        self.inbox = Inbox(self)
+        self.actions = []
+        self.comments = {}
+        self.banned_users = set()
+        self.modlog = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_comment(self, body, author, parent=None, subreddit='test',
+                    arrival=None, mention=True):
+        """Add a comment and return it. Comments that mention the bot are
+        put in the inbox and become unread at their arrival time.
+        """
+        submission = parent.submission if parent else Submission(
+            self._new_id(), subreddit)
+        comment = Comment(self, self._new_id(), body, author, submission)
+        if parent:
+            parent.replies.append(comment)
+        with self._lock:
+            self.comments[comment.id] = comment
+        if mention:
+            self.inbox.add(comment, arrival)
+        return comment
+
+    def add_message(self, body, author, arrival=None):
+        """Add a private message to the inbox and return it."""
+        message = Message(self, self._new_id(), body, author)
+        self.inbox.add(message, arrival)
+        return message
+
+    def ban(self, name):
+        self.banned_users.add(name)
+        self.modlog.append(ModAction(self.clock(), 'banuser', name))
+
+    def unban(self, name):
+        self.banned_users.discard(name)
+        self.modlog.append(ModAction(self.clock(), 'unbanuser', name))
+
+    def comment(self, id):
+        self.call()
+        return self.comments[id]
+
+    def redditor(self, name):
+        return Redditor(self, name)
+
+    def subreddit(self, name):
+        return Subreddit(self, name)
+
+    def find_actions(self, action=None, target=None):
+        """Return the recorded actions, optionally only those of a type
+        or for a target.
+        """
+        with self._lock:
+            actions = list(self.actions)
+        return [a for a in actions if (action is None or a.action == action)
+                and (target is None or a.target == target)]
+
+    def call(self, action=None, target=None, text=None):
+        """Simulate a request to reddit and record it as an action."""
+        if self.latency:
+            self.sleep(self.latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise socket.error("Connection reset by reddit stand-in")
+        if action:
+            with self._lock:
+                self.actions.append(Action(self.clock(), action, target, text))
+
+    def _new_id(self):
+        with self._lock:
+            return 'sx{:x}'.format(next(self._ids))
+
+
+class Inbox(object):
+
+    def __init__(self, reddit):
+        self.reddit = reddit
+        self._items = []
+        self._unread = set()
+
+    def add(self, item, arrival=None):
+        item.arrival = self.reddit.clock() if arrival is None else arrival
+        with self.reddit._lock:
+            self._items.append(item)
+            self._items.sort(key=lambda i: i.arrival)
+            self._unread.add(item.id)
+
+    def unread(self, limit=None):
+        """Return the unread items that have arrived, oldest first."""
+        self.reddit.call()
+        now = self.reddit.clock()
+        with self.reddit._lock:
+            items = [i for i in self._items
+                     if i.id in self._unread and i.arrival <= now]
+        return items[:limit]
+
+    def message(self, id):
+        self.reddit.call()
+        with self.reddit._lock:
+            return next(i for i in self._items if i.id == id)
+
+    def mark_read(self, item):
+        with self.reddit._lock:
+            self._unread.discard(item.id)
+
+    def pending(self):
+        """Return the number of unread items, including those that haven't
+        arrived yet.
+        """
+        with self.reddit._lock:
+            return len(self._unread)
+
+
+class Redditor(object):
+
+    def __init__(self, reddit, name):
+        self.reddit = reddit
+        self.name = name
+
+    def message(self, subject, body):
+        self.reddit.call('message', self.name, "{}\n\n{}".format(subject, body))
+
+    def __str__(self):
+        return self.name
+
+
+class Subreddit(object):
+
+    def __init__(self, reddit, name):
+        self.reddit = reddit
+        self.display_name = name
+        self.mod = ModTools(self)
+
+    def message(self, subject, body):
+        self.reddit.call('modmail', self.display_name,
+                         "{}\n\n{}".format(subject, body))
+
+    def banned(self):
+        self.reddit.call()
+        return [Redditor(self.reddit, name)
+                for name in sorted(self.reddit.banned_users)]
+
+
+class ModTools(object):
+
+    def __init__(self, subreddit):
+        self.subreddit = subreddit
+
+    def log(self, action=None, limit=100):
+        """Return the newest moderation log entries first."""
+        self.subreddit.reddit.call()
+        entries = [e for e in reversed(self.subreddit.reddit.modlog)
+                   if action is None or e.action == action]
+        return entries[:limit]
+
+
+class Submission(object):
+
+    def __init__(self, id, subreddit):
+        self.id = id
+        self.subreddit = subreddit
+        self.permalink = '/r/{}/comments/{}/standin_thread/'.format(
+            subreddit, id)
+
+
+class InboxItem(object):
+
+    def __init__(self, reddit, id, body, author):
+        self.reddit = reddit
+        self.id = id
+        self.body = body
+        self.author = Redditor(reddit, author)
+        self.arrival = None
+
+    @property
+    def created_utc(self):
+        return self.arrival
+
+    def reply(self, text):
+        """Reply as the bot and return the new comment."""
+        self.reddit.call('reply', self.id, text)
+        comment = Comment(self.reddit, self.reddit._new_id(), text,
+                          self.reddit.username, getattr(self, 'submission',
+                                                        None))
+        with self.reddit._lock:
+            self.reddit.comments[comment.id] = comment
+        if hasattr(self, 'replies'):
+            self.replies.append(comment)
+        return comment
+
+    def mark_read(self):
+        self.reddit.call('mark_read', self.id)
+        self.reddit.inbox.mark_read(self)
+
+
+class Comment(InboxItem):
+
+    was_comment = True
+
+    def __init__(self, reddit, id, body, author, submission):
+        InboxItem.__init__(self, reddit, id, body, author)
+        self.submission = submission
+        self.replies = []
+
+    @property
+    def subreddit(self):
+        return Subreddit(self.reddit, self.submission.subreddit)
+
+    @property
+    def permalink(self):
+        return self.submission.permalink + self.id
+
+    def edit(self, text):
+        self.reddit.call('edit', self.id, text)
+        self.body = text
+
+
+class Message(InboxItem):
+
+    was_comment = False
+
+
+def burst_arrivals(count, duration, decay=4.0, start=0.0, seed=None):
+    """Return count sorted arrival times spread over duration seconds after
+    start. The arrival rate decays exponentially with the given rate, so
+    about half of the mentions arrive in the first 1/6 of the duration
+    with the default decay.
+    """
+    rand = random.Random(seed)
+    times = []
+    for n in range(count):
+        # Sample an exponential distribution truncated to [0, 1).
+        u = rand.random()
+        if decay:
+            offset = -math.log(1 - u * (1 - math.exp(-decay))) / decay
+        else:
+            offset = u
+        times.append(start + offset * duration)
+    return sorted(times)
+
+
+def mention_burst(reddit, bodies, count, duration, users=50, threads=1,
+                  decay=4.0, start=None, seed=None):
+    """Add count comments that mention the bot to the inbox of a stand-in,
+    arriving in a burst over duration seconds. Comment bodies are picked
+    from a list in order and spread over a number of threads, with
+    comments made by a pool of users. Returns the comments.
+    """
+    start = reddit.clock() if start is None else start
+    rand = random.Random(seed)
+    submissions = [reddit.add_comment('', 'op{}'.format(n), mention=False)
+                   for n in range(threads)]
+    comments = []
+    arrivals = burst_arrivals(count, duration, decay, start, seed)
+    for n, arrival in enumerate(arrivals):
+        comments.append(reddit.add_comment(
+            bodies[n % len(bodies)],
+            'user{}'.format(rand.randrange(users)),
+            parent=rand.choice(submissions), arrival=arrival))
+    return comments
+
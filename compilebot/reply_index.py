@@ -0,0 +1,78 @@
+"""
+A persistent index of the bot's replies, so a recompile request can edit
+the bot's earlier reply without searching the replies of the comment,
+where a buried reply can't be found.
+
+Each entry maps the id of a comment with source code to the id of the
+bot's reply and hashes of the source comment and of the output the
+reply shows. A recompile whose output hash matches the indexed one
+doesn't need to edit the reply at all.
+"""
+from __future__ import unicode_literals, print_function
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+
+IndexedReply = namedtuple('IndexedReply', ['source', 'reply', 'source_hash',
+                                           'output_hash'])
+
+
+def text_hash(*parts):
+    """Return a hash of strings, distinguishing ("ab", "c") from
+    ("a", "bc").
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update('{}'.format(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ReplyIndex(object):
+
+    """Maps source comment ids to the bot's replies, stored in SQLite.
+
+    Keyword arguments:
+    path -- optional SQLite database file, the index is only kept in
+        memory if no file is given
+    """
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ':memory:', timeout=30,
+                                   check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS replies ("
+                         "source TEXT PRIMARY KEY, reply TEXT, "
+                         "source_hash TEXT, output_hash TEXT, updated REAL)")
+        self._db.commit()
+
+    def get(self, source):
+        """Return the IndexedReply of a source comment id, or None if the
+        bot's reply to it isn't indexed.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT source, reply, source_hash, output_hash FROM replies "
+                "WHERE source = ?", (source,)).fetchone()
+        return IndexedReply(*row) if row else None
+
+    def put(self, source, reply, source_hash, output_hash):
+        """Index the bot's reply to a source comment, replacing any earlier
+        entry.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO replies VALUES (?, ?, ?, ?, ?)",
+                (source, reply, source_hash, output_hash, self.clock()))
+            self._db.commit()
+
+    def remove(self, source):
+        """Remove the entry of a source comment id, if there is one."""
+        with self._lock:
+            self._db.execute("DELETE FROM replies WHERE source = ?",
+                             (source,))
+            self._db.commit()
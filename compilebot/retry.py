@@ -0,0 +1,188 @@
+"""
+Retrying of failed API calls and circuit breakers for the services the
+bot depends on.
+
+A retry policy spaces out the attempts of a call with exponential backoff
+and random jitter, so that calls failing at the same time don't all retry
+at the same time. A rate limit error that says how long to wait is
+retried after that time instead.
+
+Each service gets a circuit breaker. After a number of failures in a row
+the breaker opens and calls to the service fail right away with
+CircuitOpenError instead of waiting through their retries. Once the reset
+timeout has passed a single call is let through, and the breaker closes
+again if it succeeds.
+"""
+from __future__ import unicode_literals, print_function, division
+import re
+import time
+import random
+import threading
+from collections import defaultdict
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Reddit rate limit errors say how long to wait, for example "you are
+# doing that too much. try again in 9 minutes."
+RATELIMIT_PATTERN = re.compile(r'(\d+) (millisecond|second|minute)s?')
+UNIT_SECONDS = {'millisecond': 0.001, 'second': 1, 'minute': 60}
+
+
+class CircuitOpenError(Exception):
+
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+    def __init__(self, name, retry_in):
+        Exception.__init__(self, "The {} circuit is open, retrying in "
+                           "{:.0f} seconds".format(name, retry_in))
+        self.name = name
+        self.retry_in = retry_in
+
+
+def retry_after(error):
+    """Return the number of seconds an error says to wait before trying
+    again, or None if it doesn't say.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers['retry-after'])
+    except (KeyError, TypeError, ValueError):
+        pass
+    if getattr(error, 'error_type', None) == 'RATELIMIT':
+        match = RATELIMIT_PATTERN.search(getattr(error, 'message', ''))
+        if match:
+            return int(match.group(1)) * UNIT_SECONDS[match.group(2)]
+    return None
+
+
+class RetryPolicy(object):
+
+    """How long to wait between the attempts of a call.
+
+    Keyword arguments:
+    base_delay -- seconds to wait after the first failure
+    max_delay -- the longest wait between attempts
+    multiplier -- the factor the wait grows by after each failure
+    jitter -- the fraction of each wait that is random, between 0 and 1
+    """
+
+    def __init__(self, base_delay=2, max_delay=120, multiplier=2, jitter=0.5,
+                 random=random.random):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.random = random
+
+    def delay(self, retries, error=None):
+        """Return the number of seconds to wait after a call failed with
+        an error for the retries + 1th time.
+        """
+        wait = retry_after(error)
+        if wait is not None:
+            return wait
+        wait = min(self.max_delay,
+                   self.base_delay * self.multiplier ** retries)
+        return wait * (1 - self.jitter * self.random())
+
+
+class CircuitBreaker(object):
+
+    """Stops calls to a service after it failed repeatedly.
+
+    Keyword arguments:
+    name -- the name of the service
+    failure_threshold -- failures in a row that open the breaker
+        (0 to never open it)
+    reset_timeout -- seconds the breaker stays open before a call is let
+        through to test the service
+    on_change -- optional function called with the breaker and its new
+        state when the state changes
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60,
+                 on_change=None, clock=time.time):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if a call to the service isn't allowed
+        right now.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self._opened_at + self.reset_timeout - self.clock()
+            if self.state == OPEN and retry_in <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(self.name, max(0, retry_in))
+
+    def success(self):
+        """Record a successful call to the service."""
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def failure(self):
+        """Record a failed call to the service."""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED and self.failure_threshold and
+                    self.failures >= self.failure_threshold):
+                self.opened += 1
+                self._opened_at = self.clock()
+                self._set_state(OPEN)
+
+    def release(self):
+        """End a test call that neither succeeded nor failed, such as one
+        interrupted by a rejected call to another service, so that the
+        next call tests the service instead.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def _set_state(self, state):
+        self.state = state
+        if self.on_change:
+            self.on_change(self, state)
+
+
+class RetryStats(object):
+
+    """Thread safe counts of call outcomes for each call site.
+
+    The outcomes are "success", "retry", "gave_up" and "rejected".
+    """
+
+    def __init__(self):
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, site, outcome):
+        with self._lock:
+            self._counts[(site, outcome)] += 1
+
+    def snapshot(self):
+        """Return a dict of (call site, outcome) tuples and their counts."""
+        with self._lock:
+            return dict(self._counts)
@@ -0,0 +1,170 @@
+"""
+Admission control and fair scheduling of requests.
+
+Each user gets a token bucket that limits how many requests they can make
+in a period, so a single user can't use up the bot's ideone capacity.
+Requests are ordered by a virtual clock tag, a form of weighted fair
+queueing: every request of a user is tagged a fixed share of time after
+the user's previous request, so a user who posts many mentions at once
+has them spread out behind the requests of other users instead of
+holding everyone else up. The number of submissions in each language
+that are compiled at once can also be capped, since some languages take
+much longer on ideone than others.
+"""
+from __future__ import unicode_literals, print_function, division
+import time
+import threading
+from contextlib import contextmanager
+
+
+class TokenBucket(object):
+
+    """A token bucket that holds up to capacity tokens and refills at rate
+    tokens per second.
+    """
+
+    def __init__(self, rate, capacity, clock=time.time):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def tokens(self):
+        """Return the number of tokens in the bucket."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def take(self, tokens=1):
+        """Take tokens from the bucket and return True, or return False
+        without taking any if there aren't enough tokens.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def wait_time(self, tokens=1):
+        """Return the number of seconds until there are enough tokens."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens or not self.rate:
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class Scheduler(object):
+
+    """Decides which requests are admitted and in what order they run.
+
+    Keyword arguments:
+    user_limit -- the number of requests a user can make in user_period
+        seconds (0 for no limit)
+    user_period -- see user_limit
+    language_limits -- dict of lowercase language names to the maximum
+        number of submissions in that language compiled at once
+    default_language_limit -- the limit of other languages (0 for none)
+    share_interval -- seconds of virtual time each request of a user with
+        weight 1 takes up
+    weights -- dict of lowercase user names to their share of the bot,
+        1 by default
+    """
+
+    def __init__(self, user_limit=0, user_period=600, language_limits=None,
+                 default_language_limit=0, share_interval=10, weights=None,
+                 clock=time.time):
+        self.user_limit = user_limit
+        self.user_period = user_period
+        self.language_limits = dict((k.lower(), v) for k, v in
+                                    (language_limits or {}).items())
+        self.default_language_limit = default_language_limit
+        self.share_interval = share_interval
+        self.weights = dict((k.lower(), v) for k, v in
+                            (weights or {}).items())
+        self.clock = clock
+        self.rejected = 0
+        self._buckets = {}
+        self._tags = {}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def admit(self, user):
+        """Return True if a user may make another request, or False if
+        they made too many requests recently.
+        """
+        if not self.user_limit:
+            return True
+        user = user.lower()
+        with self._lock:
+            bucket = self._buckets.get(user)
+            if bucket is None:
+                self._prune_buckets()
+                bucket = TokenBucket(self.user_limit / self.user_period,
+                                     self.user_limit, self.clock)
+                self._buckets[user] = bucket
+        if bucket.take():
+            return True
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def retry_after(self, user):
+        """Return the number of seconds until a user may make another
+        request.
+        """
+        bucket = self._buckets.get(user.lower())
+        return bucket.wait_time() if bucket else 0
+
+    def tag(self, user):
+        """Return the virtual clock tag of a new request from a user.
+        Requests with lower tags should run first.
+        """
+        user = user.lower()
+        interval = self.share_interval / self.weights.get(user, 1)
+        with self._lock:
+            now = self.clock()
+            tag = max(now, self._tags.get(user, 0)) + interval
+            self._tags[user] = tag
+            # Users whose tags are in the past don't affect new tags.
+            if len(self._tags) > 1000:
+                self._tags = dict((u, t) for u, t in self._tags.items()
+                                  if t > now)
+            return tag
+
+    @contextmanager
+    def language_slot(self, lang):
+        """Wait for a free slot for a submission in a language and hold it
+        for the duration of a with block.
+        """
+        semaphore = self._semaphore(lang.lower())
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+    def _semaphore(self, lang):
+        limit = self.language_limits.get(lang, self.default_language_limit)
+        if not limit:
+            return None
+        with self._lock:
+            if lang not in self._semaphores:
+                self._semaphores[lang] = threading.BoundedSemaphore(limit)
+            return self._semaphores[lang]
+
+    def _prune_buckets(self):
+        # Full buckets are the same as new ones, so they can be dropped.
+        if len(self._buckets) > 1000:
+            self._buckets = dict(
+                (u, b) for u, b in self._buckets.items()
+                if b.tokens() < b.capacity)
@@ -0,0 +1,120 @@
+"""
+Detection of potential spam in the output of compiled code.
+
+The spam phrases and regular expressions of a filter are compiled into a
+single case-insensitive pattern when the filter is created, so the source
+and output of a reply are each scanned once however many phrases there
+are, and the scan stops at the first match. The limit checks are done
+first and don't look at the text where its length already settles them.
+
+Subreddits can have their own limits and phrases, or be ignored entirely,
+in which case their replies aren't scanned at all.
+"""
+from __future__ import unicode_literals, print_function
+import re
+
+LINE_BREAKS = "Excessive line breaks"
+CHARACTERS = "Excessive character count"
+PHRASE = "Spam phrase detected"
+SYSTEM_CALL = "Illegal system call detected"
+
+
+def phrase_pattern(phrases=(), patterns=()):
+    """Compile spam phrases and regular expressions into a single
+    case-insensitive pattern, or return None if there are neither.
+    """
+    # Longer phrases go first so a phrase isn't hidden by its prefix.
+    alternatives = [re.escape(p) for p in sorted(set(phrases), key=len,
+                                                 reverse=True) if p]
+    alternatives.extend('(?:{})'.format(p) for p in patterns)
+    if not alternatives:
+        return None
+    return re.compile('|'.join(alternatives), re.IGNORECASE | re.UNICODE)
+
+
+class SpamFilter(object):
+
+    """Checks compiled code and its output for spammy behavior.
+
+    Keyword arguments:
+    line_limit -- the number of line breaks the output may contain, no
+        limit if None
+    char_limit -- the number of characters the output may contain, no
+        limit if None
+    phrases -- phrases that aren't allowed in the source or output
+    patterns -- regular expressions that aren't allowed to match the
+        source or output
+    """
+
+    def __init__(self, line_limit=None, char_limit=None, phrases=(),
+                 patterns=()):
+        self.line_limit = line_limit
+        self.char_limit = char_limit
+        self.phrases = list(phrases)
+        self.patterns = list(patterns)
+        self._pattern = phrase_pattern(self.phrases, self.patterns)
+
+    def override(self, line_limit=None, char_limit=None, spam_phrases=None,
+                 patterns=None):
+        """Return a copy of the filter with some of its settings replaced,
+        which takes the keys of a subreddit's spam settings.
+        """
+        return SpamFilter(
+            self.line_limit if line_limit is None else line_limit,
+            self.char_limit if char_limit is None else char_limit,
+            self.phrases if spam_phrases is None else spam_phrases,
+            self.patterns if patterns is None else patterns)
+
+    def detect(self, source, output, errors):
+        """Return a list of the spammy behaviors found."""
+        triggers = []
+        # Output with no more characters than the line limit can't have
+        # too many line breaks.
+        if (self.line_limit is not None and len(output) > self.line_limit
+                and output.count('\n') > self.line_limit):
+            triggers.append(LINE_BREAKS)
+        if self.char_limit is not None and len(output) > self.char_limit:
+            triggers.append(CHARACTERS)
+        if self._pattern is not None and (self._pattern.search(source) or
+                                          self._pattern.search(output)):
+            triggers.append(PHRASE)
+        if "Permission denied" in errors:
+            triggers.append(SYSTEM_CALL)
+        return triggers
+
+
+class SpamRules(object):
+
+    """The spam filters of each subreddit.
+
+    Keyword arguments:
+    default -- the SpamFilter of subreddits without rules of their own
+    subreddits -- optional dict of subreddit names and their SpamFilter
+    ignore -- names of subreddits where spam isn't detected
+    """
+
+    def __init__(self, default, subreddits=None, ignore=()):
+        self.default = default
+        self.subreddits = dict((name.lower(), spam_filter) for name, spam_filter
+                               in (subreddits or {}).items())
+        self.ignore = set(name.lower() for name in ignore)
+
+    def filter(self, subreddit=None):
+        """Return the SpamFilter of a subreddit, or None if spam isn't
+        detected there.
+        """
+        if subreddit is None:
+            return self.default
+        name = subreddit.lower()
+        if name in self.ignore:
+            return None
+        return self.subreddits.get(name, self.default)
+
+    def detect(self, source, output, errors, subreddit=None):
+        """Return a list of the spammy behaviors found using the rules of
+        a subreddit.
+        """
+        spam_filter = self.filter(subreddit)
+        if spam_filter is None:
+            return []
+        return spam_filter.detect(source, output, errors)
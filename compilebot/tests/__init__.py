@@ -1 +1 @@
-__all__ = ['unit', 'integration']
+__all__ = ['unit', 'integration', 'benchmark']
@@ -0,0 +1 @@
+__all__ = ['backlog', 'comments', 'pipeline', 'startup']
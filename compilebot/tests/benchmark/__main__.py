@@ -0,0 +1,23 @@
+"""Execute all benchmarks in the current directory.
+
+Run: python -m tests.benchmark
+(Note: Must be run from the compilebot directory)
+
+"""
+
+from . import *
+
+def main():
+    print("Running CompileBot benchmarks")
+    benchmarks = [
+        comments,
+        pipeline,
+        backlog,
+        startup,
+    ]
+    for benchmark in benchmarks:
+        print("\n{}".format(benchmark.__name__))
+        benchmark.main()
+
+if __name__ == "__main__":
+    main()
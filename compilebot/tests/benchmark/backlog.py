@@ -0,0 +1,104 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+import time
+import argparse
+import tempfile
+import compilebot as cb
+import cache
+import clients
+import ideone_standin
+import polling
+import scheduler
+import reddit_standin
+from .pipeline import load_corpus, percentile
+
+"""
+Benchmark of how long the bot takes to work through a burst of mentions.
+The recorded mentions from mentions.json arrive in a burst in the inbox of
+a local reddit stand-in and are compiled by a local ideone stand-in, so no
+requests are made to reddit or ideone. The inbox is checked repeatedly
+until every mention has been handled, once for each number of worker
+threads. The time to drain the backlog and the percentiles of the time
+from the arrival of a mention until it was handled and marked as read
+are reported.
+
+Run the following command from the compilebot directory in order to run only
+this benchmark: python -m tests.benchmark.backlog
+"""
+
+MENTIONS = 100
+# Seconds over which the mentions arrive, 0 for a backlog that is already
+# waiting in the inbox.
+BURST_DURATION = 2.0
+WORKER_THREADS = [1, 4, 16]
+# Seconds each reddit call and ideone submission take.
+REDDIT_LATENCY = 0.01
+IDEONE_LATENCY = 0.01
+IDEONE_RUN_TIME = 0.1
+DESCRIPTION = "Benchmark the time to drain a burst of mentions."
+
+
+def setup(args):
+    ideone = ideone_standin.StandinIdeone(latency=args.ideone_latency,
+                                          run_time=args.run_time, seed=1)
+    cb.IDEONE_CLIENTS = clients.ClientPool(lambda: ideone,
+                                           size=max(args.threads))
+    cb.POLLER = polling.PollScheduler(initial_interval=args.run_time,
+                                      min_interval=0.01,
+                                      max_interval=args.run_time)
+    cb.RESULT_CACHE = cache.ResultCache(size=0)
+    # Requests in a benchmark aren't rate limited.
+    cb.SCHEDULER = scheduler.Scheduler()
+    cb.config.LOG_FILE = tempfile.mkstemp(suffix='.log')[1]
+    cb.config.ADMIN = None
+    cb.config.SUBREDDIT = None
+
+
+def drain(bodies, threads, args):
+    """Return the drain time, the sorted latencies and the number of
+    replies of a burst.
+    """
+    r = reddit_standin.StandinReddit(cb.config.R_USERNAME,
+                                     latency=args.reddit_latency)
+    start = r.clock()
+    comments = reddit_standin.mention_burst(
+        r, bodies, args.mentions, args.duration, start=start, seed=1)
+    cb.config.WORKER_THREADS = threads
+    while r.inbox.pending():
+        unread = r.inbox.unread()
+        if unread:
+            cb.process_inbox(unread, r)
+        else:
+            time.sleep(0.01)
+    end = r.clock()
+    arrivals = dict((c.id, c.arrival) for c in comments)
+    handled = dict((a.target, a.time) for a in r.find_actions('mark_read'))
+    latencies = sorted(handled[id] - arrival
+                       for id, arrival in arrivals.items())
+    return end - start, latencies, len(r.find_actions('reply'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument('--mentions', type=int, default=MENTIONS)
+    parser.add_argument('--duration', type=float, default=BURST_DURATION)
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=WORKER_THREADS)
+    parser.add_argument('--reddit-latency', type=float,
+                        default=REDDIT_LATENCY)
+    parser.add_argument('--ideone-latency', type=float,
+                        default=IDEONE_LATENCY)
+    parser.add_argument('--run-time', type=float, default=IDEONE_RUN_TIME)
+    args = parser.parse_args(argv)
+
+    bodies = [m['body'] for m in load_corpus()]
+    setup(args)
+    print("{:<10}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+        "Threads", "Drain (s)", "Replies", "p50 (s)", "p90 (s)", "p99 (s)"))
+    for threads in args.threads:
+        elapsed, latencies, replies = drain(bodies, threads, args)
+        print("{:<10}{:>10.2f}{:>10}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+            threads, elapsed, replies, percentile(latencies, 0.5),
+            percentile(latencies, 0.9), percentile(latencies, 0.99)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+import re
+import timeit
+import comment_parser
+
+"""
+Benchmark for parsing comments. Each case is parsed at several sizes by the
+line oriented comment parser and by the regular expression it replaced.
+The time per character of the comment parser should stay flat as the
+comments grow.
+
+Run the following command from the compilebot directory in order to run only
+this benchmark: python -m tests.benchmark.comments
+"""
+
+USER = 'CompileBot'
+SIZES = [1250, 2500, 5000, 10000]
+# The regular expression is skipped above this size since some cases take
+# minutes to fail.
+REGEX_MAX_LINES = 2500
+
+REGEX = re.compile((
+    r'\+/u/(?i)%s\s*(?P<args>.*)\n\s*'
+    r'((?<=\n( {4}))|(?<=\n\t))'
+    r'(?P<src>.*(\n((( {4}|\t).*\n)|\n)*(( {4}|\t).*))?)'
+    r'(\n\s*((?i)Input|Stdin):?\s*\n\s*'
+    r'((?<=\n( {4}))|(?<=\n\t))'
+    r'(?P<in>.*(\n((( {4}|\t).*\n)|\n)*(( {4}|\t).*\n?))?))?'
+) % USER)
+
+CASES = [
+    ("long source",
+     lambda n: "+/u/{} python\n\n".format(USER) + "    print(1)\n" * n),
+    ("long source and input",
+     lambda n: ("+/u/{} python\n\n".format(USER) + "    x = input()\n" * n +
+                "\nInput:\n\n" + "    5\n" * n)),
+    ("blank lines without code",
+     lambda n: "+/u/{} python\n".format(USER) + "   \n" * n + "text"),
+    ("indented blank lines",
+     lambda n: ("+/u/{} python\n\n    x\n".format(USER) + "    \n\n" * n +
+                "text")),
+    ("repeated mentions",
+     lambda n: "+/u/{} python\n".format(USER) * n),
+    ("mentions on one line",
+     lambda n: "+/u/{} ".format(USER) * n + "\n\ntext"),
+]
+
+
+def time_parse(parse, body, repeat=3):
+    return min(timeit.repeat(lambda: parse(body), number=1, repeat=repeat))
+
+
+def main():
+    parser = comment_parser.CommentParser(USER)
+    print("{:<24}{:>8}{:>14}{:>14}{:>14}".format(
+        "Case", "Chars", "Parser (ms)", "ns / char", "Regex (ms)"))
+    for name, build in CASES:
+        for n in SIZES:
+            body = build(n)
+            elapsed = time_parse(parser.parse, body)
+            if n <= REGEX_MAX_LINES:
+                regex = "{:.1f}".format(time_parse(REGEX.search, body, 1) * 1000)
+            else:
+                regex = "-"
+            print("{:<24}{:>8}{:>14.2f}{:>14.1f}{:>14}".format(
+                name, len(body), elapsed * 1000, elapsed * 1e9 / len(body),
+                regex))
+
+if __name__ == "__main__":
+    main()
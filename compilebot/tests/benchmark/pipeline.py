@@ -0,0 +1,273 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from timeit import default_timer as timer
+import compilebot as cb
+import cache
+import clients
+import polling
+import scheduler
+
+"""
+Benchmark for the parse -> compile -> format -> reply pipeline. A corpus of
+recorded mentions (mentions.json) is replayed through each stage against
+a stub ideone client and a stub reddit session, so no requests are made to
+reddit or ideone. The latency percentiles and throughput of each stage and
+the peak memory of the process are reported.
+
+Results can be saved and compared with the results of an earlier run in
+order to catch performance regressions:
+
+    python -m tests.benchmark.pipeline --output before.json
+    python -m tests.benchmark.pipeline --compare before.json
+
+Run the following command from the compilebot directory in order to run only
+this benchmark: python -m tests.benchmark.pipeline
+"""
+
+CORPUS_FILE = os.path.join(os.path.dirname(__file__), 'mentions.json')
+# The username the recorded mentions were made to.
+CORPUS_USER = 'CompileBot'
+ITERATIONS = 50
+# A stage regressed if its median latency grew by more than this fraction.
+REGRESSION_THRESHOLD = 0.2
+DESCRIPTION = "Benchmark the parse, compile, format and reply pipeline."
+
+
+class StubIdeone(object):
+
+    """Returns the recorded details of a submission for its source code."""
+
+    def __init__(self, corpus):
+        self.details = dict((m['details']['source'], m['details'])
+                            for m in corpus if m['details'])
+        self.sources = {}
+
+    def create_submission(self, source, language_name=None, std_input=''):
+        link = 'stub{}'.format(len(self.sources))
+        self.sources[link] = source
+        return {'error': 'OK', 'link': link}
+
+    def submission_details(self, link):
+        return dict(self.details[self.sources.pop(link)])
+
+
+class Author(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class Subreddit(object):
+    def __init__(self, name):
+        self.display_name = name
+
+    def message(self, subject, body):
+        pass
+
+
+class Redditor(Author):
+    def message(self, subject, body):
+        pass
+
+
+class Submission(object):
+    permalink = '/r/benchmark/comments/2sdgv5/benchmark_thread/'
+
+
+class Comment(object):
+
+    """A stub of a PRAW comment from the inbox."""
+
+    def __init__(self, body, id):
+        self.body = body
+        self.id = id
+        self.author = Author('BenchmarkUser')
+        self.was_comment = True
+        self.subreddit = Subreddit('benchmark')
+        self.submission = Submission()
+        self.replies = []
+
+    def reply(self, text):
+        pass
+
+    def mark_read(self):
+        pass
+
+
+class Reddit(object):
+
+    """A stub of a PRAW reddit session."""
+
+    def redditor(self, name):
+        return Redditor(name)
+
+    def subreddit(self, name):
+        return Subreddit(name)
+
+
+def load_corpus():
+    with open(CORPUS_FILE) as f:
+        corpus = json.load(f)
+    mention = '+/u/{}'.format(cb.config.R_USERNAME)
+    for m in corpus:
+        m['body'] = m['body'].replace('+/u/' + CORPUS_USER, mention)
+    return corpus
+
+
+def setup(corpus):
+    """Point the bot at the stubs and disable everything that would make
+    the stages do less work on repeated runs or wait on a clock.
+    """
+    stub = StubIdeone(corpus)
+    cb.IDEONE_CLIENTS = clients.ClientPool(lambda: stub)
+    cb.POLLER = polling.PollScheduler(sleep=lambda seconds: None)
+    cb.RESULT_CACHE = cache.ResultCache(size=0)
+    # Requests in a benchmark aren't rate limited.
+    cb.SCHEDULER = scheduler.Scheduler()
+    cb.config.LOG_FILE = tempfile.mkstemp(suffix='.log')[1]
+    cb.config.ADMIN = None
+
+
+def split_args(args):
+    try:
+        lang, opts = args.split(' -', 1)
+        return lang.strip(), ('-' + opts).split()
+    except ValueError:
+        return args.strip(), []
+
+
+def stages(corpus):
+    """Return a list of (name, function, inputs) for each stage."""
+    r = Reddit()
+    bodies = [m['body'] for m in corpus]
+    parsed = []
+    for m in corpus:
+        try:
+            args, src, stdin = cb.parse_comment(m['body'])
+        except AttributeError:
+            continue
+        parsed.append((m['details'], split_args(args)[1]))
+    compiled = [(details, opts) for details, opts in parsed
+                if details['result'] == 15]
+    replies = [cb.CompiledReply(cb.format_reply(details, opts), details)
+               for details, opts in compiled]
+    comments = [Comment(body, 'c{}'.format(n))
+                for n, body in enumerate(bodies)]
+    return [
+        ('parse_comment', cb.parse_comment, bodies),
+        ('format_reply', lambda d: cb.format_reply(*d), compiled),
+        ('detect_spam', lambda reply: reply.detect_spam(), replies),
+        ('create_reply', cb.create_reply, comments),
+        ('process_unread', lambda c: cb.process_unread(c, r), comments),
+    ]
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_stage(func, inputs, iterations):
+    latencies = []
+    start = timer()
+    for i in range(iterations):
+        for value in inputs:
+            t = timer()
+            try:
+                func(value)
+            except AttributeError:
+                # Badly formatted comments are part of the corpus.
+                pass
+            latencies.append(timer() - t)
+    total = timer() - start
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput': len(latencies) / total,
+    }
+
+
+def max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                stderr=devnull).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the change of each stage from a baseline and return a list of
+    the stages that regressed.
+    """
+    regressions = []
+    print("\nCompared with {} ({}):".format(baseline.get('commit'),
+                                             baseline.get('python')))
+    for name, stats in results['stages'].items():
+        before = baseline['stages'].get(name)
+        if not before:
+            continue
+        change = stats['p50_ms'] / before['p50_ms'] - 1
+        flag = ''
+        if change > REGRESSION_THRESHOLD:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print("{:<16}{:>+9.1%}{}".format(name, change, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--output', help="save results to a JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus()
+    setup(corpus)
+    results = {
+        'commit': commit(),
+        'python': sys.version.split()[0],
+        'iterations': args.iterations,
+        'stages': {},
+    }
+    print("{:<16}{:>8}{:>10}{:>10}{:>10}{:>12}".format(
+        "Stage", "Calls", "p50 (ms)", "p90 (ms)", "p99 (ms)", "Calls / s"))
+    for name, func, inputs in stages(corpus):
+        stats = run_stage(func, inputs, args.iterations)
+        results['stages'][name] = stats
+        print("{:<16}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>12.0f}".format(
+            name, stats['calls'], stats['p50_ms'], stats['p90_ms'],
+            stats['p99_ms'], stats['throughput']))
+    results['max_rss_kb'] = max_rss_kb()
+    print("Peak memory: {} KB".format(results['max_rss_kb']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f)):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
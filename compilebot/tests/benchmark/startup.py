@@ -0,0 +1,106 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from .pipeline import percentile
+
+"""
+Benchmark of how long a restarted bot takes to reply to its first mention.
+Each run starts a new Python process that imports config and compilebot,
+restores the saved state and processes a single mention from the inbox of
+a local reddit stand-in, compiled by a local ideone stand-in, so no
+requests are made to reddit or ideone. The time spent loading the config,
+importing compilebot and getting to the first reply is reported, for a
+cold start without a config cache or saved state and for a warm start
+with both.
+
+Run the following command from the compilebot directory in order to run only
+this benchmark: python -m tests.benchmark.startup
+"""
+
+RUNS = 10
+DESCRIPTION = "Benchmark the time a restarted bot takes to its first reply."
+
+# Runs in the new process and prints the timings as JSON.
+CHILD = """
+import time
+start = time.time()
+import sys
+import json
+import tempfile
+import config
+config_loaded = time.time()
+import compilebot as cb
+imported = time.time()
+import clients
+import ideone_standin
+import polling
+import reddit_standin
+config.LOG_FILE = tempfile.mkstemp(suffix='.log')[1]
+config.WORKER_THREADS = 1
+ideone = ideone_standin.StandinIdeone(run_time=0)
+cb.IDEONE_CLIENTS = clients.ClientPool(lambda: ideone, size=1)
+cb.POLLER = polling.PollScheduler(sleep=lambda seconds: None)
+r = reddit_standin.StandinReddit(config.R_USERNAME)
+r.add_comment("+/u/{} python\\n\\n    print(1)\\n\\n".format(config.R_USERNAME),
+              'user')
+cb.restore()
+cb.process_inbox(r.inbox.unread(), r)
+assert r.find_actions('reply')
+replied = time.time()
+cb.shutdown()
+print(json.dumps({
+    'config': config_loaded - start,
+    'import': imported - config_loaded,
+    'first_reply': replied - start,
+    'deferred': sorted(m for m in ('praw', 'prawcore', 'ideone', 'yaml')
+                       if m not in sys.modules),
+}))
+"""
+
+
+def run(env):
+    output = subprocess.check_output([sys.executable, '-c', CHILD], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def measure(runs, state_dir, warm):
+    env = dict(os.environ)
+    env['COMPILEBOT_CONFIG_CACHE'] = os.path.join(state_dir, 'config.cache')
+    env['COMPILEBOT_STATE_DIR'] = state_dir
+    results = []
+    for n in range(runs):
+        if not warm:
+            shutil.rmtree(state_dir)
+            os.mkdir(state_dir)
+        results.append(run(env))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument('--runs', type=int, default=RUNS)
+    args = parser.parse_args(argv)
+
+    state_dir = tempfile.mkdtemp()
+    try:
+        print("{:<8}{:>14}{:>14}{:>18}  {}".format(
+            "Start", "Config (ms)", "Import (ms)", "First reply (ms)",
+            "Not imported"))
+        for name, warm in (('cold', False), ('warm', True)):
+            results = measure(args.runs, state_dir, warm)
+            stats = dict((key, percentile(sorted(r[key] for r in results),
+                                          0.5) * 1000)
+                         for key in ('config', 'import', 'first_reply'))
+            print("{:<8}{:>14.1f}{:>14.1f}{:>18.1f}  {}".format(
+                name, stats['config'], stats['import'],
+                stats['first_reply'], ', '.join(results[-1]['deferred'])))
+    finally:
+        shutil.rmtree(state_dir)
+
+if __name__ == "__main__":
+    main()
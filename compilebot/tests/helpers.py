@@ -1,8 +1,18 @@
 import string
 import random
-from mock import Mock
+import unittest
+from mock import Mock, patch
+import compilebot as cb
+import cache
+import clients
+import ideone_standin
+import polling
+import reddit_standin
+import scheduler
 
 LOG_FILE = "tests.log"
+# The reddit username of the bot in tests, whatever config.yml contains.
+USERNAME = "CompileBot"
 
 def initialize_compilebot(cb):
     """Reload compilebot module and set necessary method stubs to ensure
@@ -16,3 +26,36 @@ def reddit_id(length=6):
     """Emulate a reddit id with a random string of letters and digits"""
     return ''.join(random.choice(string.ascii_lowercase +
                    string.digits) for x in range(length))
+
+def mention(source="print(1)", lang="python"):
+    """Return the body of a comment that asks the bot to compile source."""
+    return "+/u/{} {}\n\n    {}\n\n".format(USERNAME, lang, source)
+
+
+class BotTestCase(unittest.TestCase):
+    """Base class of test cases that run the bot against the reddit and
+    ideone stand-ins, as USERNAME and without a work queue.
+
+    Subclasses can set results to the results of the ideone stand-in and
+    patch the bot further with start_patch.
+    """
+
+    results = None
+
+    def setUp(self):
+        self.r = reddit_standin.StandinReddit(USERNAME)
+        self.ideone = ideone_standin.StandinIdeone(run_time=0,
+                                                   results=self.results)
+        self.start_patch(patch.multiple(cb.config, R_USERNAME=USERNAME,
+                                        BANNED_USERS=set()))
+        self.start_patch(patch.multiple(
+            cb, IDEONE_CLIENTS=clients.ClientPool(lambda: self.ideone,
+                                                  size=4),
+            POLLER=polling.PollScheduler(sleep=lambda seconds: None),
+            RESULT_CACHE=cache.ResultCache(0),
+            SCHEDULER=scheduler.Scheduler(), WORK_QUEUE=None))
+
+    def start_patch(self, patcher):
+        """Start patcher and stop it when the test is done."""
+        patcher.start()
+        self.addCleanup(patcher.stop)
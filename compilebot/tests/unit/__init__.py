@@ -1,2 +1,2 @@
-__all__ = ['reply', 'praw']
+__all__ = ['reply', 'praw', 'polling', 'clients', 'cache', 'banned', 'logwriter', 'alerts', 'ideone_standin', 'reddit_standin', 'workqueue', 'scheduler', 'quota', 'retry', 'metrics', 'tracing', 'profiling', 'reply_index', 'spam', 'truncation', 'languages', 'startup', 'comment_parser']
 
@@ -13,6 +13,27 @@ def main():
     test_suites = [
         reply.test_suite(),
         praw.test_suite(),
+        polling.test_suite(),
+        clients.test_suite(),
+        cache.test_suite(),
+        banned.test_suite(),
+        logwriter.test_suite(),
+        alerts.test_suite(),
+        ideone_standin.test_suite(),
+        reddit_standin.test_suite(),
+        workqueue.test_suite(),
+        scheduler.test_suite(),
+        quota.test_suite(),
+        retry.test_suite(),
+        metrics.test_suite(),
+        tracing.test_suite(),
+        profiling.test_suite(),
+        reply_index.test_suite(),
+        spam.test_suite(),
+        truncation.test_suite(),
+        languages.test_suite(),
+        startup.test_suite(),
+        comment_parser.test_suite(),
     ]
     all_tests = unittest.TestSuite(test_suites)
     unittest.TextTestRunner().run(all_tests)
@@ -0,0 +1,82 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+import alerts
+from mock import Mock
+
+"""
+Unit test cases for the admin alert dispatcher. All tests in this module
+shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.alerts
+"""
+
+def test_suite():
+    cases = [
+        TestAlertDispatcher
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestAlertDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000
+        self.send = Mock()
+        self.dispatcher = alerts.AlertDispatcher(
+            self.send, delay=60, min_interval=300, clock=lambda: self.now)
+
+    def tearDown(self):
+        if self.dispatcher._timer:
+            self.dispatcher._timer.cancel()
+
+    def test_digest(self):
+        for i in range(5):
+            self.dispatcher.alert("Connection refused")
+        self.dispatcher.alert("Other error")
+        self.dispatcher.flush()
+        self.assertEqual(self.send.call_count, 1)
+        session, subject, body = self.send.call_args[0]
+        self.assertIsNone(session)
+        self.assertEqual(subject, "CompileBot Alerts (6)")
+        self.assertIn("(x5) Connection refused", body)
+        self.assertIn("Other error", body)
+        # Nothing is sent when there are no pending alerts.
+        self.dispatcher.flush()
+        self.assertEqual(self.send.call_count, 1)
+
+    def test_rate_limit(self):
+        self.dispatcher.alert("First")
+        self.assertAlmostEqual(self.dispatcher._timer.interval, 60)
+        self.dispatcher.flush()
+        self.now += 100
+        self.dispatcher.alert("Second")
+        self.assertAlmostEqual(self.dispatcher._timer.interval, 200)
+
+    def test_session(self):
+        session = Mock()
+        self.dispatcher.attach(session)
+        self.dispatcher.alert("Alert")
+        self.dispatcher.flush()
+        self.assertIs(self.send.call_args[0][0], session)
+        self.assertEqual(self.send.call_args[0][1], "CompileBot Alert")
+
+    def test_send_error(self):
+        on_error = Mock()
+        self.dispatcher.on_error = on_error
+        self.send.side_effect = IOError()
+        self.dispatcher.alert("Alert")
+        self.dispatcher.flush()
+        self.assertTrue(on_error.called)
+
+    def test_long_digest(self):
+        for i in range(1000):
+            self.dispatcher.alert("Error number {}".format(i) * 5)
+        subject, body = self.dispatcher.digest(self.dispatcher._pending)
+        self.assertLessEqual(len(body), alerts.MAX_MESSAGE_LENGTH)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,96 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import banned
+from mock import Mock
+
+"""
+Unit test cases for the banned users cache. All tests in this module
+shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.banned
+"""
+
+def test_suite():
+    cases = [
+        TestBannedUsers
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestBannedUsers(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000
+        self.tmp = tempfile.mkdtemp()
+        self.fetch_all = Mock(return_value={'spammer', 'troll'})
+        self.fetch_changes = Mock(return_value=[])
+        self.reddit = Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def new_cache(self, **kwargs):
+        return banned.BannedUsers(
+            self.fetch_all, fetch_changes=self.fetch_changes,
+            refresh_interval=300, full_refresh_interval=3600,
+            clock=lambda: self.now, **kwargs)
+
+    def test_refresh_interval(self):
+        cache = self.new_cache()
+        self.assertEqual(cache.refresh(self.reddit), {'spammer', 'troll'})
+        self.now += 299
+        cache.refresh(self.reddit)
+        self.assertEqual(self.fetch_all.call_count, 1)
+        self.assertFalse(self.fetch_changes.called)
+
+    def test_incremental_update(self):
+        cache = self.new_cache()
+        users = cache.refresh(self.reddit)
+        self.fetch_changes.return_value = [
+            (1100, 'banuser', 'NewSpammer'), (1200, 'unbanuser', 'troll')]
+        self.now += 300
+        updated = cache.refresh(self.reddit)
+        self.assertEqual(updated, {'spammer', 'newspammer'})
+        self.fetch_changes.assert_called_once_with(
+            self.reddit, 1000 - banned.CLOCK_MARGIN)
+        self.assertEqual(cache.last_change, 1200)
+        # Sets that were handed out earlier are left untouched.
+        self.assertEqual(users, {'spammer', 'troll'})
+
+    def test_full_refresh(self):
+        cache = self.new_cache()
+        cache.refresh(self.reddit)
+        # Fall back to the full list if the changes can't be retrieved.
+        self.fetch_changes.return_value = None
+        self.now += 300
+        cache.refresh(self.reddit)
+        self.assertEqual(self.fetch_all.call_count, 2)
+        self.now += 3600
+        cache.refresh(self.reddit)
+        self.assertEqual(self.fetch_all.call_count, 3)
+
+    def test_failed_fetch(self):
+        cache = self.new_cache()
+        cache.refresh(self.reddit)
+        self.fetch_all.return_value = None
+        self.assertEqual(cache.refresh(self.reddit, force=True),
+                         {'spammer', 'troll'})
+
+    def test_snapshot(self):
+        path = os.path.join(self.tmp, 'banned.json')
+        self.new_cache(snapshot_file=path).refresh(self.reddit)
+        cache = self.new_cache(snapshot_file=path)
+        self.assertEqual(cache.load(), {'spammer', 'troll'})
+        # A recent snapshot doesn't need to be refreshed on startup.
+        cache.refresh(self.reddit)
+        self.assertEqual(self.fetch_all.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
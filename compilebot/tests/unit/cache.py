@@ -0,0 +1,80 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import cache
+
+"""
+Unit test cases for the submission result cache. All tests in this module
+shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.cache
+"""
+
+def test_suite():
+    cases = [
+        TestResultCache
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cache.db')
+        self.details = {'output': "Hello World\n", 'result': 15, 'link': 'abc'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def new_cache(self, **kwargs):
+        return cache.ResultCache(clock=lambda: self.now, **kwargs)
+
+    def test_key(self):
+        key = cache.ResultCache.key('python', 'print(1)', '')
+        self.assertEqual(key, cache.ResultCache.key('python', 'print(1)'))
+        self.assertNotEqual(key, cache.ResultCache.key('python', 'print(1)',
+                                                       '5'))
+        self.assertNotEqual(key, cache.ResultCache.key('python 3', 'print(1)'))
+
+    def test_get_put(self):
+        c = self.new_cache()
+        self.assertIsNone(c.get('key'))
+        c.put('key', self.details)
+        details = c.get('key')
+        self.assertEqual(details, self.details)
+        # Changes to returned details must not affect the cache.
+        details['output'] = ''
+        self.assertEqual(c.get('key'), self.details)
+        self.assertEqual((c.hits, c.misses), (2, 1))
+
+    def test_ttl(self):
+        c = self.new_cache(ttl=60)
+        c.put('key', self.details)
+        self.now = 61
+        self.assertIsNone(c.get('key'))
+
+    def test_size(self):
+        c = self.new_cache(size=2)
+        c.put('a', self.details)
+        c.put('b', self.details)
+        c.get('a')
+        c.put('c', self.details)
+        self.assertIsNone(c.get('b'))
+        self.assertIsNotNone(c.get('a'))
+
+    def test_persistence(self):
+        c = self.new_cache(path=self.path)
+        c.put('key', self.details)
+        c = self.new_cache(path=self.path)
+        self.assertEqual(c.get('key'), self.details)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
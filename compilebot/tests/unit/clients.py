@@ -0,0 +1,84 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+import threading
+import clients
+
+"""
+Unit test cases for the pool of shared API clients. All tests in this
+module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.clients
+"""
+
+def test_suite():
+    cases = [
+        TestClientPool
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestClientPool(unittest.TestCase):
+
+    class LookupError(Exception):
+        pass
+
+    def setUp(self):
+        self.pool = clients.ClientPool(object, size=2,
+                                       preserve=(self.LookupError,))
+
+    def test_reuse(self):
+        with self.pool.client() as first:
+            pass
+        with self.pool.client() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.created, 1)
+
+    def test_rebuild_after_failure(self):
+        try:
+            with self.pool.client() as first:
+                raise IOError("Connection reset")
+        except IOError:
+            pass
+        with self.pool.client() as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.discarded, 1)
+
+    def test_preserved_errors(self):
+        try:
+            with self.pool.client() as first:
+                raise self.LookupError()
+        except self.LookupError:
+            pass
+        with self.pool.client() as second:
+            pass
+        self.assertIs(first, second)
+
+    def test_size_limit(self):
+        in_use, peak = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with self.pool.client():
+                with lock:
+                    in_use[0] += 1
+                    peak[0] = max(peak[0], in_use[0])
+                threading.Event().wait(0.01)
+                with lock:
+                    in_use[0] -= 1
+
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(self.pool.created, 2)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
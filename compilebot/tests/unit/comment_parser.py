@@ -0,0 +1,131 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+from mock import patch
+import compilebot as cb
+import comment_parser
+from tests import helpers
+from tests.benchmark.comments import REGEX, USER, CASES
+
+"""
+Unit test cases for the comment parser. Every case is also parsed by the
+regular expression the parser replaced, and both must agree. All tests in
+this module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.comment_parser
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestCommentParser, TestMentions
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+def regex_parse(body):
+    """Parse a comment the way the original parse_comment did."""
+    m = REGEX.search(body)
+    if m is None:
+        return None
+    return m.group('args'), m.group('src'), m.group('in') or ''
+
+
+class TestCommentParser(unittest.TestCase):
+
+    # The cases of the original TestParseComment, followed by comments
+    # that the two parsers could disagree on.
+    BODIES = [
+        "This sentence should not be included. +/u/{user} python 3\n\n"
+        "    print(\"Test\")\n\n"
+        "This sentence should not be included.",
+        "+/u/{user} python 3 --time\n\n"
+        "    \n        x = input()\n    print(\"x\")\n    \n\n\n"
+        "Input: \n\n    5\n    6\n    7",
+        "+/u/{user} Java\n\n Source code missing\n\n",
+        "+/u/{user} python\n\tprint(1)\n\tprint(2)\n",
+        "+/U/{lower} python\n\n    print(1)",
+        "+/u/{user}\n\n    print(1)\n",
+        "+/u/{user}    \n    print(1)\n",
+        "+/u/{user} c\n\n    int x;\n\n\n    x++;\nafter\n    not code",
+        "+/u/{user} python\n\n    x = input()\nstdin\n\n    4\n",
+        "+/u/{user} python\n\n    x = input()\n\n  STDIN:  \n\t4\n\t5",
+        "+/u/{user} python\n\n    x = input()\nInput\ntext\n    4\n",
+        "+/u/{user} python\n\n    x = input()\nInputs:\n\n    4\n",
+        "+/u/{user} python\r\n\r\n    print(1)\r\n",
+        "+/u/{user} a\n+/u/{user} b\n\n    print(1)\n",
+        "+/u/{user} +/u/{user} python\n\n    print(1)\n",
+        "/u/{user} python\n\n    print(1)\n",
+        "+/u/{user} python\n   \n  \n",
+        "+/u/{user} python",
+        "",
+    ]
+
+    def setUp(self):
+        self.parser = comment_parser.CommentParser(USER)
+
+    def assertSameAsRegex(self, body):
+        self.assertEqual(self.parser.parse(body), regex_parse(body),
+                         "Parsers disagree on {!r}".format(body[:200]))
+
+    def test_original_cases(self):
+        with patch.object(cb.config, 'R_USERNAME', USER):
+            args, source, stdin = cb.parse_comment(self.BODIES[0].format(
+                user=USER))
+            self.assertEqual((args, source, stdin),
+                             ('python 3', 'print(\"Test\")', ''))
+            args, source, stdin = cb.parse_comment(self.BODIES[1].format(
+                user=USER))
+            self.assertEqual((args, source, stdin),
+                             ('python 3 --time',
+                              '    x = input()\nprint(\"x\")\n', '5\n6\n7'))
+            self.assertRaises(AttributeError, cb.parse_comment,
+                              self.BODIES[2].format(user=USER))
+
+    def test_same_as_regex(self):
+        for body in self.BODIES:
+            self.assertSameAsRegex(body.format(user=USER, lower=USER.lower()))
+
+    def test_adversarial(self):
+        # The benchmark cases, at sizes the regular expression can still
+        # get through quickly.
+        for name, build in CASES:
+            for n in (1, 2, 50):
+                self.assertSameAsRegex(build(n))
+
+    def test_large_inputs(self):
+        cases = dict(CASES)
+        args, src, stdin = self.parser.parse(cases["long source"](10000))
+        self.assertEqual(src.count('\n    '), 9999)
+        self.assertIsNone(self.parser.parse(
+            cases["repeated mentions"](10000)))
+        self.assertIsNone(self.parser.parse(
+            cases["mentions on one line"](10000)))
+
+    def test_no_username(self):
+        parser = comment_parser.CommentParser('')
+        body = "+/u/someone python\n\n    print(1)\n"
+        self.assertFalse(parser.mentions(body))
+        self.assertIsNone(parser.parse(body))
+
+
+class TestMentions(unittest.TestCase):
+
+    def test_trigger_matches_parser(self):
+        # The mention that triggers a reply is the one that is parsed,
+        # whatever the username setting is.
+        body = "+/u/{} python\n\n    print(1)\n\n"
+        for username in ('CompileBot', None):
+            with patch.object(cb.config, 'R_USERNAME', username):
+                parser = cb.get_parser()
+                self.assertEqual(parser.username, username or '')
+                mention = body.format(username or 'None')
+                self.assertEqual(parser.mentions(mention),
+                                 parser.parse(mention) is not None)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,119 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import socket
+import unittest
+import threading
+import ideone_standin
+
+"""
+Unit test cases for the local ideone stand-in. All tests in this module
+shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.ideone_standin
+"""
+
+def test_suite():
+    cases = [
+        TestStandinIdeone, TestStandinService
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestStandinIdeone(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.standin = ideone_standin.StandinIdeone(
+            run_time=1, seed=1, clock=lambda: self.now)
+
+    def test_status_progression(self):
+        link = self.standin.create_submission('print(1)', 'python')['link']
+        statuses = []
+        for step in range(20):
+            statuses.append(self.standin.submission_details(link)['status'])
+            self.now += 0.1
+        # Statuses only move forward and end with a finished submission.
+        order = [-1, 1, 3, 0]
+        self.assertEqual(statuses, sorted(statuses, key=order.index))
+        self.assertEqual(statuses[-1], 0)
+        self.assertEqual(statuses[0], -1)
+
+    def test_finished_details(self):
+        link = self.standin.create_submission(
+            'print(input())', 'Python 3', std_input='Hello')['link']
+        self.now += 2
+        details = self.standin.submission_details(link)
+        self.assertEqual(details['result'], 15)
+        self.assertEqual(details['output'], 'Hello')
+        self.assertEqual(details['langName'], 'Python 3')
+        self.assertEqual(details['source'], 'print(input())')
+
+    def test_result_weights(self):
+        self.standin.results = {11: 1, 13: 1}
+        results = set()
+        for n in range(50):
+            link = self.standin.create_submission('x', 'c')['link']
+            self.now += 2
+            details = self.standin.submission_details(link)
+            results.add(details['result'])
+            if details['result'] == 11:
+                self.assertTrue(details['cmpinfo'])
+        self.assertEqual(results, set([11, 13]))
+
+    def test_unknown_language(self):
+        with self.assertRaises(ideone_standin.LanguageNotFoundError) as e:
+            self.standin.create_submission('x', 'pyth')
+        self.assertIn('Python', e.exception.similar_languages)
+
+    def test_failure_injection(self):
+        self.standin.failure_rate = 0.5
+        failures = 0
+        for n in range(100):
+            try:
+                self.standin.languages()
+            except socket.error:
+                failures += 1
+        self.assertTrue(20 < failures < 80)
+        self.assertEqual(self.standin.calls, 100)
+
+
+class TestStandinService(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import requests
+        except ImportError:
+            self.skipTest("requests is not installed")
+        self.standin = ideone_standin.StandinIdeone(run_time=0)
+        self.server = ideone_standin.serve(self.standin, port=0)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = ideone_standin.RemoteIdeone(
+            'http://127.0.0.1:{}'.format(self.server.server_address[1]))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_submission(self):
+        link = self.client.create_submission('x', 'C', std_input='1')['link']
+        details = self.client.submission_details(link)
+        self.assertEqual(details['status'], 0)
+        self.assertEqual(details['output'], '1')
+        self.assertEqual(self.client.languages()[11], 'C (gcc 4.9.2)')
+
+    def test_unknown_language(self):
+        with self.assertRaises(ideone_standin.LanguageNotFoundError) as e:
+            self.client.create_submission('x', 'C+')
+        self.assertEqual(e.exception.similar_languages, ['C', 'C++', 'C++14'])
+
+    def test_failure(self):
+        self.standin.failure_rate = 1
+        self.assertRaises(socket.error, self.client.languages)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
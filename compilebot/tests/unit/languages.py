@@ -0,0 +1,117 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import os
+import shutil
+import tempfile
+import unittest
+from mock import Mock, patch
+import compilebot as cb
+import clients
+import ideone_standin
+import languages
+from tests import helpers
+
+"""
+Unit test cases for the language catalog. All tests in this module
+shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.languages
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestLanguageCatalog, TestUnknownLanguage
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestLanguageCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000
+        self.dir = tempfile.mkdtemp()
+        self.fetch = Mock(return_value=dict(ideone_standin.LANGUAGES))
+        self.catalog = self.create()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def create(self):
+        return languages.LanguageCatalog(
+            self.fetch, aliases={'Python3': 'Python 3', 'Node': 'Node.js'},
+            refresh_interval=60,
+            cache_file=os.path.join(self.dir, 'languages.json'),
+            clock=lambda: self.now)
+
+    def test_resolve(self):
+        self.catalog.refresh()
+        self.assertEqual(self.catalog.resolve('python'),
+                         "Python (python 2.7.9)")
+        self.assertEqual(self.catalog.resolve(' Python  3 '),
+                         "Python 3 (python 3.4.3)")
+        self.assertEqual(self.catalog.resolve('node'), "Node.js (0.10.35)")
+        self.assertEqual(self.catalog.resolve('C++14 (gcc-5 5.1.1)'),
+                         "C++14 (gcc-5 5.1.1)")
+        self.assertIsNone(self.catalog.resolve('pyhton'))
+
+    def test_suggest(self):
+        self.catalog.refresh()
+        self.assertEqual(self.catalog.suggest('pyhton')[0], 'Python')
+        self.assertEqual(self.catalog.suggest('cobol'), [])
+
+    def test_refresh(self):
+        self.catalog.refresh()
+        self.catalog.refresh()
+        self.assertEqual(self.fetch.call_count, 1)
+        self.now += 61
+        self.fetch.return_value = None
+        # The languages are kept if a fetch fails.
+        self.assertEqual(len(self.catalog.refresh()), 7)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_cache_file(self):
+        self.catalog.refresh()
+        catalog = self.create()
+        self.assertEqual(catalog.load(), self.catalog.languages)
+        catalog.refresh()
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(catalog.resolve('java'), "Java (sun-jdk-8u31)")
+
+
+class TestUnknownLanguage(unittest.TestCase):
+
+    def setUp(self):
+        self.ideone = ideone_standin.StandinIdeone(run_time=0)
+        self.catalog = languages.LanguageCatalog(cb.get_languages)
+        self.patches = patch.multiple(
+            cb, LANGUAGES=self.catalog,
+            IDEONE_CLIENTS=clients.ClientPool(lambda: self.ideone, size=1))
+        self.patches.start()
+
+    def tearDown(self):
+        self.patches.stop()
+
+    @patch.object(cb.config, 'R_USERNAME', helpers.USERNAME)
+    def test_unknown_language(self):
+        comment = Mock(body=helpers.mention(lang='Pyhton'))
+        comment.author.name = 'polyglot'
+        with patch.object(self.ideone, 'create_submission') as create:
+            reply = cb.create_reply(comment)
+        self.assertFalse(create.called)
+        self.assertIsInstance(reply, cb.MessageReply)
+        self.assertIn('Python', reply.text)
+
+    def test_no_languages(self):
+        with patch.object(self.ideone, 'languages', return_value={}):
+            self.assertIsNone(cb.unknown_language('pyhton'))
+        self.catalog.refresh(force=True)
+        self.assertIsNone(cb.unknown_language('python'))
+        self.assertEqual(cb.unknown_language('pyhton')[0], 'Python')
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
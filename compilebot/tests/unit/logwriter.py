@@ -0,0 +1,86 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import logwriter
+
+"""
+Unit test cases for the background log file writer. All tests in this
+module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.logwriter
+"""
+
+def test_suite():
+    cases = [
+        TestLogWriter
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'bot.log')
+        self.now = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, path=None):
+        with open(path or self.path, 'rb') as f:
+            return f.read()
+
+    def new_writer(self, **kwargs):
+        return logwriter.LogWriter(self.path, flush_interval=0.01,
+                                   clock=lambda: self.now, **kwargs)
+
+    def test_write(self):
+        writer = self.new_writer()
+        for i in range(500):
+            writer.write("line {}\n".format(i).encode('utf8'))
+        writer.flush()
+        self.assertEqual(self.read().count(b'\n'), 500)
+        writer.write(b"last line\n")
+        writer.close()
+        self.assertTrue(self.read().endswith(b"last line\n"))
+        # Lines written after closing are ignored.
+        writer.write(b"ignored\n")
+
+    def test_rotate_by_size(self):
+        writer = self.new_writer(max_bytes=10, backup_count=2)
+        for line in [b"first\n", b"second\n", b"third\n", b"fourth\n"]:
+            writer.write(line)
+            writer.flush()
+        writer.close()
+        self.assertEqual(self.read(), b"fourth\n")
+        self.assertEqual(self.read(self.path + '.1'), b"third\n")
+        self.assertEqual(self.read(self.path + '.2'), b"second\n")
+        self.assertFalse(os.path.exists(self.path + '.3'))
+
+    def test_rotate_by_time(self):
+        writer = self.new_writer(rotate_interval=60)
+        writer.write(b"old\n")
+        writer.flush()
+        self.now = 60
+        writer.write(b"new\n")
+        writer.close()
+        self.assertEqual(self.read(), b"new\n")
+        self.assertEqual(self.read(self.path + '.1'), b"old\n")
+
+    def test_full_queue(self):
+        writer = self.new_writer(queue_size=1)
+        writer.close()
+        writer._closed = False
+        writer.write(b"queued\n")
+        writer.write(b"dropped\n")
+        self.assertEqual(writer.dropped, 1)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
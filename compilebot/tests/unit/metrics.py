@@ -0,0 +1,143 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+import threading
+import requests
+from mock import Mock, patch
+import compilebot as cb
+import metrics
+from tests import helpers
+
+"""
+Unit test cases for metrics and the metrics endpoint. All tests in this
+module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.metrics
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestMetrics, TestMetricsServer, TestBotMetrics
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter('requests_total', "Requests",
+                                        labels=('kind',))
+        counter.inc(kind='mention')
+        counter.inc(2, kind='mention')
+        counter.inc(kind='message')
+        self.assertEqual(counter.value(kind='mention'), 3)
+        self.assertRaises(ValueError, counter.inc, other='x')
+        self.assertEqual(self.registry.exposition(),
+                         '# HELP requests_total Requests\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{kind="mention"} 3.0\n'
+                         'requests_total{kind="message"} 1.0\n')
+
+    def test_gauge_function(self):
+        depth = [4]
+        gauge = self.registry.gauge('depth', "Depth")
+        gauge.set_function(lambda: depth[0])
+        self.assertEqual(gauge.value(), 4)
+        depth[0] = 2
+        self.assertIn('depth 2.0\n', self.registry.exposition())
+
+    def test_histogram(self):
+        now = [0]
+        histogram = metrics.Histogram('seconds', "Seconds", buckets=(1, 5),
+                                      clock=lambda: now[0])
+        self.registry.register(histogram)
+        histogram.observe(0.5)
+        histogram.observe(3)
+        with histogram.time():
+            now[0] = 10
+        self.assertEqual(histogram.count(), 3)
+        text = self.registry.exposition()
+        self.assertIn('seconds_bucket{le="1.0"} 1.0\n', text)
+        self.assertIn('seconds_bucket{le="5.0"} 2.0\n', text)
+        self.assertIn('seconds_bucket{le="+Inf"} 3.0\n', text)
+        self.assertIn('seconds_sum 13.5\n', text)
+        self.assertIn('seconds_count 3.0\n', text)
+
+    def test_duplicate(self):
+        self.registry.counter('a', "A")
+        self.assertRaises(ValueError, self.registry.gauge, 'a', "A")
+
+    def test_escape(self):
+        counter = self.registry.counter('errors', "Errors", labels=('type',))
+        counter.inc(type='a "b"\n')
+        self.assertIn('errors{type="a \\"b\\"\\n"} 1.0',
+                      self.registry.exposition())
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    def test_serve(self):
+        registry = metrics.Registry()
+        registry.counter('up', "Up").inc()
+        server = metrics.serve(registry, port=0)
+        try:
+            url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+            response = requests.get(url + '/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('up 1.0', response.text)
+            self.assertEqual(requests.get(url + '/other').status_code, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestBotMetrics(helpers.BotTestCase):
+
+    results = {15: 1}
+
+    def test_process_inbox(self):
+        registry = metrics.Registry()
+        stages = registry.histogram('stages', "Stages", labels=('stage',))
+        results = registry.counter('results', "Results", labels=('result',))
+        self.r.add_comment(helpers.mention(), 'user')
+        with patch.multiple(cb, STAGE_SECONDS=stages, RESULTS=results):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        for stage in ('parse', 'compile', 'poll', 'reply'):
+            self.assertEqual(stages.count(stage=stage), 1)
+        self.assertEqual(results.value(result=15), 1)
+        # Metrics computed from other parts of the bot can be read.
+        self.assertIn('compilebot_cache_requests_total',
+                      cb.METRICS.exposition())
+
+    def test_inbox_backlog(self):
+        jobs = cb.QUEUE_JOBS
+        started = threading.Event()
+        finish = threading.Event()
+
+        def process(new, r):
+            started.set()
+            finish.wait()
+
+        with patch.multiple(cb, WORK_QUEUE=None, handle_unread=process):
+            workers = cb.InboxWorkers(Mock(), 1, max_waiting=5)
+            try:
+                for n in range(3):
+                    workers.submit(Mock(body=''))
+                started.wait()
+                self.assertEqual(jobs.value(state='queued'), 2)
+                self.assertEqual(jobs.value(state='running'), 1)
+            finally:
+                finish.set()
+                workers.close()
+            self.assertEqual(jobs.value(state='queued'), 0)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,80 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+import polling
+
+"""
+Unit test cases for the ideone submission poll scheduler. All tests in
+this module use a simulated clock and shouldn't make any requests to
+reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.polling
+"""
+
+def test_suite():
+    cases = [
+        TestPollScheduler
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestPollScheduler(unittest.TestCase):
+
+    class Clock(object):
+        def __init__(self):
+            self.now = 0.0
+            self.sleeps = []
+
+        def time(self):
+            return self.now
+
+        def sleep(self, seconds):
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+    def setUp(self):
+        self.clock = self.Clock()
+        self.scheduler = polling.PollScheduler(
+            initial_interval=2, min_interval=0.5, max_interval=8, backoff=2,
+            timeout=30, clock=self.clock.time, sleep=self.clock.sleep)
+
+    def submission(self, run_time):
+        """Return a check function for a submission that finishes after
+        run_time seconds.
+        """
+        return lambda: 'done' if self.clock.now >= run_time else None
+
+    def test_backoff(self):
+        result, stats = self.scheduler.poll('python', self.submission(20))
+        self.assertEqual(result, 'done')
+        self.assertEqual(self.clock.sleeps, [2, 4, 8, 8])
+        self.assertEqual(stats.polls, 4)
+        self.assertEqual(stats.elapsed, 22)
+
+    def test_timeout(self):
+        self.assertRaises(polling.PollTimeoutError, self.scheduler.poll,
+                          'python', self.submission(100))
+        self.assertEqual(sum(self.clock.sleeps), 30)
+        self.assertEqual(self.scheduler.stats['python']['timeouts'], 1)
+
+    def test_deadline(self):
+        self.assertRaises(polling.PollTimeoutError, self.scheduler.poll,
+                          'python', self.submission(100), deadline=5)
+        self.assertEqual(sum(self.clock.sleeps), 5)
+
+    def test_learns_run_times(self):
+        # Slow languages should be polled later than fast ones.
+        for i in range(5):
+            self.clock.now = 0
+            self.scheduler.poll('java', self.submission(6))
+            self.clock.now = 0
+            self.scheduler.poll('c', self.submission(0.1))
+        self.assertGreater(self.scheduler.first_delay('java'), 2)
+        self.assertLess(self.scheduler.first_delay('c'), 1)
+        self.assertEqual(self.scheduler.stats['c']['submissions'], 5)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -2,6 +2,7 @@ from __future__ import unicode_literals, print_function
 import unittest
 import compilebot as cb
 from sys import modules
+from itertools import islice
 from mock import Mock, patch
 from tests import helpers
 
@@ -18,7 +19,8 @@ cb.LOG_FILE = helpers.LOG_FILE
 
 def test_suite():
     cases = [
-        TestSendModMail, TestGetBanned, TestSendAdminMessage, TestMain
+        TestSendModMail, TestGetBanned, TestSendAdminMessage, TestMain,
+        TestInboxStream
     ]
     alltests = [
         unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
@@ -61,12 +63,29 @@ class TestSendAdminMessage(unittest.TestCase):
     @patch('{}.cb.praw.Reddit'.format(__name__), autospec=True)
     def test_send_admin_message(self, mock_reddit):
         r = mock_reddit.return_value
-        cb.ADMIN = 'AdminUser'
+        cb.config.ADMIN = 'AdminUser'
         body = "Hello Admin"
         cb.log(body, alert=True)
-        args, kwargs = r.send_message.call_args
-        self.assertTrue(body in args[2])
-        r.send_message.assert_called_once_with('AdminUser', args[1], args[2])
+        cb.log(body, alert=True)
+        cb.log("Another alert", alert=True)
+        cb.ALERTS.flush()
+        # All alerts are sent in one message and duplicates are merged.
+        r.redditor.assert_called_once_with('AdminUser')
+        args, kwargs = r.redditor.return_value.message.call_args
+        self.assertEqual(args[1].count(body), 1)
+        self.assertIn("(x2)", args[1])
+        self.assertIn("Another alert", args[1])
+
+    def test_attached_session(self):
+        r = Mock()
+        cb.config.ADMIN = 'AdminUser'
+        cb.ALERTS.attach(r)
+        with patch('{}.cb.praw.Reddit'.format(__name__)) as mock_reddit:
+            cb.log("Hello Admin", alert=True)
+            cb.ALERTS.flush()
+        self.assertFalse(mock_reddit.called)
+        self.assertTrue(r.redditor.return_value.message.called)
+        cb.ALERTS.attach(None)
 
 class TestMain(unittest.TestCase):
 
@@ -82,6 +101,44 @@ class TestMain(unittest.TestCase):
             mock_process_unread.assert_any_call(new, r)
             new.mark_as_read.assert_called_with()
 
+    # praw 5 sets the inbox on each instance, which an autospec of
+    # praw.Reddit doesn't have.
+    @patch('{}.cb.process_unread'.format(__name__), autospec=True)
+    @patch('{}.cb.praw.Reddit'.format(__name__))
+    def test_main_concurrent(self, mock_reddit, mock_process_unread):
+        r = mock_reddit.return_value
+        mock_inbox = [Mock(body='') for i in range(10)]
+        r.inbox.unread.return_value = mock_inbox
+        # A failure on one item must not affect the others.
+        mock_process_unread.side_effect = lambda new, r: (
+            new is mock_inbox[3] and 1 / 0)
+        with patch.multiple(cb.config, WORKER_THREADS=4, SUBREDDIT=None), \
+                patch.object(cb, 'WORK_QUEUE', None), \
+                patch.object(cb.ALERTS, 'session', None), \
+                patch('{}.cb.log'.format(__name__)) as mock_log:
+            cb.main()
+        for new in mock_inbox:
+            mock_process_unread.assert_any_call(new, r)
+            new.mark_read.assert_called_once_with()
+        self.assertTrue(mock_log.call_args[1]['alert'])
+
+class TestInboxStream(unittest.TestCase):
+
+    def test_inbox_stream(self):
+        r = Mock()
+        a, b, c = Mock(id='a'), Mock(id='b'), Mock(id='c')
+        r.inbox.unread.side_effect = [[a, b], [b], [], [c]]
+        on_poll = Mock()
+        with patch.object(cb.config, 'STREAM_MIN_WAIT', 1), \
+                patch.object(cb.config, 'STREAM_MAX_WAIT', 16), \
+                patch('{}.cb.time.sleep'.format(__name__)) as mock_sleep:
+            items = list(islice(cb.inbox_stream(r, on_poll), 3))
+        self.assertEqual(items, [a, b, c])
+        # Items that were already seen are skipped and the wait doubles
+        # while the inbox is idle.
+        self.assertEqual(mock_sleep.call_args_list, [((1,),), ((2,),)])
+        self.assertEqual(on_poll.call_count, 4)
+
 if __name__ == "__main__":
     unittest.main(exit=False)
 
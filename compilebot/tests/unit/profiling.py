@@ -0,0 +1,123 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import io
+import shutil
+import tempfile
+import threading
+import unittest
+from mock import Mock, patch
+import compilebot as cb
+import profiling
+from tests import helpers
+
+"""
+Unit test cases for the sampling profiler. All tests in this module
+shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.profiling
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestStackSampler, TestProfiler
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+def wait_for_release(started, release):
+    started.set()
+    release.wait()
+
+
+class TestStackSampler(unittest.TestCase):
+
+    def test_sample(self):
+        started, release = threading.Event(), threading.Event()
+        thread = threading.Thread(target=wait_for_release,
+                                  args=(started, release), name='Sampled-1')
+        thread.start()
+        started.wait()
+        try:
+            sampler = profiling.StackSampler(
+                threads=lambda: set([thread.ident]))
+            sampler.sample()
+        finally:
+            release.set()
+            thread.join()
+        (stack, count), = sampler.counts.items()
+        self.assertEqual(count, 1)
+        self.assertTrue(stack.startswith('Sampled;'))
+        self.assertIn('profiling.py:wait_for_release', stack)
+        self.assertEqual(sampler.collapsed(), "{} 1\n".format(stack))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.written = []
+        self.done = threading.Event()
+
+        def on_write(path, samples):
+            self.written.append(path)
+            self.done.set()
+
+        self.profiler = profiling.Profiler(self.dir, interval=0.001,
+                                           on_write=on_write)
+
+    def tearDown(self):
+        self.profiler.stop()
+        shutil.rmtree(self.dir)
+
+    def read(self, path):
+        with io.open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_calls(self):
+        release = threading.Event()
+
+        def call():
+            with self.profiler.call():
+                release.wait()
+
+        self.assertTrue(self.profiler.profile_calls(2))
+        self.assertFalse(self.profiler.profile_window(10))
+        threads = [threading.Thread(target=call) for n in range(3)]
+        for thread in threads:
+            thread.start()
+        release.wait(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(self.done.wait(5))
+        self.assertFalse(self.profiler.counting)
+        self.assertFalse(self.profiler.active)
+        self.assertIn('profiling.py:call', self.read(self.written[0]))
+
+    def test_window(self):
+        self.profiler.profile_window(0.05)
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(len(self.written), 1)
+        self.assertTrue(self.written[0].endswith('.collapsed'))
+
+    def test_toggle(self):
+        self.profiler.toggle(60)
+        self.assertTrue(self.profiler.active)
+        self.profiler.toggle(60)
+        self.assertFalse(self.profiler.active)
+        self.assertEqual(len(self.written), 1)
+        self.assertIsNone(self.profiler.stop())
+
+    def test_profiled_off(self):
+        profiler = Mock(counting=False)
+        with patch.object(cb, 'PROFILER', profiler):
+            self.assertEqual(cb.profiled(lambda: 1)(), 1)
+        self.assertFalse(profiler.call.called)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
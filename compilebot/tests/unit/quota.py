@@ -0,0 +1,211 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import os
+import shutil
+import tempfile
+import unittest
+from mock import Mock, patch
+import compilebot as cb
+import cache
+import clients
+import ideone_standin
+import polling
+import quota
+from tests import helpers
+
+"""
+Unit test cases for the ideone rate limit and submission budgets. All
+tests in this module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.quota
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestQuotaTracker, TestCompileQuota
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestQuotaTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'quota.db')
+        # 2020-01-15 12:00 UTC
+        self.now = 1579089600.0
+        self.warnings = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def tracker(self, **kwargs):
+        return quota.QuotaTracker(path=self.path, clock=lambda: self.now,
+                                  on_warning=self.warnings.append, **kwargs)
+
+    def test_daily_budget(self):
+        tracker = self.tracker(daily_budget=3)
+        for n in range(3):
+            tracker.reserve()
+        self.assertRaises(quota.QuotaExceededError, tracker.reserve)
+        # The daily count starts over the next UTC day.
+        self.now += 86400
+        tracker.reserve()
+        self.assertEqual(tracker.usage()['daily']['submissions'], 1)
+        self.assertEqual(tracker.usage()['monthly']['submissions'], 4)
+
+    def test_monthly_budget(self):
+        tracker = self.tracker(monthly_budget=2)
+        tracker.reserve()
+        self.now += 86400 * 2
+        tracker.reserve()
+        self.assertRaises(quota.QuotaExceededError, tracker.reserve)
+
+    def test_release(self):
+        tracker = self.tracker(daily_budget=1)
+        tracker.reserve()
+        tracker.release()
+        tracker.reserve()
+        self.assertEqual(tracker.usage()['daily']['submissions'], 1)
+
+    def test_shared_between_processes(self):
+        first, second = self.tracker(daily_budget=2), self.tracker(
+            daily_budget=2)
+        first.reserve()
+        second.reserve()
+        self.assertRaises(quota.QuotaExceededError, first.reserve)
+        # A refused reservation doesn't keep the file locked.
+        second.release()
+        self.assertEqual(first.usage()['daily']['submissions'], 1)
+
+    def test_warning_and_degrade(self):
+        tracker = self.tracker(daily_budget=10, warn_fraction=0.5,
+                               degrade_fraction=0.8)
+        for n in range(4):
+            tracker.reserve()
+        self.assertEqual(self.warnings, [])
+        tracker.reserve()
+        self.assertEqual(len(self.warnings), 1)
+        self.assertIn('50% of the daily', self.warnings[0])
+        # Other processes don't warn about the same day again.
+        self.tracker(daily_budget=10, warn_fraction=0.5).reserve()
+        self.assertEqual(len(self.warnings), 1)
+        self.assertFalse(tracker.degraded())
+        tracker.reserve()
+        tracker.reserve()
+        self.assertTrue(tracker.degraded())
+
+    def test_rate_limit(self):
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            self.now += seconds
+
+        tracker = quota.QuotaTracker(rate=2, burst=2, clock=lambda: self.now,
+                                     sleep=sleep)
+        for n in range(4):
+            tracker.acquire()
+        self.assertEqual(sleeps, [0.5, 0.5])
+        self.assertEqual(tracker.usage()['daily']['calls'], 4)
+
+    def test_rate_limit_shared(self):
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            self.now += seconds
+
+        first, second = [self.tracker(rate=1, burst=2, sleep=sleep)
+                         for n in range(2)]
+        first.acquire()
+        second.acquire()
+        # The burst is used up by both processes together.
+        first.acquire()
+        self.assertEqual(sleeps, [1])
+        self.assertEqual(second.usage()['daily']['calls'], 3)
+
+    def test_check_degraded(self):
+        tracker = self.tracker(daily_budget=4, degrade_fraction=0.5)
+        tracker.reserve()
+        tracker.check_degraded()
+        tracker.reserve()
+        self.assertRaises(quota.QuotaDegradedError, tracker.check_degraded)
+
+
+class TestCompileQuota(unittest.TestCase):
+
+    def setUp(self):
+        self.ideone = ideone_standin.StandinIdeone(run_time=0)
+        self.quota = quota.QuotaTracker(daily_budget=1)
+        self.patches = [
+            patch.object(cb, 'QUOTA', self.quota),
+            patch.object(cb, 'IDEONE_CLIENTS',
+                         clients.ClientPool(lambda: self.ideone, size=1)),
+            patch.object(cb, 'POLLER', polling.PollScheduler(
+                sleep=lambda seconds: None)),
+            patch.object(cb, 'RESULT_CACHE', cache.ResultCache(10)),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_budget_used_up(self):
+        details = cb.compile('print(1)', 'python')
+        self.assertEqual(self.quota.usage()['daily']['submissions'], 1)
+        # Cached results are still returned once the budget is used up.
+        self.assertEqual(cb.compile('print(1)', 'python'), details)
+        self.assertRaises(quota.QuotaExceededError, cb.compile,
+                          'print(2)', 'python')
+
+    def test_fresh_when_degraded(self):
+        details = cb.compile('print(1)', 'python')
+        with patch.object(self.ideone, 'create_submission') as create:
+            self.assertEqual(cb.compile('print(1)', 'python',
+                                        use_cache=False), details)
+        self.assertFalse(create.called)
+
+    def test_degraded_cache_miss(self):
+        self.quota.budgets['daily'] = 2
+        self.quota.degrade_fraction = 0.5
+        cb.compile('print(1)', 'python')
+        with patch.object(self.ideone, 'create_submission') as create:
+            self.assertRaises(quota.QuotaDegradedError, cb.compile,
+                              'print(2)', 'python')
+        self.assertFalse(create.called)
+        self.assertEqual(self.quota.usage()['daily']['submissions'], 1)
+
+    def test_failed_submission_not_counted(self):
+        with patch.object(self.ideone, 'create_submission',
+                          side_effect=ValueError):
+            self.assertRaises(ValueError, cb.compile, 'print(1)', 'python')
+        self.assertEqual(self.quota.usage()['daily']['submissions'], 0)
+
+    def test_failed_login_not_counted(self):
+        def login():
+            raise ValueError("Login failed")
+
+        with patch.object(cb, 'IDEONE_CLIENTS', clients.ClientPool(login)):
+            self.assertRaises(ValueError, cb.compile, 'print(1)', 'python')
+        self.assertEqual(self.quota.usage()['daily']['submissions'], 0)
+
+    @patch.object(cb.config, 'R_USERNAME', helpers.USERNAME)
+    def test_quota_reply(self):
+        comment = Mock(body=helpers.mention(lang='Python'))
+        comment.author.name = 'user'
+        with patch.object(cb, 'compile',
+                          side_effect=quota.QuotaExceededError('daily', 1, 1)):
+            reply = cb.create_reply(comment)
+        self.assertIsInstance(reply, cb.MessageReply)
+        self.assertIn(cb.config.QUOTA_TEXT, reply.text)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,128 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+from mock import patch
+import compilebot as cb
+import reddit_standin
+import reply_index
+from tests import helpers
+
+"""
+Unit test cases for the local reddit stand-in, and for the inbox handling
+of the bot run against the reddit and ideone stand-ins. All tests in this
+module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.reddit_standin
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestStandinReddit, TestMentionBurst, TestProcessInbox
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestStandinReddit(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.r = reddit_standin.StandinReddit('Bot', clock=lambda: self.now)
+
+    def test_arrivals(self):
+        first = self.r.add_comment('first', 'A', arrival=1001)
+        second = self.r.add_message('second', 'B', arrival=1002)
+        self.assertEqual(self.r.inbox.unread(), [])
+        self.now = 1002
+        self.assertEqual(self.r.inbox.unread(), [first, second])
+        first.mark_read()
+        self.assertEqual(self.r.inbox.unread(), [second])
+        self.assertEqual(self.r.inbox.pending(), 1)
+
+    def test_actions(self):
+        comment = self.r.add_comment('body', 'A')
+        reply = comment.reply('reply')
+        reply.edit('edited')
+        self.r.redditor('A').message('subject', 'text')
+        self.assertEqual(comment.replies, [reply])
+        self.assertEqual(reply.author.name, 'Bot')
+        self.assertEqual(self.r.comment(reply.id).body, 'edited')
+        self.assertEqual([a.action for a in self.r.find_actions()],
+                         ['reply', 'edit', 'message'])
+        self.assertEqual(self.r.find_actions('edit')[0].target, reply.id)
+
+    def test_modlog(self):
+        self.r.ban('A')
+        self.r.ban('B')
+        self.r.unban('A')
+        sub = self.r.subreddit('test')
+        self.assertEqual([u.name for u in sub.banned()], ['B'])
+        self.assertEqual([e.target_author for e in
+                          sub.mod.log(action='banuser')], ['B', 'A'])
+
+
+class TestMentionBurst(unittest.TestCase):
+
+    def test_burst_arrivals(self):
+        times = reddit_standin.burst_arrivals(1000, 60, start=10, seed=1)
+        self.assertEqual(times, sorted(times))
+        self.assertTrue(10 <= times[0] and times[-1] < 70)
+        # Most mentions arrive soon after the thread takes off.
+        early = len([t for t in times if t < 25])
+        self.assertTrue(early > 550)
+
+    def test_mention_burst(self):
+        r = reddit_standin.StandinReddit('Bot')
+        comments = reddit_standin.mention_burst(r, ['a', 'b'], 10, 0,
+                                                threads=2, users=3)
+        self.assertEqual(len(r.inbox.unread()), 10)
+        self.assertEqual([c.body for c in comments[:3]], ['a', 'b', 'a'])
+        self.assertTrue(len(set(c.submission.id for c in comments)) <= 2)
+
+
+class TestProcessInbox(helpers.BotTestCase):
+
+    def setUp(self):
+        helpers.BotTestCase.setUp(self)
+        self.start_patch(patch.object(cb, 'REPLY_INDEX',
+                                      reply_index.ReplyIndex()))
+        self.mention = helpers.mention("print('Hello')")
+
+    def test_mentions(self):
+        comments = reddit_standin.mention_burst(self.r, [self.mention], 8, 0)
+        with patch.object(cb.config, 'WORKER_THREADS', 4):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(self.r.inbox.pending(), 0)
+        replies = self.r.find_actions('reply')
+        self.assertEqual(sorted(a.target for a in replies),
+                         sorted(c.id for c in comments))
+        self.assertIn('Hello World', replies[0].text)
+
+    def test_recompile(self):
+        original = self.r.add_comment(self.mention, 'user')
+        with patch.object(cb.config, 'WORKER_THREADS', 1):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+            # Change the code so the recompiled output differs.
+            original.body = original.body.replace('Hello', 'Hi')
+            self.r.add_message('--recompile {}'.format(original.permalink),
+                               'user')
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        reply = original.replies[0]
+        self.assertEqual(len(original.replies), 1)
+        self.assertEqual(self.r.find_actions('edit')[0].target, reply.id)
+        self.assertIn('Recompile request by user', reply.body)
+
+    def test_banned_user(self):
+        self.r.add_comment(self.mention, 'Troll')
+        with patch.multiple(cb.config, WORKER_THREADS=1,
+                            BANNED_USERS=set(['troll'])):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(self.r.find_actions('reply'), [])
+        self.assertEqual(len(self.r.find_actions('mark_read')), 1)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
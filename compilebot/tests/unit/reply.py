@@ -32,7 +32,12 @@ def test_suite():
 class TestParseComment(unittest.TestCase):
 
     def setUp(self):
-        self.user = cb.R_USERNAME
+        self.user = helpers.USERNAME
+        self.patch = patch.object(cb.config, 'R_USERNAME', self.user)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
 
     def test_parser(self):
         body = ("This sentence should not be included. +/u/{user} python 3\n\n"
@@ -407,10 +412,8 @@ class TestHandleAPIExceptions(unittest.TestCase):
         mock.__name__ = str('mock')
         wrapped = cb.handle_api_exceptions()(mock)
         with patch('{}.cb.time.sleep'.format(__name__)) as mock_sleep:
-            try:
-                wrapped()
-            except cb.praw.socket.SocketError:
-                self.fail("SocketError not properly handled")
+            # The error is raised once every attempt failed.
+            self.assertRaises(socket.error, wrapped)
 
 if __name__ == "__main__":
     unittest.main(exit=False)
@@ -0,0 +1,109 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+from mock import patch
+import compilebot as cb
+import reply_index
+from tests import helpers
+
+"""
+Unit test cases for the index of the bot's replies and its use by
+recompile requests. All tests in this module shouldn't make any requests
+to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.reply_index
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestReplyIndex, TestIndexedReplies
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestReplyIndex(unittest.TestCase):
+
+    def test_put_get(self):
+        index = reply_index.ReplyIndex()
+        self.assertIsNone(index.get('abc'))
+        index.put('abc', 'def', 'h1', 'h2')
+        index.put('abc', 'ghi', 'h1', 'h3')
+        self.assertEqual(index.get('abc'),
+                         reply_index.IndexedReply('abc', 'ghi', 'h1', 'h3'))
+        index.remove('abc')
+        self.assertIsNone(index.get('abc'))
+
+    def test_text_hash(self):
+        self.assertNotEqual(reply_index.text_hash('ab', 'c'),
+                            reply_index.text_hash('a', 'bc'))
+        self.assertEqual(reply_index.text_hash('a', 1),
+                         reply_index.text_hash('a', '1'))
+
+
+class TestIndexedReplies(helpers.BotTestCase):
+
+    results = {15: 1}
+
+    def setUp(self):
+        helpers.BotTestCase.setUp(self)
+        self.index = reply_index.ReplyIndex()
+        self.start_patch(patch.object(cb, 'REPLY_INDEX', self.index))
+        self.comment = self.r.add_comment(helpers.mention(), 'user')
+        cb.process_inbox(self.r.inbox.unread(), self.r)
+
+    def recompile(self):
+        self.r.add_message("--recompile {}/title/{}".format(
+            self.comment.submission.id, self.comment.id), 'user')
+        cb.process_inbox(self.r.inbox.unread(), self.r)
+
+    def test_send_indexes_reply(self):
+        reply, = self.comment.replies
+        indexed = self.index.get(self.comment.id)
+        self.assertEqual(indexed.reply, reply.id)
+        self.assertEqual(indexed.source_hash,
+                         reply_index.text_hash(self.comment.body))
+
+    def test_unchanged_output(self):
+        self.recompile()
+        self.assertEqual(self.r.find_actions('edit'), [])
+        self.assertEqual(len(self.r.find_actions('reply')), 1)
+
+    def test_recompile_edits_indexed_reply(self):
+        reply, = self.comment.replies
+        # Bury the reply so it can only be found through the index.
+        self.comment.replies = []
+        indexed = self.index.get(self.comment.id)
+        self.index.put(self.comment.id, reply.id, indexed.source_hash,
+                       'stale')
+        self.recompile()
+        edit, = self.r.find_actions('edit')
+        self.assertEqual(edit.target, reply.id)
+        self.assertIn("Recompile request by user", reply.body)
+        self.assertEqual(len(self.r.find_actions('reply')), 1)
+        self.assertNotEqual(self.index.get(self.comment.id).output_hash,
+                            'stale')
+
+    def test_recompile_without_reply(self):
+        # Neither the index nor the comment's replies lead to a reply.
+        self.index.remove(self.comment.id)
+        self.comment.replies = []
+        self.recompile()
+        self.assertEqual(self.r.find_actions('edit'), [])
+        reply, = self.r.find_actions('reply', self.comment.id)[1:]
+        self.assertNotIn("Recompile request", reply.text)
+
+    def test_shortened_footnote(self):
+        footnote = "\n\n**EDIT:** Recompile request by user"
+        # The footer leaves room for only part of the footnote.
+        with patch.object(cb.config, 'FOOTER', 'x' * 9990):
+            reply = cb.create_reply(self.comment, footnote)
+        self.assertNotIn("**E", reply.text)
+        self.assertIn("**E", reply.edit_text)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,189 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import socket
+import unittest
+from mock import Mock, patch
+import compilebot as cb
+import cache
+import clients
+import retry
+from tests import helpers
+
+"""
+Unit test cases for retry policies and circuit breakers. All tests in this
+module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.retry
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestRetryPolicy, TestCircuitBreaker, TestRetries
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_backoff(self):
+        policy = retry.RetryPolicy(base_delay=2, max_delay=10, jitter=0.5,
+                                   random=lambda: 0)
+        self.assertEqual([policy.delay(n) for n in range(4)], [2, 4, 8, 10])
+        policy.random = lambda: 1
+        self.assertEqual(policy.delay(1), 2)
+
+    def test_retry_after(self):
+        policy = retry.RetryPolicy()
+        error = cb.praw.exceptions.APIException(
+            'RATELIMIT', 'you are doing that too much. try again in 9 '
+            'minutes.', None)
+        self.assertEqual(policy.delay(0, error), 540)
+        error = Exception()
+        error.response = Mock(headers={'retry-after': '30'})
+        self.assertEqual(policy.delay(0, error), 30)
+        self.assertIsNone(retry.retry_after(socket.error()))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.changes = []
+        self.breaker = retry.CircuitBreaker(
+            'ideone', failure_threshold=2, reset_timeout=60,
+            on_change=lambda breaker, state: self.changes.append(state),
+            clock=lambda: self.now)
+
+    def test_open_and_close(self):
+        self.breaker.failure()
+        self.breaker.before_call()
+        self.breaker.failure()
+        self.assertRaises(retry.CircuitOpenError, self.breaker.before_call)
+        # A single call is let through after the reset timeout.
+        self.now = 60
+        self.breaker.before_call()
+        self.assertRaises(retry.CircuitOpenError, self.breaker.before_call)
+        self.breaker.success()
+        self.breaker.before_call()
+        self.assertEqual(self.changes, ['open', 'half_open', 'closed'])
+        self.assertEqual(self.breaker.rejected, 2)
+
+    def test_failed_probe(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now = 60
+        self.breaker.before_call()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, retry.OPEN)
+        self.assertEqual(self.breaker.opened, 2)
+        self.now = 100
+        self.assertRaises(retry.CircuitOpenError, self.breaker.before_call)
+
+    def test_interrupted_probe(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now = 60
+        self.breaker.before_call()
+        self.breaker.release()
+        # The next call tests the service instead.
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, retry.HALF_OPEN)
+
+
+class TestRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = retry.CircuitBreaker('reddit', failure_threshold=3)
+        self.patches = [
+            patch.dict(cb.BREAKERS, {'reddit': self.breaker}),
+            patch.object(cb, 'RETRY_STATS', retry.RetryStats()),
+            patch.object(cb.time, 'sleep'),
+        ]
+        for p in self.patches:
+            p.start()
+        self.policy = retry.RetryPolicy(base_delay=1, random=lambda: 0)
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def wrap(self, side_effect, **kwargs):
+        mock = Mock(side_effect=side_effect)
+        mock.__name__ = str('mock')
+        return mock, cb.handle_api_exceptions(policy=self.policy,
+                                              **kwargs)(mock)
+
+    def test_backoff(self):
+        mock, wrapped = self.wrap([socket.error(), socket.error(), 'ok'],
+                                  max_attempts=3)
+        self.assertEqual(wrapped(), 'ok')
+        self.assertEqual([c[0][0] for c in cb.time.sleep.call_args_list],
+                         [1, 2])
+        self.assertEqual(cb.RETRY_STATS.snapshot(),
+                         {('mock', 'retry'): 2, ('mock', 'success'): 1})
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_give_up(self):
+        mock, wrapped = self.wrap(socket.error(), max_attempts=2)
+        self.assertRaises(socket.error, wrapped)
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual(cb.time.sleep.call_count, 1)
+        self.assertEqual(cb.RETRY_STATS.snapshot()[('mock', 'gave_up')], 1)
+
+    def test_fail_fast(self):
+        mock, wrapped = self.wrap(socket.error(), max_attempts=5)
+        self.assertRaises(retry.CircuitOpenError, wrapped)
+        self.assertEqual(mock.call_count, 3)
+        self.assertEqual(cb.RETRY_STATS.snapshot()[('mock', 'rejected')], 1)
+        # Functions that don't belong to a service aren't affected.
+        mock, wrapped = self.wrap(['ok'], backend=None)
+        self.assertEqual(wrapped(), 'ok')
+
+    def test_probe_interrupted(self):
+        self.breaker.state = retry.HALF_OPEN
+        for error in (retry.CircuitOpenError('ideone', 60),
+                      KeyboardInterrupt()):
+            mock, wrapped = self.wrap(error)
+            self.assertRaises(type(error), wrapped)
+        mock, wrapped = self.wrap(['ok'])
+        self.assertEqual(wrapped(), 'ok')
+        self.assertEqual(self.breaker.state, retry.CLOSED)
+
+    def test_generic_exceptions_propagate(self):
+        mock, wrapped = self.wrap(RuntimeError())
+        self.assertRaises(RuntimeError, wrapped)
+
+    @patch.object(cb.config, 'R_USERNAME', helpers.USERNAME)
+    def test_ideone_circuit_open(self):
+        comment = Mock(body=helpers.mention(lang='Python'))
+        comment.author.name = 'user'
+        # The language check would fetch the languages from ideone.
+        with patch.object(cb, 'compile',
+                          side_effect=retry.CircuitOpenError('ideone', 60)), \
+                patch.object(cb, 'unknown_language', return_value=None):
+            reply = cb.create_reply(comment)
+        self.assertIsInstance(reply, cb.MessageReply)
+        self.assertIn(cb.config.INTERNAL_ERROR_TEXT, reply.text)
+
+    @patch.object(cb.config, 'R_USERNAME', helpers.USERNAME)
+    def test_ideone_gave_up(self):
+        comment = Mock(body=helpers.mention(lang='Python'))
+        comment.author.name = 'user'
+        ideone = Mock(**{'create_submission.side_effect': socket.error()})
+        with patch.multiple(cb, IDEONE_CLIENTS=clients.ClientPool(
+                                lambda: ideone, size=1),
+                            RESULT_CACHE=cache.ResultCache(0),
+                            BREAKERS={}), \
+                patch.object(cb, 'unknown_language', return_value=None):
+            reply = cb.create_reply(comment)
+        self.assertEqual(ideone.create_submission.call_count, 3)
+        self.assertIsInstance(reply, cb.MessageReply)
+        self.assertIn(cb.config.INTERNAL_ERROR_TEXT, reply.text)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
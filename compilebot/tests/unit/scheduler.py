@@ -0,0 +1,181 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import time
+import unittest
+import threading
+from mock import Mock, patch
+import compilebot as cb
+import languages
+import scheduler
+from tests import helpers
+
+"""
+Unit test cases for admission control and fair scheduling. All tests in
+this module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.scheduler
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestTokenBucket, TestScheduler, TestFairOrder, TestRateLimitReply
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_take(self):
+        now = [0]
+        bucket = scheduler.TokenBucket(0.5, 2, clock=lambda: now[0])
+        self.assertTrue(bucket.take())
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+        self.assertEqual(bucket.wait_time(), 2)
+        now[0] = 1
+        self.assertFalse(bucket.take())
+        now[0] = 2
+        self.assertTrue(bucket.take())
+        # The bucket never holds more than its capacity.
+        now[0] = 100
+        self.assertEqual(bucket.tokens(), 2)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.scheduler = scheduler.Scheduler(
+            user_limit=2, user_period=60, language_limits={'Java': 1},
+            share_interval=10, weights={'Trusted': 2},
+            clock=lambda: self.now)
+
+    def test_admit(self):
+        self.assertTrue(self.scheduler.admit('User'))
+        self.assertTrue(self.scheduler.admit('user'))
+        self.assertFalse(self.scheduler.admit('USER'))
+        self.assertTrue(self.scheduler.admit('other'))
+        self.assertEqual(self.scheduler.retry_after('user'), 30)
+        self.now += 30
+        self.assertTrue(self.scheduler.admit('user'))
+        self.assertEqual(self.scheduler.rejected, 1)
+
+    def test_no_limit(self):
+        self.scheduler.user_limit = 0
+        for n in range(100):
+            self.assertTrue(self.scheduler.admit('user'))
+
+    def test_tags(self):
+        busy = [self.scheduler.tag('busy') for n in range(5)]
+        self.assertEqual(busy, [1010, 1020, 1030, 1040, 1050])
+        # A new user goes ahead of most of the busy user's requests.
+        self.now += 5
+        self.assertEqual(self.scheduler.tag('new'), 1015)
+        self.assertEqual(self.scheduler.tag('trusted'), 1010)
+        # Tags of users who have been idle start from the current time.
+        self.now += 100
+        self.assertEqual(self.scheduler.tag('busy'), 1115)
+
+    def test_language_slot(self):
+        running = []
+
+        def compile():
+            with self.scheduler.language_slot('java'):
+                running.append(1)
+                time.sleep(0.05)
+                self.assertEqual(len(running), 1)
+                running.pop()
+
+        threads = [threading.Thread(target=compile) for n in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIsNone(self.scheduler._semaphore('python'))
+
+    def test_language_key(self):
+        catalog = languages.LanguageCatalog(None, aliases={'jdk': 'Java'})
+        catalog.update({10: 'Java (sun-jdk-8)', 4: 'Python (python 2.7)'},
+                       self.now)
+        with patch.object(cb, 'LANGUAGES', catalog):
+            keys = [cb.language_key(lang) for lang in
+                    ('Java', 'JAVA', 'java (sun-jdk-8)', 'jdk')]
+            self.assertEqual(keys, ['java'] * 4)
+            self.assertEqual(cb.language_key('Python'), 'python')
+        # Languages can be told apart before the catalog is loaded.
+        with patch.object(cb, 'LANGUAGES', languages.LanguageCatalog(None)):
+            self.assertEqual(cb.language_key('Java (sun-jdk-8)'), 'java')
+
+
+class TestFairOrder(unittest.TestCase):
+
+    def test_inbox_workers(self):
+        order = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def process(new, r):
+            if not order:
+                started.set()
+                release.wait()
+            order.append(new.author.name)
+
+        items = [Mock(author=Mock(), body='') for n in range(6)]
+        for item, name in zip(items, ['busy'] * 5 + ['other']):
+            item.author.name = name
+        with patch.object(cb, 'SCHEDULER', scheduler.Scheduler()), \
+                patch.object(cb, 'process_unread', side_effect=process):
+            workers = cb.InboxWorkers(Mock(), 1, max_waiting=10)
+            workers.submit(items[0])
+            started.wait()
+            for item in items[1:]:
+                workers.submit(item)
+            release.set()
+            workers.close()
+        self.assertEqual(order, ['busy', 'other', 'busy', 'busy', 'busy',
+                                 'busy'])
+
+
+class TestRateLimitReply(helpers.BotTestCase):
+
+    def setUp(self):
+        helpers.BotTestCase.setUp(self)
+        self.start_patch(patch.object(cb, 'SCHEDULER', scheduler.Scheduler(
+            user_limit=1, user_period=600)))
+
+    def test_rate_limited(self):
+        first = self.r.add_comment(helpers.mention(), 'user')
+        second = self.r.add_comment(helpers.mention(), 'user')
+        with patch.object(cb, 'compile', wraps=cb.compile) as mock_compile:
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(mock_compile.call_count, 1)
+        self.assertEqual([a.target for a in self.r.find_actions('reply')],
+                         [first.id])
+        message, = self.r.find_actions('message', 'user')
+        self.assertIn('10 minutes', message.text)
+        self.assertIn(second.id, message.text)
+        self.assertEqual(self.r.inbox.pending(), 0)
+
+    def test_recompile_rate_limited(self):
+        comment = self.r.add_comment(helpers.mention(), 'user')
+        self.r.add_message('--recompile {}'.format(comment.permalink),
+                           'user')
+        with patch.object(cb, 'process_unread') as process_unread:
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(process_unread.call_count, 1)
+        message, = self.r.find_actions('message', 'user')
+        self.assertIn('10 minutes', message.text)
+
+    def test_messages_not_charged(self):
+        self.r.add_message('--help', 'user')
+        self.r.add_comment(helpers.mention(), 'user')
+        cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(len(self.r.find_actions('reply')), 1)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+from mock import patch
+import compilebot as cb
+import spam
+from tests import helpers
+
+"""
+Unit test cases for the spam filters. All tests in this module shouldn't
+make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.spam
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestSpamFilter, TestSpamRules
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestSpamFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.filter = spam.SpamFilter(line_limit=3, char_limit=10,
+                                      phrases=['rm ', '-RF', 'rm -rf'],
+                                      patterns=[r'curl\s+\S+\s*\|\s*sh'])
+
+    def test_clean(self):
+        self.assertEqual(self.filter.detect('print(1)', '1\n', ''), [])
+
+    def test_limits(self):
+        self.assertEqual(self.filter.detect('', '\n\n\n\n', ''),
+                         [spam.LINE_BREAKS])
+        self.assertEqual(self.filter.detect('', 'a' * 11, ''),
+                         [spam.CHARACTERS])
+        self.assertEqual(self.filter.detect('', '\n' * 11, ''),
+                         [spam.LINE_BREAKS, spam.CHARACTERS])
+
+    def test_phrases(self):
+        self.assertEqual(self.filter.detect('os.system("RM -rf /")', '', ''),
+                         [spam.PHRASE])
+        self.assertEqual(self.filter.detect('curl a|sh', '', ''),
+                         [spam.PHRASE])
+        # Phrases are matched literally.
+        self.assertEqual(spam.SpamFilter(phrases=['a.b']).detect(
+            'axb', '', ''), [])
+
+    def test_system_call(self):
+        self.assertEqual(self.filter.detect('', '', 'Permission denied'),
+                         [spam.SYSTEM_CALL])
+
+    def test_override(self):
+        relaxed = self.filter.override(char_limit=100, spam_phrases=[])
+        self.assertEqual(relaxed.detect('rm -rf', 'a' * 11, ''), [])
+        self.assertEqual(relaxed.line_limit, 3)
+
+
+class TestSpamRules(unittest.TestCase):
+
+    def setUp(self):
+        default = spam.SpamFilter(phrases=['bitcointip'])
+        self.rules = spam.SpamRules(
+            default, subreddits={'Crypto': default.override(spam_phrases=[])},
+            ignore=['test'])
+
+    def test_subreddits(self):
+        self.assertEqual(self.rules.detect('bitcointip', '', ''),
+                         [spam.PHRASE])
+        self.assertEqual(self.rules.detect('bitcointip', '', '', 'crypto'),
+                         [])
+        self.assertEqual(self.rules.detect('bitcointip', '', '', 'Other'),
+                         [spam.PHRASE])
+        self.assertIsNone(self.rules.filter('Test'))
+
+    def test_detect_spam(self):
+        reply = cb.CompiledReply('', {'source': 'bitcointip', 'output': '',
+                                      'stderr': ''})
+        with patch.object(cb, 'SPAM_RULES', self.rules):
+            self.assertEqual(reply.detect_spam(), [spam.PHRASE])
+            self.assertEqual(reply.detect_spam('test'), [])
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
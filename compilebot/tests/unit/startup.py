@@ -0,0 +1,135 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import os
+import sys
+import json
+import pickle
+import shutil
+import tempfile
+import unittest
+from mock import patch
+import compilebot as cb
+import banned
+import config
+import lazy
+from tests import helpers
+
+"""
+Unit test cases for deferred imports, the config cache and restoring the
+bot's state. All tests in this module shouldn't make any requests to
+reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.startup
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestLazyModule, TestConfigCache, TestRestore
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestLazyModule(unittest.TestCase):
+
+    def test_load(self):
+        module = lazy.LazyModule('colorsys')
+        self.assertIsNone(module._module)
+        self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertIs(module.load(), sys.modules['colorsys'])
+        self.assertTrue(module.loaded)
+
+    def test_missing(self):
+        module = lazy.LazyModule('no_such_module_here')
+        self.assertRaises(ImportError, getattr, module, 'anything')
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'config.yml')
+        self.cache = os.path.join(self.dir, 'config.cache')
+        with open(self.path, 'w') as f:
+            f.write(''.join("{}: x\n".format(name)
+                            for name in config.REQUIRED_SETTINGS))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cache(self):
+        settings = config.load_config(self.path, self.cache)
+        self.assertEqual(settings['user_agent'], 'x')
+        self.assertTrue(os.path.exists(self.cache))
+        # A cached config is loaded without yaml.
+        with patch.dict(sys.modules, {'yaml': None}):
+            self.assertEqual(config.load_config(self.path, self.cache),
+                             settings)
+
+    def test_json_cache(self):
+        settings = config.load_config(self.path, self.cache)
+        with open(self.cache) as f:
+            self.assertEqual(json.load(f)['settings'], settings)
+        # A cache written by an older bot is replaced.
+        with open(self.cache, 'wb') as f:
+            pickle.dump({'key': 'x', 'settings': {}}, f)
+        self.assertEqual(config.load_config(self.path, self.cache), settings)
+        with open(self.cache) as f:
+            self.assertEqual(json.load(f)['settings'], settings)
+
+    def test_settings_not_json(self):
+        with open(self.path, 'a') as f:
+            f.write("numbers:\n  1: one\n")
+        settings = config.load_config(self.path, self.cache)
+        self.assertEqual(settings['numbers'], {1: 'one'})
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_changed(self):
+        config.load_config(self.path, self.cache)
+        with open(self.path, 'a') as f:
+            f.write("extra: 1\n")
+        self.assertEqual(config.load_config(self.path, self.cache)['extra'], 1)
+
+    def test_changed_same_size(self):
+        config.load_config(self.path, self.cache)
+        stat = os.stat(self.path)
+        with open(self.path, 'r') as f:
+            text = f.read()
+        with open(self.path, 'w') as f:
+            f.write(text.replace('user_agent: x', 'user_agent: y'))
+        # An edit in the same second that keeps the size is still seen.
+        os.utime(self.path, (stat.st_atime, stat.st_mtime))
+        self.assertEqual(
+            config.load_config(self.path, self.cache)['user_agent'], 'y')
+
+    def test_missing_settings(self):
+        with open(self.path, 'w') as f:
+            f.write("log_file:\n")
+        self.assertRaises(ValueError, config.load_config, self.path,
+                          self.cache)
+        self.assertFalse(os.path.exists(self.cache))
+
+
+class TestRestore(unittest.TestCase):
+
+    def test_restore(self):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        with open(path, 'w') as f:
+            json.dump({'users': ['troll'], 'updated': 1, 'full_update': 1,
+                       'last_change': 1}, f)
+        try:
+            with patch.multiple(cb, BANNED=banned.BannedUsers(
+                    None, snapshot_file=path), WORK_QUEUE=None), \
+                    patch.multiple(cb.config, BANNED_USERS=set()):
+                cb.restore()
+                self.assertEqual(cb.config.BANNED_USERS, set(['troll']))
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,136 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import json
+import unittest
+from mock import patch
+import compilebot as cb
+import tracing
+from tests import helpers
+
+"""
+Unit test cases for request tracing and the trace summary. All tests in
+this module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.tracing
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestTracer, TestSummary, TestBotTraces
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class ListWriter(object):
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def traces(self):
+        return [json.loads(line.decode('utf-8')) for line in self.lines]
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.writer = ListWriter()
+        self.tracer = tracing.Tracer(self.writer, clock=lambda: self.now)
+
+    def test_spans(self):
+        with self.tracer.trace('item', item='abc'):
+            trace_id = self.tracer.trace_id()
+            with self.tracer.span('compile', lang='python'):
+                self.now += 2
+                with self.tracer.span('poll'):
+                    self.now += 3
+                    self.tracer.annotate(polls=4)
+            with self.tracer.span('reply'):
+                self.now += 1
+        self.assertIsNone(self.tracer.trace_id())
+        trace, = self.writer.traces()
+        self.assertEqual((trace['id'], trace['name'], trace['duration']),
+                         (trace_id, 'item', 6))
+        self.assertEqual(trace['attributes'], {'item': 'abc'})
+        spans = [(s['name'], s['parent'], s['duration'])
+                 for s in trace['spans']]
+        self.assertEqual(spans, [('item', None, 6), ('compile', 1, 5),
+                                 ('poll', 2, 3), ('reply', 1, 1)])
+        self.assertEqual(trace['spans'][2]['attributes'], {'polls': 4})
+
+    def test_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.tracer.trace('item'):
+                with self.tracer.span('fail'):
+                    1 / 0
+        trace, = self.writer.traces()
+        self.assertEqual(trace['error'], 'ZeroDivisionError')
+        self.assertEqual(trace['spans'][1]['error'], 'ZeroDivisionError')
+
+    def test_no_trace(self):
+        with self.tracer.span('orphan') as span:
+            self.assertIsNone(span)
+        self.tracer.annotate(ignored=True)
+        self.assertEqual(self.writer.lines, [])
+
+    def test_nested_trace(self):
+        with self.tracer.trace('job'):
+            with self.tracer.trace('item'):
+                pass
+        trace, = self.writer.traces()
+        self.assertEqual([s['name'] for s in trace['spans']], ['job', 'item'])
+
+
+class TestSummary(unittest.TestCase):
+
+    def test_summarize(self):
+        lines = []
+        for n, duration in enumerate([1, 5, 3]):
+            lines.append(json.dumps({
+                'id': 't{}'.format(n), 'name': 'item', 'start': 0,
+                'duration': duration, 'attributes': {}, 'error': None,
+                'spans': [
+                    {'id': 1, 'parent': None, 'name': 'item', 'start': 0,
+                     'duration': duration, 'attributes': {}},
+                    {'id': 2, 'parent': 1, 'name': 'poll', 'start': 0,
+                     'duration': duration - 0.5, 'attributes': {}}]}))
+        lines.append('{"truncated')
+        traces = tracing.load_traces(lines)
+        self.assertEqual(len(traces), 3)
+        summary = tracing.summarize(traces, slowest=2)
+        slowest = summary.split('Slowest requests:\n')[1].split('\n')
+        self.assertIn('t1', slowest[0])
+        self.assertIn('    poll', slowest[1])
+        self.assertIn('t2', slowest[2])
+        self.assertNotIn('t0', summary)
+        self.assertIn('poll', summary.split('Stages:')[1])
+
+
+class TestBotTraces(helpers.BotTestCase):
+
+    results = {15: 1}
+
+    def test_process_inbox(self):
+        writer = ListWriter()
+        comment = self.r.add_comment(helpers.mention(), 'user')
+        with patch.object(cb, 'TRACER', tracing.Tracer(writer)):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        trace, = writer.traces()
+        self.assertEqual(trace['attributes'], {'item': comment.id})
+        names = [s['name'] for s in trace['spans']]
+        for name in ('process_unread', 'create_reply', 'parse', 'compile',
+                     'submit', 'poll', 'format_reply', 'CompiledReply.send'):
+            self.assertIn(name, names)
+        compile_span = trace['spans'][names.index('compile')]
+        self.assertEqual(compile_span['attributes']['result'], 15)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,95 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import unittest
+from mock import patch
+import compilebot as cb
+import truncation
+from tests import helpers
+
+"""
+Unit test cases for truncating output and fitting replies in a comment.
+All tests in this module shouldn't make any requests to reddit or ideone.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.truncation
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestTruncateOutput, TestFitSections, TestFormatReply
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestTruncateOutput(unittest.TestCase):
+
+    def test_short(self):
+        output = "a\nb\nc\n"
+        self.assertEqual(truncation.truncate_output(output, 3, 100), output)
+
+    def test_line_limit(self):
+        lines = ["line {}".format(n) for n in range(100)]
+        output = truncation.truncate_output('\n'.join(lines), 60, 8000)
+        self.assertEqual(output, '\n'.join(lines[:51]) + "\n...")
+
+    def test_small_line_limit(self):
+        lines = ["line {}".format(n) for n in range(100)]
+        output = truncation.truncate_output('\n'.join(lines), 10, 8000)
+        self.assertEqual(output, '\n'.join(lines[:51]) + "\n...")
+        output = truncation.truncate_output('\n'.join(lines[:30]), 10, 8000)
+        self.assertEqual(output, '\n'.join(lines[:30]) + "\n...")
+
+    def test_duplicate_lines(self):
+        output = truncation.truncate_output("spam\n" * 100000, 200, 8000)
+        self.assertEqual(output, "spam\nspam\n...")
+
+    def test_char_limit(self):
+        output = truncation.truncate_output("a" * 9000, 200, 8000)
+        self.assertEqual(output, "a" * 8000 + '\n    ...\n')
+
+
+class TestFitSections(unittest.TestCase):
+
+    def test_fits(self):
+        self.assertEqual(truncation.fit_sections(['ab', 'cd'], 4),
+                         ['ab', 'cd'])
+
+    def test_priority(self):
+        sections = truncation.fit_sections(['f' * 10, 'b' * 20, 'h' * 20],
+                                           25)
+        self.assertEqual(sections, ['f' * 10, 'b' * 10 + truncation.ELLIPSIS,
+                                    ''])
+        self.assertEqual(len(''.join(sections)), 25)
+
+
+class TestFormatReply(unittest.TestCase):
+
+    def setUp(self):
+        self.details = {
+            'source': 'x' * 6000, 'input': '', 'output': 'y' * 9000,
+            'stderr': '', 'cmpinfo': 'z' * 3000, 'date': '', 'memory': 0,
+            'time': 0, 'langVersion': ''
+        }
+
+    def test_reply_limit(self):
+        footer = "\n\n^[source](http://ideone.com/abc)"
+        with patch.multiple(cb.config, LINE_LIMIT=200):
+            text = cb.format_reply(self.details, ['--source', '--time'],
+                                   footer=footer)
+        self.assertEqual(len(text), truncation.REPLY_LIMIT)
+        self.assertTrue(text.endswith(footer))
+        # The source and time are shortened before the output.
+        self.assertTrue(text.startswith("Output:"))
+        self.assertNotIn("Execution Time", text)
+
+    def test_reply_text(self):
+        reply = cb.Reply('a' * 20000)
+        self.assertEqual(len(reply.text), truncation.REPLY_LIMIT)
+        self.assertEqual(cb.Reply('a' * 10000).text, 'a' * 10000)
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,333 @@
+from __future__ import absolute_import, unicode_literals, print_function
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import time
+import uuid
+import unittest
+from mock import Mock, patch
+import compilebot as cb
+import alerts
+import retry
+import scheduler
+import workqueue
+from tests import helpers
+
+"""
+Unit test cases for the persistent work queue and the queue workers. All
+tests in this module shouldn't make any requests to reddit or ideone.
+
+The work queue tests are also run against a Redis queue if the
+COMPILEBOT_TEST_REDIS environment variable is set to the URL of a Redis
+database, e.g. redis://localhost:6379/15.
+
+Run the following command from the compilebot directory in order to run only
+this test module: python -m unittest tests.unit.workqueue
+"""
+
+cb.config.LOG_FILE = helpers.LOG_FILE
+
+def test_suite():
+    cases = [
+        TestWorkQueue, TestRedisQueue, TestQueueWorkers
+    ]
+    alltests = [
+        unittest.TestLoader().loadTestsFromTestCase(case) for case in cases
+    ]
+    return unittest.TestSuite(alltests)
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'queue.db')
+        self.now = 1000.0
+        self.queue = self.open_queue('a')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def open_queue(self, worker_id):
+        return workqueue.SQLiteQueue(self.path, max_attempts=2, retention=100,
+                                     lease=10, retry_delay=5,
+                                     worker_id=worker_id,
+                                     clock=lambda: self.now)
+
+    def test_fifo(self):
+        self.assertTrue(self.queue.put('a', True))
+        self.now += 1
+        self.assertTrue(self.queue.put('b', False))
+        first, second = self.queue.claim(), self.queue.claim()
+        self.assertEqual((first.id, first.was_comment, first.attempts),
+                         ('a', True, 1))
+        self.assertEqual((second.id, second.was_comment), ('b', False))
+        self.assertIsNone(self.queue.claim())
+
+    def test_duplicates(self):
+        self.queue.put('a', True)
+        self.queue.done(self.queue.claim())
+        self.assertFalse(self.queue.put('a', True))
+        # Finished jobs are forgotten after the retention period.
+        self.now += 101
+        self.queue.put('b', True)
+        self.queue.done(self.queue.claim())
+        self.assertTrue(self.queue.put('a', True))
+
+    def test_retry(self):
+        self.queue.put('a', True)
+        self.assertTrue(self.queue.retry(self.queue.claim()))
+        # A failed job waits before it is claimed again.
+        self.assertIsNone(self.queue.claim())
+        self.now += 5
+        job = self.queue.claim()
+        self.assertEqual(job.attempts, 2)
+        self.assertFalse(self.queue.retry(job))
+        self.assertEqual(self.queue.counts(), {'failed': 1})
+
+    def test_lease_expiry(self):
+        other = self.open_queue('b')
+        self.queue.put('a', True)
+        job = self.queue.claim()
+        self.assertIsNone(other.claim())
+        # Heartbeats keep the job with its worker.
+        self.now += 8
+        self.queue.heartbeat()
+        self.now += 8
+        self.assertIsNone(other.claim())
+        # The job moves to another worker once the heartbeats stop.
+        self.now += 11
+        taken = other.claim()
+        self.assertEqual((taken.id, taken.attempts), ('a', 2))
+        self.assertFalse(self.queue.done(job))
+        self.assertTrue(other.done(taken))
+        self.assertEqual(set(self.queue.workers()), set(['a']))
+
+    def test_expired_last_attempt(self):
+        self.queue.put('a', True)
+        self.queue.retry(self.queue.claim())
+        self.now += 5
+        self.queue.claim()
+        self.now += 11
+        self.assertIsNone(self.open_queue('b').claim())
+        self.assertEqual(self.queue.counts(), {'failed': 1})
+
+    def test_replies(self):
+        self.queue.put('a', True)
+        job = self.queue.claim()
+        self.assertTrue(self.queue.claim_reply(job, 'reply', 'c1'))
+        self.assertFalse(self.queue.claim_reply(job, 'reply', 'c1'))
+        self.assertTrue(self.queue.claim_reply(job, 'edit', 'c1'))
+        self.queue.release_reply(job, 'edit', 'c1')
+        self.assertTrue(self.queue.claim_reply(job, 'edit', 'c1'))
+
+    def test_running_job_before_leases(self):
+        path = os.path.join(self.dir, 'old.db')
+        db = sqlite3.connect(path)
+        db.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, "
+                   "was_comment INTEGER, state TEXT, attempts INTEGER, "
+                   "enqueued REAL, updated REAL)")
+        db.execute("INSERT INTO jobs VALUES ('a', 1, 'running', 1, 0, 0)")
+        db.commit()
+        db.close()
+        queue = workqueue.SQLiteQueue(path, worker_id='a',
+                                      clock=lambda: self.now)
+        job = queue.claim()
+        self.assertEqual((job.id, job.attempts), ('a', 2))
+
+    def test_shared_values(self):
+        self.assertEqual(self.queue.get_value('banned', []), [])
+        self.queue.set_value('banned', ['troll'])
+        self.assertEqual(self.open_queue('b').get_value('banned'), ['troll'])
+
+
+@unittest.skipUnless(os.environ.get('COMPILEBOT_TEST_REDIS'),
+                     "COMPILEBOT_TEST_REDIS is not set")
+class TestRedisQueue(TestWorkQueue):
+
+    def setUp(self):
+        self.prefix = 'compilebot-test:{}:'.format(uuid.uuid4().hex)
+        TestWorkQueue.setUp(self)
+
+    def tearDown(self):
+        keys = list(self.queue._redis.scan_iter(self.prefix + '*'))
+        if keys:
+            self.queue._redis.delete(*keys)
+        TestWorkQueue.tearDown(self)
+
+    def open_queue(self, worker_id):
+        return workqueue.RedisQueue(os.environ['COMPILEBOT_TEST_REDIS'],
+                                    prefix=self.prefix, max_attempts=2,
+                                    retention=100, lease=10, retry_delay=5,
+                                    worker_id=worker_id,
+                                    clock=lambda: self.now)
+
+    @unittest.skip("SQLite queues only")
+    def test_running_job_before_leases(self):
+        pass
+
+    def test_counts(self):
+        self.queue.put('a', True)
+        self.queue.put('b', True)
+        self.queue.retry(self.queue.claim())
+        self.assertEqual(self.queue.counts(), {'queued': 2})
+        self.queue.claim()
+        self.assertEqual(self.queue.counts(), {'queued': 1, 'running': 1})
+
+
+class TestQueueWorkers(helpers.BotTestCase):
+
+    def setUp(self):
+        helpers.BotTestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.queue = workqueue.SQLiteQueue(os.path.join(self.dir, 'queue.db'),
+                                           retry_delay=0)
+        # Errors of failing jobs are alerted, keep them from being sent to
+        # reddit.
+        self.alerts = alerts.AlertDispatcher(
+            lambda reddit, subject, body: None)
+        self.start_patch(patch.multiple(cb, WORK_QUEUE=self.queue,
+                                        ALERTS=self.alerts))
+        self.start_patch(patch.object(cb.config, 'WORKER_THREADS', 4))
+        self.mention = helpers.mention("print('Hello')")
+
+    def tearDown(self):
+        self.alerts.flush()
+        shutil.rmtree(self.dir)
+
+    def test_process_inbox(self):
+        comments = [self.r.add_comment(self.mention, 'user{}'.format(n))
+                    for n in range(10)]
+        cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(self.r.inbox.pending(), 0)
+        self.assertEqual(sorted(a.target for a in
+                                self.r.find_actions('reply')),
+                         sorted(c.id for c in comments))
+        self.assertEqual(self.queue.counts(), {'done': 10})
+
+    def test_marked_read_after_queued(self):
+        comment = self.r.add_comment(self.mention, 'user')
+        with patch.object(self.queue, 'put', side_effect=IOError):
+            self.assertRaises(IOError, cb.process_inbox,
+                              self.r.inbox.unread(), self.r)
+        self.assertEqual(self.r.inbox.unread(), [comment])
+
+    def test_resume_after_worker_stopped(self):
+        comment = self.r.add_comment(self.mention, 'user')
+        # Another worker replied but stopped before finishing the job.
+        stopped = workqueue.SQLiteQueue(self.queue.path, lease=-1,
+                                        worker_id='stopped')
+        stopped.put(comment.id, True)
+        stopped.claim_reply(stopped.claim(), 'reply', comment.id)
+        comment.mark_read()
+        other = self.r.add_comment(self.mention, 'user')
+        cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual([a.target for a in self.r.find_actions('reply')],
+                         [other.id])
+        self.assertEqual(self.queue.counts(), {'done': 2})
+
+    def test_intake_and_worker(self):
+        comment = self.r.add_comment(self.mention, 'user')
+        with patch.object(cb.config, 'ROLE', 'intake'):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(self.r.inbox.pending(), 0)
+        self.assertEqual(self.queue.counts(), {'queued': 1})
+        # A worker fetches the queued item from reddit.
+        workers = cb.QueueWorkers(self.r, self.queue, 2)
+        workers.close()
+        self.assertEqual([a.target for a in self.r.find_actions('reply')],
+                         [comment.id])
+
+    def test_claim_error(self):
+        comment = self.r.add_comment(self.mention, 'user')
+        with patch.object(cb.config, 'ROLE', 'intake'):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        claim = self.queue.claim
+        errors = []
+
+        def fail_once():
+            if not errors:
+                errors.append(True)
+                raise sqlite3.OperationalError("database is locked")
+            return claim()
+
+        with patch.object(self.queue, 'claim', side_effect=fail_once), \
+                patch.object(self.queue, 'lease', 0.3):
+            workers = cb.QueueWorkers(self.r, self.queue, 1)
+            for n in range(100):
+                if self.r.find_actions('reply'):
+                    break
+                time.sleep(0.05)
+            workers.close()
+        self.assertEqual(errors, [True])
+        self.assertEqual([a.target for a in self.r.find_actions('reply')],
+                         [comment.id])
+
+    def test_work_refresh_interval(self):
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 2:
+                raise KeyboardInterrupt
+
+        with patch.multiple(cb, login=Mock(return_value=self.r),
+                            update_banned=Mock()), \
+                patch.object(cb.config, 'BANNED_REFRESH_INTERVAL', 0), \
+                patch.object(cb.time, 'sleep', side_effect=sleep):
+            self.assertRaises(KeyboardInterrupt, cb.work)
+        self.assertEqual(sleeps, [cb.MIN_BANNED_REFRESH_SLEEP] * 2)
+
+    def test_shared_banned_users(self):
+        self.r.add_comment(self.mention, 'Troll')
+        self.queue.set_value('banned_users', ['troll'])
+        with patch.multiple(cb.config, ROLE='worker', SUBREDDIT='sub'):
+            cb.update_banned(self.r)
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(self.r.find_actions('reply'), [])
+
+    def test_retry_failed_job(self):
+        self.r.add_comment(self.mention, 'user')
+        process_unread = cb.process_unread
+        calls = []
+
+        def fail_once(new, r):
+            calls.append(new.id)
+            if len(calls) == 1:
+                raise ValueError
+            process_unread(new, r)
+
+        # The retry isn't charged to the author again.
+        limited = scheduler.Scheduler(user_limit=1, user_period=600)
+        with patch.object(cb, 'process_unread', side_effect=fail_once), \
+                patch.object(cb, 'SCHEDULER', limited):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(self.r.find_actions('reply')), 1)
+        self.assertEqual(self.queue.counts(), {'done': 1})
+
+    def test_retry_failed_reply(self):
+        comment = self.r.add_comment(self.mention, 'flaky')
+        call = self.r.call
+        failures = []
+
+        def fail_replies(action=None, target=None, text=None):
+            # Every attempt of the first try of the job fails.
+            if action == 'reply' and len(failures) < 3:
+                failures.append(target)
+                raise socket.error("Connection reset")
+            call(action, target, text)
+
+        policy = retry.RetryPolicy(base_delay=0, max_delay=0, jitter=0)
+        with patch.object(self.r, 'call', side_effect=fail_replies), \
+                patch.multiple(cb, BREAKERS={},
+                               RETRY_POLICIES={'reddit': policy}):
+            cb.process_inbox(self.r.inbox.unread(), self.r)
+        self.assertEqual([a.target for a in self.r.find_actions('reply')],
+                         [comment.id])
+        self.assertEqual(self.queue.counts(), {'done': 1})
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
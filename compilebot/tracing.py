@@ -0,0 +1,208 @@
+"""
+Tracing of the time spent on each inbox item.
+
+A trace is started for every inbox item the bot processes and gets a
+short correlation id, which is also added to the log messages written
+while the item is processed. Each stage of processing the item, such as
+parsing the comment, the ideone submission or sending the reply, is
+recorded as a span with its start time and duration. Spans can contain
+other spans. A finished trace is written as a single line of JSON.
+
+The summary of a trace file shows the slowest requests with their spans
+and how long each stage takes across all requests:
+
+    python tracing.py traces.jsonl --slowest 10
+"""
+from __future__ import unicode_literals, print_function, division
+import io
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+import threading
+from contextlib import contextmanager
+
+
+class Tracer(object):
+
+    """Records the spans of the trace being processed by each thread.
+
+    Keyword arguments:
+    writer -- optional object with a write method, such as a
+        logwriter.LogWriter, that finished traces are written to as JSON
+        lines (bytes)
+    """
+
+    def __init__(self, writer=None, clock=time.time):
+        self.writer = writer
+        self.clock = clock
+        self._local = threading.local()
+
+    def trace_id(self):
+        """Return the correlation id of the current thread's trace, or None
+        if no trace is being recorded.
+        """
+        trace = getattr(self._local, 'trace', None)
+        return trace['id'] if trace else None
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """Record a new trace for the duration of a with block. A trace
+        started while another one is being recorded is recorded as a span
+        of that trace instead.
+        """
+        if self.trace_id() is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+        trace = {'id': uuid.uuid4().hex[:12], 'name': name, 'spans': []}
+        self._local.trace = trace
+        self._local.stack = []
+        try:
+            with self.span(name, **attributes) as span:
+                yield span
+        finally:
+            self._local.trace = None
+            self._export(trace)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Record a span of the current trace for the duration of a with
+        block. Nothing is recorded if there is no current trace.
+        """
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            yield None
+            return
+        stack = self._local.stack
+        span = {'id': len(trace['spans']) + 1,
+                'parent': stack[-1]['id'] if stack else None,
+                'name': name, 'start': self.clock(),
+                'attributes': attributes}
+        trace['spans'].append(span)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span['error'] = type(e).__name__
+            raise
+        finally:
+            span['duration'] = self.clock() - span['start']
+            stack.pop()
+
+    def annotate(self, **attributes):
+        """Add attributes to the innermost span being recorded."""
+        stack = getattr(self._local, 'stack', None)
+        if self.trace_id() is not None and stack:
+            stack[-1]['attributes'].update(attributes)
+
+    def _export(self, trace):
+        if self.writer is None or not trace['spans']:
+            return
+        root = trace['spans'][0]
+        record = {
+            'id': trace['id'],
+            'name': trace['name'],
+            'start': root['start'],
+            'duration': root['duration'],
+            'attributes': root['attributes'],
+            'error': root.get('error'),
+            'spans': trace['spans'],
+        }
+        line = json.dumps(record, default=str, sort_keys=True) + '\n'
+        self.writer.write(line.encode('utf-8'))
+
+
+def load_traces(lines):
+    """Parse traces from JSON lines, skipping lines that can't be parsed,
+    such as a line that was being written when the file was copied.
+    """
+    traces = []
+    for line in lines:
+        try:
+            traces.append(json.loads(line))
+        except ValueError:
+            continue
+    return traces
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(len(values) - 1,
+                      int(math.ceil(fraction * len(values))) - 1)]
+
+
+def stage_durations(traces):
+    """Return a dict of span names and the durations of all spans with
+    that name.
+    """
+    stages = {}
+    for trace in traces:
+        for span in trace['spans']:
+            stages.setdefault(span['name'], []).append(span['duration'])
+    return stages
+
+
+def format_trace(trace):
+    """Return the lines describing a trace and its spans, with child spans
+    indented below their parents.
+    """
+    lines = ["{:8.2f}s  {}  {}{}{}".format(
+        trace['duration'], trace['id'], trace['name'],
+        ''.join(' {}={}'.format(k, v) for k, v in
+                sorted(trace['attributes'].items())),
+        " (error: {})".format(trace['error']) if trace.get('error') else '')]
+    depths = {None: 0}
+    for span in trace['spans'][1:]:
+        depth = depths.get(span['parent'], 0) + 1
+        depths[span['id']] = depth
+        lines.append("{:8.2f}s  {}{}{}".format(
+            span['duration'], '    ' * depth, span['name'],
+            " (error: {})".format(span['error']) if span.get('error')
+            else ''))
+    return lines
+
+
+def summarize(traces, slowest=10):
+    """Return a text summary of the slowest traces and of the durations of
+    each stage.
+    """
+    lines = ["{} requests".format(len(traces)), ""]
+    if not traces:
+        return '\n'.join(lines)
+    lines.append("Slowest requests:")
+    for trace in sorted(traces, key=lambda t: -t['duration'])[:slowest]:
+        lines.extend(format_trace(trace))
+    lines.extend(["", "Stages:", "{:<24} {:>6} {:>8} {:>8} {:>8} {:>8}".format(
+        'stage', 'count', 'mean', 'p50', 'p95', 'max')])
+    stages = stage_durations(traces)
+    for name, durations in sorted(stages.items(),
+                                  key=lambda s: -sum(s[1])):
+        lines.append("{:<24} {:>6} {:>8.3f} {:>8.3f} {:>8.3f} {:>8.3f}".format(
+            name, len(durations), sum(durations) / len(durations),
+            percentile(durations, 0.5), percentile(durations, 0.95),
+            max(durations)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize a CompileBot trace file.")
+    parser.add_argument('path', help="the JSON lines trace file")
+    parser.add_argument('--slowest', type=int, default=10,
+                        help="the number of slowest requests to show")
+    parser.add_argument('--name', help="only include traces with this name")
+    args = parser.parse_args(argv)
+    with io.open(args.path, encoding='utf-8') as f:
+        traces = load_traces(f)
+    if args.name:
+        traces = [t for t in traces if t['name'] == args.name]
+    print(summarize(traces, args.slowest))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+"""
+Truncation of program output and of replies to fit reddit's comment
+length limit.
+
+The output of a submission can be several megabytes long, while a reply
+only shows its first lines. The output is walked line by line only as
+far as the line limit or the last line that is kept, and duplicate lines
+are detected by keeping the hashes of at most a few distinct lines, so
+nothing the size of the output is built apart from the slices that end
+up in the reply.
+"""
+from __future__ import unicode_literals, print_function
+
+# The maximum number of characters in a reddit comment.
+REPLY_LIMIT = 10000
+
+# Appended to a section of a reply that was shortened.
+ELLIPSIS = '\n...\n'
+
+
+def truncate_output(output, line_limit, char_limit, lines_allowed=51,
+                    spam_lines=2, distinct_lines=5):
+    """Shorten the output of a program for a reply.
+
+    Output with more than line_limit line breaks is cut to its first
+    lines_allowed lines, or to its first spam_lines lines if there are
+    fewer than distinct_lines different lines among the lines that were
+    walked, which is usually spam. Output that is still longer than
+    char_limit characters is then cut to that length.
+    """
+    # The positions of the line breaks ending the lines that may be kept.
+    # The walk goes on past a line limit below lines_allowed, so that the
+    # lines to keep are known.
+    kept = []
+    seen = set()
+    breaks = 0
+    start = 0
+    while breaks <= line_limit or len(kept) < lines_allowed:
+        end = output.find('\n', start)
+        if end == -1:
+            break
+        if len(seen) < distinct_lines:
+            seen.add(hash(output[start:end]))
+        if len(kept) < lines_allowed:
+            kept.append(end)
+        breaks += 1
+        start = end + 1
+    if breaks > line_limit:
+        keep = spam_lines if len(seen) < distinct_lines else lines_allowed
+        if keep <= len(kept):
+            output = output[:kept[keep - 1]]
+        output += "\n..."
+    if len(output) > char_limit:
+        output = output[:char_limit] + '\n    ...\n'
+    return output
+
+
+def fit_sections(sections, limit=REPLY_LIMIT):
+    """Shorten the sections of a reply so that the reply is at most limit
+    characters long and return the sections.
+
+    The sections are given as a list in order of priority, sections that
+    come last are shortened or dropped first. A shortened section ends
+    with an ellipsis that counts towards the limit.
+    """
+    if sum(len(section) for section in sections) <= limit:
+        return list(sections)
+    fitted = []
+    room = limit
+    for section in sections:
+        if len(section) <= room:
+            fitted.append(section)
+            room -= len(section)
+        elif room > len(ELLIPSIS):
+            fitted.append(section[:room - len(ELLIPSIS)] + ELLIPSIS)
+            room = 0
+        else:
+            fitted.append('')
+            room = 0
+    return fitted
+
+
+def fit_text(text, limit=REPLY_LIMIT):
+    """Cut text to at most limit characters, ending it with an ellipsis
+    if it was cut.
+    """
+    if len(text) <= limit:
+        return text
+    return text[:limit - 4] + '\n...'
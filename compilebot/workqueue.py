@@ -0,0 +1,505 @@
+"""
+A persistent queue of inbox items waiting to be processed. Inbox intake
+stores each item as a job and only then marks it as read, and workers
+claim jobs from the queue, so an item is never lost when the bot stops
+while processing it.
+
+Several bot processes can share one queue: a single intake process and
+any number of worker processes. A worker holds a lease on each job
+it claims and renews its leases with heartbeats. The jobs of a worker
+that stopped sending heartbeats are claimed again by another worker once
+their leases expire, so jobs that were being processed when a worker
+stopped are processed again.
+
+Jobs may be processed more than once, so each reply a job sends is
+claimed in a ledger before it is sent, and a reply claimed by an earlier
+attempt or another worker is skipped.
+
+The jobs, their leases, the reply ledger and values shared by the
+processes are kept in a store behind the WorkQueue interface. SQLiteQueue
+keeps them in a SQLite file, which processes on one host can share. SQLite
+locking is unreliable on network file systems, so processes on several
+hosts share a RedisQueue instead. Leases are timed by the clock of each
+process, so the clocks of the hosts should be kept in sync.
+"""
+from __future__ import unicode_literals, print_function
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from collections import namedtuple
+
+# The token identifies a single claim of a job. It changes every time the
+# job is claimed, so a worker that lost its lease can't finish the job or
+# claim its replies.
+Job = namedtuple('Job', ['id', 'was_comment', 'attempts', 'token'])
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# Columns added after the first version of the jobs table.
+ADDED_COLUMNS = [('worker', 'TEXT'), ('token', 'TEXT'), ('lease', 'REAL'),
+                 ('priority', 'REAL'), ('available', 'REAL')]
+
+
+def default_worker_id():
+    return "{}-{}".format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+
+    """A queue of jobs identified by inbox item ids, the interface of the
+    stores the jobs are kept in.
+
+    Keyword arguments:
+    max_attempts -- the number of times a job is started before it fails
+    retention -- seconds finished jobs are kept, so that an item that is
+        queued again while they are kept is ignored
+    lease -- seconds a claimed job stays with a worker without heartbeats
+    retry_delay -- seconds before a failed job can be claimed again,
+        doubled with each attempt
+    worker_id -- the name of this worker, the host name and process id
+        by default
+    """
+
+    def __init__(self, max_attempts=3, retention=86400, lease=60,
+                 retry_delay=30, worker_id=None, clock=time.time):
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.worker_id = worker_id or default_worker_id()
+        self.clock = clock
+
+    def put(self, id, was_comment, priority=None):
+        """Queue a job for an inbox item. Jobs with a lower priority value
+        are claimed first, and the time the job is queued is used if no
+        priority is given. Returns False if the item is already queued or
+        was processed recently.
+        """
+        raise NotImplementedError
+
+    def claim(self):
+        """Lease the job with the lowest priority value that is queued and
+        not waiting to be tried again, or whose lease expired, to this
+        worker and return it. Returns None if there is no such job.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self):
+        """Renew the leases of every job held by this worker."""
+        raise NotImplementedError
+
+    def done(self, job):
+        """Mark a job as finished and remove jobs past their retention.
+        Returns False if the job was claimed by another worker after its
+        lease expired.
+        """
+        raise NotImplementedError
+
+    def retry(self, job):
+        """Queue a job that failed again, to be claimed once its retry
+        delay has passed. Returns False and marks the job as failed if it
+        was already started max_attempts times.
+        """
+        raise NotImplementedError
+
+    def counts(self):
+        """Return a dict of the number of jobs in each state."""
+        raise NotImplementedError
+
+    def workers(self):
+        """Return a dict of worker ids and the time of their last
+        heartbeat.
+        """
+        raise NotImplementedError
+
+    def claim_reply(self, job, action, target):
+        """Claim a reply, such as a comment reply or an edit, to a target
+        for a job. Returns False if the reply was claimed by an earlier
+        attempt of the job or by another worker, in which case it must not
+        be sent.
+        """
+        raise NotImplementedError
+
+    def release_reply(self, job, action, target):
+        """Release a claimed reply that couldn't be sent, so that it is sent
+        when the job is tried again.
+        """
+        raise NotImplementedError
+
+    def set_value(self, key, value):
+        """Store a JSON serializable value shared by every process."""
+        raise NotImplementedError
+
+    def get_value(self, key, default=None):
+        """Return a value stored with set_value, or a default."""
+        raise NotImplementedError
+
+    def _retry_delay(self, job):
+        return self.retry_delay * 2 ** max(0, job.attempts - 1)
+
+
+class SQLiteQueue(WorkQueue):
+
+    """A work queue kept in a SQLite file, which can be shared by the
+    processes on one host. The keyword arguments are those of WorkQueue.
+    """
+
+    def __init__(self, path, **kwargs):
+        WorkQueue.__init__(self, **kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        # Wait for other processes to release the database instead of
+        # failing right away.
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         "id TEXT PRIMARY KEY, was_comment INTEGER, "
+                         "state TEXT, attempts INTEGER, enqueued REAL, "
+                         "updated REAL)")
+        columns = [row[1] for row in
+                   self._db.execute("PRAGMA table_info(jobs)")]
+        for name, kind in ADDED_COLUMNS:
+            if name not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN {} {}".format(
+                    name, kind))
+        if 'lease' not in columns:
+            # Jobs that were running before leases existed get an expired
+            # lease, so that they are claimed again.
+            self._db.execute("UPDATE jobs SET lease = 0 WHERE state = ?",
+                             (RUNNING,))
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state "
+                         "ON jobs (state, enqueued)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_priority "
+                         "ON jobs (state, priority)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS replies ("
+                         "job TEXT, action TEXT, target TEXT, sent REAL, "
+                         "PRIMARY KEY (job, action, target))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS workers ("
+                         "id TEXT PRIMARY KEY, seen REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS shared ("
+                         "key TEXT PRIMARY KEY, value TEXT, updated REAL)")
+        self._db.commit()
+
+    def put(self, id, was_comment, priority=None):
+        with self._lock:
+            now = self.clock()
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs (id, was_comment, state, "
+                "attempts, enqueued, updated, priority) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?)",
+                (id, int(bool(was_comment)), QUEUED, now, now,
+                 now if priority is None else priority))
+            self._db.commit()
+            return cursor.rowcount == 1
+
+    def claim(self):
+        with self._lock:
+            now = self.clock()
+            token = uuid.uuid4().hex
+            # Jobs whose worker stopped during their last attempt fail.
+            self._db.execute(
+                "UPDATE jobs SET state = ?, updated = ? WHERE state = ? "
+                "AND lease < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, self.max_attempts))
+            # A single statement, so two workers can't claim the same job.
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, "
+                "worker = ?, token = ?, lease = ?, updated = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE (state = ? AND "
+                "(available IS NULL OR available <= ?)) OR "
+                "(state = ? AND lease < ?) ORDER BY priority, enqueued "
+                "LIMIT 1)",
+                (RUNNING, self.worker_id, token, now + self.lease, now,
+                 QUEUED, now, RUNNING, now))
+            self._db.commit()
+            if cursor.rowcount != 1:
+                return None
+            row = self._db.execute(
+                "SELECT id, was_comment, attempts FROM jobs WHERE token = ?",
+                (token,)).fetchone()
+            return Job(row[0], bool(row[1]), row[2], token)
+
+    def heartbeat(self):
+        with self._lock:
+            now = self.clock()
+            self._db.execute(
+                "UPDATE jobs SET lease = ? WHERE worker = ? AND state = ?",
+                (now + self.lease, self.worker_id, RUNNING))
+            self._db.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)",
+                             (self.worker_id, now))
+            self._db.commit()
+
+    def done(self, job):
+        with self._lock:
+            now = self.clock()
+            finished = self._set_state(job, DONE, now)
+            expired = now - self.retention
+            self._db.execute(
+                "DELETE FROM replies WHERE job IN (SELECT id FROM jobs "
+                "WHERE state IN (?, ?) AND updated < ?)",
+                (DONE, FAILED, expired))
+            self._db.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated < ?",
+                (DONE, FAILED, expired))
+            self._db.commit()
+            return finished
+
+    def retry(self, job):
+        with self._lock:
+            now = self.clock()
+            retry = job.attempts < self.max_attempts
+            if retry:
+                delay = self._retry_delay(job)
+                self._db.execute(
+                    "UPDATE jobs SET state = ?, updated = ?, available = ? "
+                    "WHERE id = ? AND token = ?",
+                    (QUEUED, now, now + delay, job.id, job.token))
+            else:
+                self._set_state(job, FAILED, now)
+            self._db.commit()
+            return retry
+
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def workers(self):
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT id, seen FROM workers").fetchall())
+
+    def claim_reply(self, job, action, target):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO replies VALUES (?, ?, ?, ?)",
+                (job.id, action, target, self.clock()))
+            self._db.commit()
+            return cursor.rowcount == 1
+
+    def release_reply(self, job, action, target):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM replies WHERE job = ? AND action = ? AND "
+                "target = ?", (job.id, action, target))
+            self._db.commit()
+
+    def set_value(self, key, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO shared VALUES (?, ?, ?)",
+                             (key, json.dumps(value), self.clock()))
+            self._db.commit()
+
+    def get_value(self, key, default=None):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM shared WHERE key = ?",
+                                   (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def _set_state(self, job, state, now):
+        cursor = self._db.execute(
+            "UPDATE jobs SET state = ?, updated = ? WHERE id = ? AND "
+            "token = ?", (state, now, job.id, job.token))
+        return cursor.rowcount == 1
+
+
+# The Lua scripts of RedisQueue. Each script runs atomically, so two
+# workers can't claim the same job or reply. Jobs are hashes, and the ids
+# of the jobs in each state are kept in a sorted set per state: queued jobs
+# by priority, delayed jobs by the time they can be claimed again, running
+# jobs by the expiry of their lease and finished jobs by the time they
+# finished.
+
+PUT_SCRIPT = """
+local p, id = ARGV[1], ARGV[2]
+if redis.call('EXISTS', p .. 'job:' .. id) == 1 then
+    return 0
+end
+redis.call('HMSET', p .. 'job:' .. id, 'was_comment', ARGV[3],
+           'state', 'queued', 'attempts', 0, 'updated', ARGV[4],
+           'priority', ARGV[5])
+redis.call('ZADD', p .. 'queued', ARGV[5], id)
+return 1
+"""
+
+CLAIM_SCRIPT = """
+local p, now = ARGV[1], ARGV[2]
+-- Jobs whose worker stopped are queued again, or fail if it stopped
+-- during their last attempt.
+local expired = redis.call('ZRANGEBYSCORE', p .. 'running', '-inf',
+                           '(' .. now)
+for _, id in ipairs(expired) do
+    local job = p .. 'job:' .. id
+    redis.call('ZREM', p .. 'running', id)
+    if tonumber(redis.call('HGET', job, 'attempts')) >= tonumber(ARGV[3]) then
+        redis.call('HMSET', job, 'state', 'failed', 'updated', now)
+        redis.call('ZADD', p .. 'failed', now, id)
+    else
+        redis.call('HSET', job, 'state', 'queued')
+        redis.call('ZADD', p .. 'queued', redis.call('HGET', job, 'priority'),
+                   id)
+    end
+end
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', p .. 'delayed', '-inf',
+                               now)) do
+    redis.call('ZREM', p .. 'delayed', id)
+    redis.call('ZADD', p .. 'queued',
+               redis.call('HGET', p .. 'job:' .. id, 'priority'), id)
+end
+local id = redis.call('ZRANGE', p .. 'queued', 0, 0)[1]
+if not id then
+    return nil
+end
+local job = p .. 'job:' .. id
+redis.call('ZREM', p .. 'queued', id)
+local attempts = redis.call('HINCRBY', job, 'attempts', 1)
+redis.call('HMSET', job, 'state', 'running', 'worker', ARGV[4],
+           'token', ARGV[5], 'lease', ARGV[6], 'updated', now)
+redis.call('ZADD', p .. 'running', ARGV[6], id)
+return {id, redis.call('HGET', job, 'was_comment'), attempts}
+"""
+
+HEARTBEAT_SCRIPT = """
+local p = ARGV[1]
+for _, id in ipairs(redis.call('ZRANGE', p .. 'running', 0, -1)) do
+    if redis.call('HGET', p .. 'job:' .. id, 'worker') == ARGV[2] then
+        redis.call('HSET', p .. 'job:' .. id, 'lease', ARGV[3])
+        redis.call('ZADD', p .. 'running', ARGV[3], id)
+    end
+end
+redis.call('HSET', p .. 'workers', ARGV[2], ARGV[4])
+"""
+
+FINISH_SCRIPT = """
+local p, id, state, now = ARGV[1], ARGV[2], ARGV[4], ARGV[5]
+local job = p .. 'job:' .. id
+if redis.call('HGET', job, 'token') ~= ARGV[3] then
+    return 0
+end
+for _, other in ipairs({'queued', 'delayed', 'running'}) do
+    redis.call('ZREM', p .. other, id)
+end
+redis.call('HMSET', job, 'state', state, 'updated', now)
+redis.call('ZADD', p .. state, now, id)
+return 1
+"""
+
+RETRY_SCRIPT = """
+local p, id, now, available = ARGV[1], ARGV[2], ARGV[4], ARGV[5]
+local job = p .. 'job:' .. id
+if redis.call('HGET', job, 'token') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZREM', p .. 'running', id)
+redis.call('HMSET', job, 'state', 'queued', 'updated', now,
+           'available', available)
+redis.call('ZADD', p .. 'delayed', available, id)
+return 1
+"""
+
+PURGE_SCRIPT = """
+local p = ARGV[1]
+for _, state in ipairs({'done', 'failed'}) do
+    local expired = redis.call('ZRANGEBYSCORE', p .. state, '-inf',
+                               '(' .. ARGV[2])
+    for _, id in ipairs(expired) do
+        redis.call('DEL', p .. 'job:' .. id, p .. 'replies:' .. id)
+        redis.call('ZREM', p .. state, id)
+    end
+end
+"""
+
+
+class RedisQueue(WorkQueue):
+
+    """A work queue kept in Redis, which can be shared by processes on
+    several hosts. The keys of the queue start with a prefix, so several
+    queues can be kept in one database. The keyword arguments are those of
+    WorkQueue.
+    """
+
+    def __init__(self, url, prefix='compilebot:', **kwargs):
+        # Imported here so redis is only needed by queues shared between
+        # hosts.
+        import redis
+        WorkQueue.__init__(self, **kwargs)
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis.StrictRedis.from_url(url, decode_responses=True)
+        self._put = self._redis.register_script(PUT_SCRIPT)
+        self._claim = self._redis.register_script(CLAIM_SCRIPT)
+        self._heartbeat = self._redis.register_script(HEARTBEAT_SCRIPT)
+        self._finish = self._redis.register_script(FINISH_SCRIPT)
+        self._retry = self._redis.register_script(RETRY_SCRIPT)
+        self._purge = self._redis.register_script(PURGE_SCRIPT)
+
+    def put(self, id, was_comment, priority=None):
+        now = self.clock()
+        return self._put(args=[
+            self.prefix, id, int(bool(was_comment)), now,
+            now if priority is None else priority]) == 1
+
+    def claim(self):
+        now = self.clock()
+        token = uuid.uuid4().hex
+        row = self._claim(args=[self.prefix, now, self.max_attempts,
+                                self.worker_id, token, now + self.lease])
+        if row is None:
+            return None
+        return Job(row[0], bool(int(row[1])), row[2], token)
+
+    def heartbeat(self):
+        now = self.clock()
+        self._heartbeat(args=[self.prefix, self.worker_id, now + self.lease,
+                              now])
+
+    def done(self, job):
+        now = self.clock()
+        finished = self._finish(args=[self.prefix, job.id, job.token, DONE,
+                                      now]) == 1
+        self._purge(args=[self.prefix, now - self.retention])
+        return finished
+
+    def retry(self, job):
+        now = self.clock()
+        retry = job.attempts < self.max_attempts
+        if retry:
+            self._retry(args=[self.prefix, job.id, job.token, now,
+                              now + self._retry_delay(job)])
+        else:
+            self._finish(args=[self.prefix, job.id, job.token, FAILED, now])
+        return retry
+
+    def counts(self):
+        pipe = self._redis.pipeline()
+        for state in ('queued', 'delayed', RUNNING, DONE, FAILED):
+            pipe.zcard(self.prefix + state)
+        queued, delayed, running, done, failed = pipe.execute()
+        # Jobs waiting to be tried again are queued, as in SQLiteQueue.
+        counts = {QUEUED: queued + delayed, RUNNING: running, DONE: done,
+                  FAILED: failed}
+        return dict((state, n) for state, n in counts.items() if n)
+
+    def workers(self):
+        return dict((id, float(seen)) for id, seen in
+                    self._redis.hgetall(self.prefix + 'workers').items())
+
+    def claim_reply(self, job, action, target):
+        return self._redis.sadd(self._replies_key(job),
+                                json.dumps([action, target])) == 1
+
+    def release_reply(self, job, action, target):
+        self._redis.srem(self._replies_key(job), json.dumps([action, target]))
+
+    def set_value(self, key, value):
+        self._redis.hset(self.prefix + 'shared', key, json.dumps(value))
+
+    def get_value(self, key, default=None):
+        value = self._redis.hget(self.prefix + 'shared', key)
+        return default if value is None else json.loads(value)
+
+    def _replies_key(self, job):
+        return "{}replies:{}".format(self.prefix, job.id)
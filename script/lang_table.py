@@ -1,24 +1,39 @@
 """
 Script that generates a formatted table of supported languages
-for the CompileBot wiki.
+for the CompileBot wiki. The languages are read from the bot's language
+cache file if it is configured and recent, and fetched from ideone
+otherwise.
 """
-import yaml
+import os
+import sys
 import ideone
 
-SETTINGS_FILE = 'compilebot/config.yml'
-with open(SETTINGS_FILE, 'r') as f:
-    SETTINGS = yaml.load(f)
+# The settings and the files they name are relative to the compilebot
+# directory, so the cache file is found the same way the bot finds it.
+os.chdir('compilebot')
+sys.path.insert(0, '.')
+import config
+import languages
 
-i = ideone.Ideone(SETTINGS['ideone_user'], SETTINGS['ideone_pass'])
-languages = i.languages()
-simple_langs = dict((k,v.split('(')[0].strip())
-                    for (k,v) in languages.items())
-lang_shortcuts = SETTINGS['lang_aliases']
+
+def fetch():
+    i = ideone.Ideone(config.I_USERNAME, config.I_PASSWORD)
+    return i.languages()
+
+catalog = languages.LanguageCatalog(
+    fetch,
+    refresh_interval=config.LANGUAGES_REFRESH_INTERVAL,
+    cache_file=config.LANGUAGES_CACHE_FILE)
+catalog.load()
+lang_list = catalog.refresh()
+simple_langs = dict((k, languages.simple_name(v))
+                    for (k, v) in lang_list.items())
+lang_shortcuts = config.CONFIG['lang_aliases']
 
 table = "Language Name | Short Names \n---------|----------\n"
 rows = []
 count = 0
-for num, lang in languages.items():
+for num, lang in lang_list.items():
     shortcuts = ''
     simple_name = simple_langs[num]
     for shortcut, simple in lang_shortcuts.items():